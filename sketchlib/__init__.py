@@ -0,0 +1,53 @@
+"""
+Streaming sketches.
+
+The classes are available from the package itself, for example
+sketchlib.CountMin. Each submodule is only imported the first time one of its
+names is used, so importing the package does not load NumPy, and a program pays
+only for the sketches it uses. The submodules can still be imported directly.
+"""
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "BloomFilter": "bloom_filter",
+    "BlockedBloomFilter": "bloom_filter",
+    "ScalableBloomFilter": "bloom_filter",
+    "CountMin": "count_min",
+    "CuckooFilter": "cuckoo_filter",
+    "CuckooFilterFullError": "cuckoo_filter",
+    "LogDistinctCount": "distinct_count",
+    "F2Estimate": "f2_estimate",
+    "MisraGries": "heavy_hitters",
+    "CountMinCashRegister": "heavy_hitters",
+    "DecayedMisraGries": "heavy_hitters",
+    "DecayedCountMinCashRegister": "heavy_hitters",
+    "MinHash": "minhash",
+    "MinHashMatrix": "minhash",
+    "QuantileSketch": "quantile_sketch",
+    "DDSketch": "quantile_sketch",
+    "RsvSampling": "rsv_sampling",
+    "KeyedCountMin": "keyed",
+    "KeyedLogDistinctCount": "keyed",
+    "KeyedQuantileSketch": "keyed",
+    "Combiner": "combiner",
+    "ShardedSketch": "sharded",
+    "SketchPipeline": "pipeline",
+    "plan": "planner",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module("sketchlib." + module), name)
+    # Later lookups find the name directly and skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,110 @@
+"""
+Command-line tool for streaming large files through a sketch.
+
+Examples:
+
+    python -m sketchlib distinct access.log --field 0
+    python -m sketchlib heavy access.log --regex 'GET (\\S+)' --top 20
+    python -m sketchlib quantile latency.tsv --field 3 --delimiter '\\t' --quantiles 0.5,0.99
+"""
+import sys
+import time
+import pickle
+import argparse
+
+from sketchlib._reading import CHUNK_SIZE, read_chunks, read_chunks_mmap, make_extractor, quantile_values
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.heavy_hitters import MisraGries
+from sketchlib.quantile_sketch import QuantileSketch
+
+
+def build_sketch(args):
+    """ Create the sketch requested on the command line. """
+    if args.sketch == "distinct":
+        return LogDistinctCount(epsilon=args.epsilon, delta=args.delta, seed=args.seed)
+    if args.sketch == "heavy":
+        return MisraGries(phi=args.phi, epsilon=args.epsilon)
+    return QuantileSketch(epsilon=args.epsilon, delta=args.delta, n=args.n, seed=args.seed)
+
+
+def report(sketch, args, out):
+    """ Print the answer of the sketch. """
+    if args.sketch == "distinct":
+        print(sketch.estimator(), file=out)
+    elif args.sketch == "heavy":
+        hitters = sorted(sketch.get_heavy_hitters().items(), key=lambda kv: -kv[1])
+        for token, count in hitters[:args.top]:
+            print("%s\t%d" % (token.decode(errors="replace"), count), file=out)
+    else:
+        for q in args.quantiles:
+            print("%s\t%s" % (q, sketch.query(q)), file=out)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m sketchlib",
+                                     description="Stream large files through a sketch.")
+    parser.add_argument("sketch", choices=["distinct", "heavy", "quantile"],
+                        help="distinct count, heavy hitters or quantiles")
+    parser.add_argument("files", nargs="*", help="input files (default: stdin)")
+    parser.add_argument("--field", type=int, default=None, help="0-based column to extract")
+    parser.add_argument("--delimiter", default=None, help="column delimiter (default: whitespace)")
+    parser.add_argument("--regex", default=None, help="extract the first group (or the match) of a regex")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="bytes per read")
+    parser.add_argument("--mmap", action="store_true", help="memory-map input files")
+    parser.add_argument("--output", default=None, help="write the pickled sketch to this path")
+    parser.add_argument("--epsilon", type=float, default=0.01)
+    parser.add_argument("--delta", type=float, default=0.01)
+    parser.add_argument("--phi", type=float, default=0.01, help="heavy hitter threshold")
+    parser.add_argument("--top", type=int, default=10, help="number of heavy hitters to print")
+    parser.add_argument("--n", type=int, default=10**9, help="quantile values are in [1, n]")
+    parser.add_argument("--quantiles", type=lambda s: [float(q) for q in s.split(",")],
+                        default=[0.5, 0.9, 0.99])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quiet", action="store_true", help="do not print throughput")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, stdin=None, stdout=None, stderr=None):
+    """ Run the command line tool and return its exit code. """
+    args = parse_args(argv)
+    stdin = sys.stdin.buffer if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    stderr = sys.stderr if stderr is None else stderr
+
+    sketch = build_sketch(args)
+    extract = make_extractor(args.field, args.delimiter, args.regex)
+    reader = read_chunks_mmap if args.mmap else read_chunks
+
+    lines = rejected = 0
+    start = time.perf_counter()
+    sources = args.files or [None]
+    for path in sources:
+        f = stdin if path is None else open(path, "rb")
+        try:
+            chunks = read_chunks(f, args.chunk_size) if path is None else reader(f, args.chunk_size)
+            for chunk in chunks:
+                lines += len(chunk)
+                tokens = extract(chunk)
+                if args.sketch == "quantile":
+                    tokens, bad = quantile_values(tokens, args.n)
+                    rejected += bad
+                sketch.insert_many(tokens)
+        finally:
+            if path is not None:
+                f.close()
+    elapsed = time.perf_counter() - start
+
+    report(sketch, args, stdout)
+    if args.output is not None:
+        with open(args.output, "wb") as f:
+            pickle.dump(sketch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    if not args.quiet:
+        rate = lines / elapsed if elapsed > 0 else float("inf")
+        print("%d lines in %.2f s (%.0f lines/s)" % (lines, elapsed, rate), file=stderr)
+        if rejected:
+            print("%d values outside [1, %d] skipped" % (rejected, args.n), file=stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Inserting into any sketch, whether its insert takes a count or not and whether
+it has a batch path or not. Shared by the combiner, the pipeline, the server,
+the planner and parameter sweeps.
+"""
+import inspect
+
+
+def is_weighted(sketch):
+    """ Return True if the insert method of a sketch takes a count (or weight) after the token. """
+    return len(inspect.signature(sketch.insert).parameters) >= 2
+
+
+def takes_counts(method):
+    """ Return True if a batch method accepts a counts argument. """
+    return "counts" in inspect.signature(method).parameters
+
+
+def insert_batch(sketch, tokens, counts):
+    """ Insert a batch through the batch path of a sketch when it has one. """
+    weighted = is_weighted(sketch)
+    insert_many = getattr(sketch, "insert_many", None)
+    if insert_many is not None and (counts is None or takes_counts(insert_many)):
+        if counts is None:
+            insert_many(tokens)
+        else:
+            insert_many(tokens, counts)
+    elif weighted:
+        for token, count in zip(tokens, [1] * len(tokens) if counts is None else counts):
+            sketch.insert(token, count)
+    else:
+        for token in tokens:
+            sketch.insert(token)
@@ -0,0 +1,86 @@
+"""
+Reading the lines of large files and extracting tokens from them, shared by the
+command-line tool (sketchlib.__main__) and parameter sweeps (sketchlib.sweep).
+"""
+import re
+import mmap
+
+# Default size of a single read
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """ Read a binary file in large chunks and yield lists of complete lines. """
+    tail = b""
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        yield lines
+    if tail:
+        yield [tail]
+
+
+def read_chunks_mmap(f, chunk_size=CHUNK_SIZE):
+    """ Same as read_chunks, but maps the file in memory instead of reading it
+        through a buffer. Each chunk is still copied once, from the map into the
+        lines it is split into. """
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty files cannot be mapped
+        return
+    with mm:
+        start, size = 0, len(mm)
+        while start < size:
+            end = mm.find(b"\n", min(start + chunk_size, size))
+            end = size if end == -1 else end + 1
+            lines = mm[start:end].split(b"\n")
+            if not lines[-1]:
+                lines.pop()
+            yield lines
+            start = end
+
+
+def make_extractor(field=None, delimiter=None, regex=None):
+    """ Return a function that maps a list of lines to the list of extracted fields.
+        Lines without the requested field are dropped, including lines where the
+        regex matches but its group does not take part in the match. """
+    if regex is not None:
+        pattern = re.compile(regex.encode())
+        group = 1 if pattern.groups else 0
+
+        def extract(lines):
+            matches = map(pattern.search, lines)
+            tokens = (m.group(group) for m in matches if m is not None)
+            return [token for token in tokens if token is not None]
+        return extract
+
+    if field is None:
+        return lambda lines: [line.rstrip(b"\r") for line in lines if line]
+
+    sep = None if delimiter is None else delimiter.encode().decode("unicode_escape").encode()
+
+    def extract(lines):
+        out = []
+        for line in lines:
+            parts = line.split(sep)
+            if len(parts) > field:
+                out.append(parts[field].strip())
+        return out
+    return extract
+
+
+def quantile_values(tokens, n):
+    """ Convert fields to integers in [1, n]; return the values and the number of rejects. """
+    values = []
+    for token in tokens:
+        try:
+            x = int(float(token))
+        except ValueError:
+            continue
+        if 1 <= x <= n:
+            values.append(x)
+    return values, len(tokens) - len(values)
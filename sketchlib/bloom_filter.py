@@ -1,74 +1,441 @@
-import mmh3
 import math
 import numpy as np
+from sketchlib.hashing import get_hash_family, fastrange, fastrange_many, fastrange_fold
+from sketchlib.checkpoint import CheckpointMixin
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin
 
-class BloomFilter:
+class BloomFilter(CheckpointMixin, MemoryMixin):
     """ Implements a Bloom Filter for approximate set membership queries. """
 
-    # Class-level constant for 128-bit maximum integer
-    _max_128_int = pow(2, 128) - 1
+    _checkpoint_array = "_B"
 
-    def __init__(self, n=10000, delta=0.01, seed=42):
+    def __init__(self, n=10000, delta=0.01, seed=42, hash_family=None):
         """ 
         Initialize a Bloom Filter.
         n: Maximum number of elements to be inserted.
         delta: Desired false positive rate.
         seed: Seed for hash functions.
+        hash_family: Hash family (see sketchlib.hashing), default is MurmurHash.
         """
         self._n = n
         self._delta = delta
         self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
 
         # Calculate size of the bit array (m) and the number of hash functions (k)
         self._m = math.ceil(n * math.log2(1 / delta) / math.log(2))
         self._k = math.ceil(math.log(1 / delta))
         
-        # Initialize bit array
-        self._B = np.zeros(self._m, dtype=int)
-        self._m_minus_one = self._m - 1
+        # The counter array is allocated by the first write (see _counters)
+        self._B = None
         
         # Initialize seeds for hash functions
         self._seeds = np.arange(self._k) * seed
 
+    def _counters(self):
+        """ Return the counter array, allocating it on first use. """
+        if self._B is None:
+            self._B = np.zeros(self._m, dtype=int)
+            self._mark_resized()
+        return self._B
+
+    def expected_false_positive_rate(self):
+        """ Return the expected false positive rate once n elements are inserted. """
+        return (1 - math.exp(-self._k * self._n / self._m)) ** self._k
+
     def _hash(self, token, seed):
         """ 
         Compute the hash of a token using the given seed.
         Maps the hash value to an index in the bit array.
         """
-        x = mmh3.hash128(token, seed, signed=False) / BloomFilter._max_128_int
-        return int(x * self._m_minus_one)
+        return fastrange(self._hash_family.hash(token, seed), self._m)
 
     def delete(self, x):
         """ Delete an element from the Bloom filter. """
-        self._B[[self._hash(x, seed) for seed in self._seeds]] -= 1
+        indices = [self._hash(x, seed) for seed in self._seeds]
+        self._counters()[indices] -= 1
+        self._mark_dirty(indices)
+
+    def insert(self, x):
+        """ Insert an element into the Bloom filter. """
+        indices = [self._hash(x, seed) for seed in self._seeds]
+        self._counters()[indices] += 1
+        self._mark_dirty(indices)
+
+    def membership(self, x):
+        """ 
+        Check if an element is likely to be in the set.
+        Note: There can be false positives.
+        """
+        return self._B is not None and all(self._B[self._hash(x, seed)] != 0 for seed in self._seeds)
+
+    def _indices_many(self, digests):
+        """ Return the (k, N) array of indices of a batch of digests, one row per seed. """
+        hashes = self._hash_family.mix_many(digests[None, :], self._seeds[:, None])
+        return fastrange_many(hashes, self._m)
+
+    def insert_many(self, keys, chunk_size=65536):
+        """
+        Insert a batch of elements. NumPy integer arrays (including uint64 arrays
+        of pre-computed hash values) are used as digests without a Python loop.
+        """
+        digests = self._hash_family.digest_many(keys)
+        if len(digests):
+            self._counters()
+        for start in range(0, len(digests), chunk_size):
+            indices = np.sort(self._indices_many(digests[start:start + chunk_size]), axis=0)
+            # Like insert, a counter is incremented once even if several seeds of a key hit it
+            first = np.ones(indices.shape, dtype=bool)
+            first[1:] = indices[1:] != indices[:-1]
+            np.add.at(self._B, indices[first], 1)
+            self._mark_dirty(indices[first])
+
+    def contains_many(self, keys, chunk_size=65536):
+        """
+        Check a batch of elements. Returns a boolean array. Each chunk of keys is
+        tested with a single gather of its k x N counters and a reduction.
+        """
+        digests = self._hash_family.digest_many(keys)
+        if self._B is None:
+            return np.zeros(len(digests), dtype=bool)
+        result = np.empty(len(digests), dtype=bool)
+        for start in range(0, len(digests), chunk_size):
+            indices = self._indices_many(digests[start:start + chunk_size])
+            result[start:start + chunk_size] = np.all(self._B[indices] != 0, axis=0)
+        return result
+
+    def merge(self, S):
+        """ Merge this Bloom filter with another one. If one of them was folded (see
+        fold), the larger one is folded to the size of the other first. """
+        small, large = sorted((self._m, S._m))
+        if (large % small != 0 or not np.array_equal(self._seeds, S._seeds)
+                or self._hash_family != S._hash_family):
+            raise ValueError("Bloom filters must have the same delta, seed and hash family, "
+                             "and sizes that are multiples of each other.")
+        counters = S._B
+        if S._m < self._m:
+            self.fold(self._m // S._m)
+        elif S._m > self._m and counters is not None:
+            counters = fastrange_fold(counters, S._m // self._m)
+        if counters is not None:
+            self._counters()
+            self._B += counters
+        self._mark_dirty()
+
+    def __add__(self, S):
+        """ Return a new Bloom filter that is a merge of self and S. """
+        merged_filter = self.from_existing(self)
+        merged_filter.merge(self)
+        merged_filter.merge(S)
+        return merged_filter
+
+    def fold(self, factor):
+        """
+        Shrink the filter to m // factor counters by summing groups of factor
+        consecutive counters. The folded filter is the filter of that size that
+        would have seen the same elements, with a higher false positive rate.
+        Deleting an element inserted before the fold may leave some counts
+        behind, which can only cause false positives. m must be a multiple of factor.
+        """
+        if self._m % factor != 0:
+            raise ValueError("Cannot fold %d counters by %s." % (self._m, factor))
+        if self._B is not None:
+            self._B = fastrange_fold(self._B, factor)
+        self._m //= factor
+        self._mark_resized()
+
+    def get_filter(self):
+        """ Return the current state of the filter. Before the first write, this
+        is a new array of zeros and the filter stays unallocated. """
+        return np.zeros(self._m, dtype=int) if self._B is None else self._B
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create a new Bloom filter based on the parameters of an existing one,
+        folded like it. """
+        new_filter = cls(n=original._n, delta=original._delta, seed=original._seed,
+                         hash_family=original._hash_family)
+        if new_filter._m != original._m:
+            new_filter.fold(new_filter._m // original._m)
+        return new_filter
+
+# --------------------------------------------------------------------------
+
+class BlockedBloomFilter(VersionedMixin, MemoryMixin):
+    """ 
+    Implements a cache-line blocked Bloom Filter (Putze et al. 2007). Each key
+    selects one 64-byte block and all of its k bits are set or tested inside
+    that block, so an operation touches a single cache line, and all hash
+    values of a key are derived from a single digest.
+    """
+
+    # Number of bytes and bits of a block
+    _block_bytes = 64
+    _block_bits = 512
+
+    def __init__(self, n=10000, delta=0.01, seed=42, hash_family=None):
+        """ 
+        Initialize a blocked Bloom Filter.
+        n: Maximum number of elements to be inserted.
+        delta: Desired false positive rate.
+        seed: Seed for hash functions.
+        hash_family: Hash family (see sketchlib.hashing), default is MurmurHash.
+        """
+        self._n = n
+        self._delta = delta
+        self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
+        self._k = math.ceil(math.log(1 / delta))
+
+        # Start from the size of a standard Bloom filter and add blocks until the
+        # expected false positive rate, which is higher because some blocks are
+        # more loaded than others, is at most delta.
+        self._num_blocks = self._blocks_for(n, delta)
+        self._m = self._num_blocks * self._block_bits
+
+        # Initialize bit array, one row of 64 bytes per block
+        self._B = np.zeros((self._num_blocks, self._block_bytes), dtype=np.uint8)
+
+        # One seed for the block and one per 4 bit positions
+        self._seeds = [seed + i for i in range(1 + math.ceil(self._k / 4))]
+
+    @classmethod
+    def _blocks_for(cls, n, delta):
+        """ Number of blocks needed for a false positive rate of at most delta with n keys. """
+        k = math.ceil(math.log(1 / delta))
+        m = math.ceil(n * math.log2(1 / delta) / math.log(2))
+        num_blocks = math.ceil(m / cls._block_bits)
+        while cls._fpr(n, k, num_blocks) > delta:
+            num_blocks = math.ceil(num_blocks * 1.05)
+        return num_blocks
+
+    def _expected_fpr(self, num_blocks):
+        """ Expected false positive rate with n keys in num_blocks blocks. """
+        return self._fpr(self._n, self._k, num_blocks)
+
+    @classmethod
+    def _fpr(cls, n, k, num_blocks):
+        """ 
+        Expected false positive rate of n keys in num_blocks blocks with k bits
+        per key. The number of keys in a block is Poisson distributed with mean
+        n / num_blocks.
+        """
+        load = n / num_blocks
+        p_bit = 1 - 1 / cls._block_bits
+        p = math.exp(-load)
+        fpr = 0.0
+        for j in range(int(load + 12 * math.sqrt(load) + 20)):
+            if j > 0:
+                p *= load / j
+            fpr += p * (1 - p_bit ** (j * k)) ** k
+        return fpr
+
+    def expected_false_positive_rate(self):
+        """ Return the expected false positive rate once n elements are inserted. """
+        return self._expected_fpr(self._num_blocks)
+
+    def _locate(self, token):
+        """ 
+        Return the block of a token and the (byte, bit mask) pairs of its k bits.
+        The block comes from the first hash value, and the bit positions are the
+        low 9 bits of each 16-bit chunk of the following ones (4 per hash value).
+        """
+        family = self._hash_family
+        block = fastrange(family.hash(token, self._seeds[0]), self._num_blocks)
+        bits = []
+        for i in range(self._k):
+            if i % 4 == 0:
+                h = family.hash(token, self._seeds[1 + i // 4])
+            p = (h >> (16 * (i % 4))) & 511
+            bits.append((p >> 3, 1 << (p & 7)))
+        return block, bits
+
+    def _locate_many(self, keys):
+        """ 
+        Vectorized _locate. Returns the indices of the k bytes of each key in the
+        flattened bit array and their bit masks, both as (N, k) arrays.
+        """
+        family = self._hash_family
+        digests = family.digest_many(keys)
+        blocks = fastrange_many(family.mix_many(digests, self._seeds[0]), self._num_blocks)
+
+        # The 16-bit chunks of a hash value, lowest first
+        chunks = [np.asarray(family.mix_many(digests, seed), dtype="<u8").view("<u2").reshape(-1, 4)
+                  for seed in self._seeds[1:]]
+        positions = np.hstack(chunks)[:, :self._k] & np.uint16(511)
+        offsets = blocks[:, None] * self._block_bytes + (positions >> np.uint16(3))
+        masks = np.left_shift(np.uint8(1), (positions & np.uint16(7)).astype(np.uint8))
+        return offsets, masks
 
     def insert(self, x):
         """ Insert an element into the Bloom filter. """
-        self._B[[self._hash(x, seed) for seed in self._seeds]] += 1
+        self._bump_version()
+        block, bits = self._locate(x)
+        row = self._B[block]
+        for byte, mask in bits:
+            row[byte] |= mask
 
     def membership(self, x):
         """ 
         Check if an element is likely to be in the set.
         Note: There can be false positives.
         """
-        return all(self._B[self._hash(x, seed)] != 0 for seed in self._seeds)
+        block, bits = self._locate(x)
+        row = self._B[block].tobytes()
+        return all(row[byte] & mask for byte, mask in bits)
+
+    def insert_many(self, keys):
+        """ Insert a batch of elements. Integer arrays are hashed without a Python loop. """
+        self._bump_version()
+        offsets, masks = self._locate_many(keys)
+        np.bitwise_or.at(self._B.reshape(-1), offsets, masks)
+
+    def contains_many(self, keys, chunk_size=65536):
+        """ 
+        Check a batch of elements. Returns a boolean array. The k bytes of a key
+        are gathered one after the other, so they share one cache miss.
+        """
+        offsets, masks = self._locate_many(keys)
+        flat = self._B.reshape(-1)
+        result = np.empty(len(offsets), dtype=bool)
+        for start in range(0, len(offsets), chunk_size):
+            end = start + chunk_size
+            result[start:end] = np.all(flat[offsets[start:end]] & masks[start:end], axis=1)
+        return result
 
     def merge(self, S):
         """ Merge this Bloom filter with another one. """
-        self._B += S._B
+        if (self._num_blocks != S._num_blocks or self._k != S._k or self._seeds != S._seeds
+                or self._hash_family != S._hash_family):
+            raise ValueError("Blocked Bloom filters must have the same number of blocks, "
+                             "number of hash functions, seed and hash family.")
+        self._bump_version()
+        self._B |= S._B
 
     def __add__(self, S):
         """ Return a new Bloom filter that is a merge of self and S. """
         merged_filter = self.from_existing(self)
-        merged_filter._B += self._B
-        merged_filter._B += S._B
+        merged_filter.merge(self)
+        merged_filter.merge(S)
         return merged_filter
 
     def get_filter(self):
-        """ Return the current state of the filter. """
+        """ Return the current state of the filter, one row of 64 bytes per block. """
         return self._B
 
     @classmethod
     def from_existing(cls, original):
         """ Create a new Bloom filter based on the parameters of an existing one. """
-        return cls(n=original._n, delta=original._delta, seed=original._seed)
+        return cls(n=original._n, delta=original._delta, seed=original._seed,
+                   hash_family=original._hash_family)
+
+# --------------------------------------------------------------------------
+
+class ScalableBloomFilter(VersionedMixin, MemoryMixin):
+    """ 
+    Implements a Scalable Bloom Filter (Almeida et al. 2007) that grows with the
+    number of inserted elements. It starts with a single Bloom filter and, whenever
+    the newest filter reaches its capacity, adds a filter that is growth times larger
+    and has a ratio times tighter false positive rate. The false positive rates form
+    a geometric series, so the overall rate stays below delta.
+    """
+
+    def __init__(self, n=1000, delta=0.01, growth=2, ratio=0.5, seed=42, hash_family=None):
+        """ 
+        Initialize a Scalable Bloom Filter.
+        n: Capacity of the first filter.
+        delta: Desired overall false positive rate.
+        growth: Capacity multiplier of each new filter.
+        ratio: False positive rate multiplier of each new filter (between 0 and 1).
+        seed: Seed for hash functions.
+        hash_family: Hash family (see sketchlib.hashing), default is MurmurHash.
+        """
+        self._n = n
+        self._delta = delta
+        self._growth = growth
+        self._ratio = ratio
+        self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
+
+        # Filters from oldest to newest, and the number of elements in each of them
+        self._filters = []
+        self._counts = []
+        self._add_filter()
+
+    def _capacity(self, i):
+        """ Capacity of the i-th filter. """
+        return int(self._n * self._growth ** i)
+
+    def _error_rate(self, i):
+        """ False positive rate of the i-th filter; these add up to at most delta. """
+        return self._delta * (1 - self._ratio) * self._ratio ** i
+
+    def _add_filter(self):
+        """ 
+        Append a new, larger filter with a tighter false positive rate. Since the
+        number of hash functions of a BloomFilter is rounded, its false positive
+        rate can be slightly above the requested one, in which case a smaller
+        rate is requested.
+        """
+        i = len(self._filters)
+        target = delta = self._error_rate(i)
+        while True:
+            f = BloomFilter(n=self._capacity(i), delta=delta, seed=self._seed + i,
+                            hash_family=self._hash_family)
+            if f.expected_false_positive_rate() <= target:
+                break
+            delta *= 0.9
+        self._filters.append(f)
+        self._counts.append(0)
+
+    def insert(self, x):
+        """ Insert an element into the newest filter, adding a filter if it is full. """
+        if self.membership(x):
+            return
+        self._bump_version()
+        if self._counts[-1] >= self._capacity(len(self._filters) - 1):
+            self._add_filter()
+        self._filters[-1].insert(x)
+        self._counts[-1] += 1
+
+    def membership(self, x):
+        """ 
+        Check if an element is likely to be in the set, from the newest filter
+        to the oldest. Note: There can be false positives.
+        """
+        return any(f.membership(x) for f in reversed(self._filters))
+
+    def __len__(self):
+        """ Return the number of elements inserted (duplicates are not counted). """
+        return sum(self._counts)
+
+    def merge(self, S):
+        """ 
+        Merge this filter with another one created with the same parameters. The
+        filters of the same size are merged, so if both filters have elements at
+        a given size, that filter may go above its capacity.
+        """
+        if ((self._n, self._delta, self._growth, self._ratio, self._seed, self._hash_family)
+                != (S._n, S._delta, S._growth, S._ratio, S._seed, S._hash_family)):
+            raise ValueError("Scalable Bloom filters must have the same n, delta, growth, ratio, "
+                             "seed and hash family.")
+        self._bump_version()
+        for i, (f, count) in enumerate(zip(S._filters, S._counts)):
+            if i == len(self._filters):
+                self._add_filter()
+            self._filters[i].merge(f)
+            self._counts[i] += count
+
+    def __add__(self, S):
+        """ Return a new filter that is a merge of self and S. """
+        merged_filter = self.from_existing(self)
+        merged_filter.merge(self)
+        merged_filter.merge(S)
+        return merged_filter
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create a new filter based on the parameters of an existing one. """
+        return cls(n=original._n, delta=original._delta, growth=original._growth,
+                   ratio=original._ratio, seed=original._seed, hash_family=original._hash_family)
@@ -0,0 +1,166 @@
+"""
+Incremental checkpoints of large sketch tables.
+
+A sketch with the CheckpointMixin tracks which blocks of its table changed
+since its last checkpoint. The first checkpoint to a path writes the whole
+sketch (the base); later checkpoints append only the changed blocks (deltas).
+restore replays the base and the deltas. The log is compacted into a new base
+once it holds compact_every deltas or more delta bytes than the base itself.
+
+A log is a sequence of records, each made of an 8-byte length followed by a
+pickled payload. Records are appended and flushed to disk one at a time, so an
+interrupted checkpoint leaves at most one incomplete record at the end of the
+log, which restore ignores and truncates.
+"""
+import os
+import pickle
+import struct
+import numpy as np
+from sketchlib.versioning import VersionedMixin
+
+# Number of table cells per block (one 4KB page of int64 values)
+BLOCK_SIZE = 512
+
+_LENGTH = struct.Struct("<Q")
+
+
+def _write_record(f, payload):
+    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    f.write(_LENGTH.pack(len(data)))
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+    return _LENGTH.size + len(data)
+
+
+def _read_records(f):
+    """ Yield the payloads of a log and the offset where each one ends, stopping
+    at an incomplete record. """
+    while True:
+        header = f.read(_LENGTH.size)
+        if len(header) < _LENGTH.size:
+            return
+        length = _LENGTH.unpack(header)[0]
+        data = f.read(length)
+        if len(data) < length:
+            return
+        yield pickle.loads(data), f.tell()
+
+
+class CheckpointMixin(VersionedMixin):
+    """
+    Adds checkpoint and restore to a sketch whose state is a single NumPy array,
+    named by _checkpoint_array. Methods that write to the array call _mark_dirty
+    with the flat indices of the cells they change, or without arguments when
+    they may change any cell. Tracking starts with the first checkpoint. Every
+    call also bumps the mutation version of the sketch (see sketchlib.versioning).
+    """
+
+    _checkpoint_array = "_table"
+    _dirty = None
+
+    def _mark_dirty(self, indices=None):
+        """ Mark the blocks of the given flat indices (default: all) as changed. """
+        self._bump_version()
+        if self._dirty is None:
+            return
+        if indices is None:
+            self._dirty[:] = True
+        elif isinstance(indices, int):
+            self._dirty[indices // BLOCK_SIZE] = True
+        else:
+            self._dirty[np.asarray(indices).reshape(-1) // BLOCK_SIZE] = True
+
+    def _mark_resized(self):
+        """ Stop tracking changed blocks after the array changed shape, so that the
+        next checkpoint writes a new base. """
+        self._bump_version()
+        self._dirty = None
+
+    def _flat_array(self):
+        return getattr(self, self._checkpoint_array).reshape(-1)
+
+    def _block_cells(self, blocks, size):
+        """ Return the flat indices of the cells of the given blocks. """
+        cells = (blocks[:, None] * BLOCK_SIZE + np.arange(BLOCK_SIZE)).reshape(-1)
+        return cells[cells < size]
+
+    def _state(self):
+        """ Return the attributes to save in a base record, without the checkpoint
+        bookkeeping and the cached query results. """
+        state = self.__dict__.copy()
+        for name in ("_dirty", "_checkpoint_path", "_checkpoint_deltas", "_checkpoint_base_bytes",
+                     "_checkpoint_delta_bytes", "_query_cache"):
+            state.pop(name, None)
+        return state
+
+    # Copies and pickles of a sketch do not continue its checkpoint log
+    __getstate__ = _state
+
+    def _write_base(self, path):
+        """ Write a new log that only holds a base record, replacing path atomically. """
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            size = _write_record(f, {"kind": "base", "class": type(self), "state": self._state()})
+        os.replace(tmp, path)
+        self._start_tracking(path, size)
+        return size
+
+    def _start_tracking(self, path, base_bytes, deltas=0, delta_bytes=0):
+        self._checkpoint_path = path
+        self._checkpoint_base_bytes = base_bytes
+        self._checkpoint_deltas = deltas
+        self._checkpoint_delta_bytes = delta_bytes
+        # A sparse sketch (see sketchlib.sparse) has no array yet and writes a base every time
+        if getattr(self, self._checkpoint_array) is None:
+            self._dirty = None
+        else:
+            self._dirty = np.zeros(-(-self._flat_array().size // BLOCK_SIZE), dtype=bool)
+
+    def checkpoint(self, path, compact_every=16):
+        """
+        Save the sketch to the log at path and return the number of bytes written.
+        Only the blocks changed since the previous checkpoint to the same path
+        are appended, unless the log is due for compaction.
+        """
+        path = os.fspath(path)
+        # Replaying more delta bytes than a fresh base is not worth it
+        if (self._dirty is None or getattr(self, "_checkpoint_path", None) != path
+                or not os.path.exists(path) or self._checkpoint_deltas >= compact_every
+                or self._checkpoint_delta_bytes > self._checkpoint_base_bytes):
+            return self._write_base(path)
+
+        blocks = np.flatnonzero(self._dirty)
+        flat = self._flat_array()
+        values = flat[self._block_cells(blocks, flat.size)]
+        with open(path, "ab") as f:
+            size = _write_record(f, {"kind": "delta", "blocks": blocks, "values": values})
+        self._dirty[:] = False
+        self._checkpoint_deltas += 1
+        self._checkpoint_delta_bytes += size
+        return size
+
+    @classmethod
+    def restore(cls, path):
+        """ Rebuild a sketch from the log at path: its base and all complete deltas. """
+        path = os.fspath(path)
+        with open(path, "rb") as f:
+            records = _read_records(f)
+            base, base_bytes = next(records, (None, 0))
+            if base is None or base["kind"] != "base":
+                raise ValueError("%s is not a checkpoint log." % path)
+            if not issubclass(base["class"], cls):
+                raise TypeError("%s holds a %s, not a %s." % (path, base["class"].__name__, cls.__name__))
+            sketch = base["class"].__new__(base["class"])
+            sketch.__dict__.update(base["state"])
+            deltas, end = 0, base_bytes
+            for record, end in records:
+                flat = sketch._flat_array()
+                flat[sketch._block_cells(record["blocks"], flat.size)] = record["values"]
+                deltas += 1
+
+        # Drop an incomplete last record and continue appending to the same log
+        if os.path.getsize(path) > end:
+            os.truncate(path, end)
+        sketch._start_tracking(path, base_bytes, deltas, end - base_bytes)
+        return sketch
@@ -0,0 +1,234 @@
+"""
+Columnar ingestion: hash whole columns of values straight from their buffers.
+
+digest_column computes the same 64-bit digests as sketchlib.hashing.digest,
+but reads the values from the memory of a column instead of creating one
+Python object per value. It accepts:
+
+- Arrow string, binary and dictionary arrays (an offsets buffer plus a data
+  buffer) and chunked arrays. Null values are skipped.
+- NumPy fixed-width bytes ("S") and unicode ("U") arrays.
+- NumPy and Arrow integer columns, whose values are their own digests.
+
+Strings and bytes are hashed with a vectorized MurmurHash3 (x64, 128-bit),
+which gives the same value as the mmh3 package. Digests can be fed to the batch
+path of any sketch, because the digest of an integer key is the key itself:
+sketch.insert_many(digest_column(column)) is equivalent to inserting the values
+one by one. insert_column does this for any sketch.
+
+pyarrow is optional; it is only needed to pass Arrow arrays.
+"""
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+_C1 = np.uint64(0x87c37b91114253d5)
+_C2 = np.uint64(0x4cf5ad432745937f)
+_ALL_ONES = np.uint64(0xffffffffffffffff)
+
+
+def _rotl(x, r):
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+
+def _fmix64(x):
+    x ^= x >> np.uint64(33)
+    x *= np.uint64(0xff51afd7ed558ccd)
+    x ^= x >> np.uint64(33)
+    x *= np.uint64(0xc4ceb9fe1a85ec53)
+    x ^= x >> np.uint64(33)
+    return x
+
+
+def _mix_k1(k1):
+    return _rotl(k1 * _C1, 31) * _C2
+
+
+def _mix_k2(k2):
+    return _rotl(k2 * _C2, 33) * _C1
+
+
+def _words(data):
+    """ View a byte buffer as the little-endian uint64 words starting at every byte offset. """
+    return np.ndarray(shape=(len(data) - 7,), dtype="<u8", buffer=data, strides=(1,))
+
+
+def _low_bytes_mask(num_bytes):
+    """ Masks keeping the num_bytes (0 to 8) low bytes of a word. """
+    shift = (8 * np.minimum(num_bytes, 7)).astype(np.uint64)
+    return np.where(num_bytes >= 8, _ALL_ONES, (np.uint64(1) << shift) - np.uint64(1))
+
+
+def murmur3_many(data, starts, lengths):
+    """
+    Vectorized MurmurHash3_x64_128 with seed 0 of the byte strings
+    data[starts[i]:starts[i] + lengths[i]]. Returns the low 64 bits of each
+    hash, which is mmh3.hash64(value, signed=False)[0].
+    """
+    data = np.ascontiguousarray(data, dtype=np.uint8).reshape(-1)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(starts)
+    h1 = np.zeros(n, dtype=np.uint64)
+    h2 = np.zeros(n, dtype=np.uint64)
+    if n == 0:
+        return h1
+
+    # Pad the buffer so that 16-byte reads past the last value stay in bounds
+    words = _words(np.concatenate([data, np.zeros(16, dtype=np.uint8)]))
+    num_blocks = lengths // 16
+
+    with np.errstate(over="ignore"):
+        # Full 16-byte blocks; rows without a j-th block are left out
+        for j in range(int(num_blocks.max())):
+            rows = np.flatnonzero(num_blocks > j)
+            offsets = starts[rows] + 16 * j
+            k1, k2 = words[offsets], words[offsets + 8]
+            a, b = h1[rows], h2[rows]
+            a ^= _mix_k1(k1)
+            a = _rotl(a, 27) + b
+            a = a * np.uint64(5) + np.uint64(0x52dce729)
+            b ^= _mix_k2(k2)
+            b = _rotl(b, 31) + a
+            b = b * np.uint64(5) + np.uint64(0x38495ab5)
+            h1[rows], h2[rows] = a, b
+
+        # The remaining 0 to 15 bytes, read as zero-padded words. A zero word
+        # leaves the hash unchanged, so empty tails need no special case.
+        tail = starts + 16 * num_blocks
+        remainder = lengths - 16 * num_blocks
+        h2 ^= _mix_k2(words[tail + 8] & _low_bytes_mask(np.maximum(remainder - 8, 0)))
+        h1 ^= _mix_k1(words[tail] & _low_bytes_mask(np.minimum(remainder, 8)))
+
+        # Finalization
+        length = lengths.astype(np.uint64)
+        h1 ^= length
+        h2 ^= length
+        h1 += h2
+        h2 += h1
+        h1 = _fmix64(h1)
+        h2 = _fmix64(h2)
+        h1 += h2
+    return h1
+
+
+def _digest_fixed_width(column):
+    """ Digests of a NumPy "S" or "U" array. Values end before their trailing
+    null bytes (or characters), as when NumPy converts them to bytes or str. """
+    column = np.ascontiguousarray(column).reshape(-1)
+    if len(column) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    lengths = np.char.str_len(column)
+    if column.dtype.kind == "U":
+        codes = column.view(np.uint32).reshape(len(column), -1)
+        if codes.max() < 128:
+            # ASCII text is its own UTF-8 encoding
+            data = codes.astype(np.uint8)
+        else:
+            column = np.char.encode(column, "utf-8")
+            lengths = np.char.str_len(column)
+            data = column.view(np.uint8).reshape(len(column), -1)
+    else:
+        data = column.view(np.uint8).reshape(len(column), -1)
+    starts = np.arange(len(column), dtype=np.int64) * data.shape[1]
+    return murmur3_many(data, starts, lengths)
+
+
+def _valid_arrow(array):
+    """ Boolean mask of the non-null values of an Arrow array, or None if it has no nulls. """
+    if isinstance(array, pa.ChunkedArray):
+        if not array.null_count:
+            return None
+        masks = [_valid_arrow(chunk) for chunk in array.chunks]
+        return np.concatenate([np.ones(len(chunk), dtype=bool) if mask is None else mask
+                               for chunk, mask in zip(array.chunks, masks)])
+    if not array.null_count:
+        return None
+    bitmap = np.frombuffer(array.buffers()[0], dtype=np.uint8)
+    return np.unpackbits(bitmap, bitorder="little")[array.offset:array.offset + len(array)].astype(bool)
+
+
+def _digest_arrow(array):
+    """ Digests of the valid values of an Arrow array. """
+    if isinstance(array, pa.ChunkedArray):
+        chunks = [_digest_arrow(chunk) for chunk in array.chunks]
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint64)
+
+    valid = _valid_arrow(array)
+    if pa.types.is_dictionary(array.type):
+        indices = np.asarray(array.indices.fill_null(0))
+        digests = _digest_arrow(array.dictionary)[indices]
+    elif pa.types.is_integer(array.type):
+        digests = np.asarray(array.fill_null(0)).astype(np.uint64)
+    elif (pa.types.is_string(array.type) or pa.types.is_binary(array.type)
+          or pa.types.is_large_string(array.type) or pa.types.is_large_binary(array.type)):
+        _, offsets, data = array.buffers()
+        large = pa.types.is_large_string(array.type) or pa.types.is_large_binary(array.type)
+        offsets = np.frombuffer(offsets, dtype=np.int64 if large else np.int32)
+        offsets = offsets[array.offset:array.offset + len(array) + 1].astype(np.int64)
+        data = np.zeros(0, dtype=np.uint8) if data is None else np.frombuffer(data, dtype=np.uint8)
+        digests = murmur3_many(data, offsets[:-1], np.diff(offsets))
+    else:
+        raise TypeError("Unsupported Arrow type %s." % array.type)
+    return digests if valid is None else digests[valid]
+
+
+def digest_column(column):
+    """
+    Return the digests of the values of a column as a uint64 array, equal to
+    [sketchlib.hashing.digest(value) for value in column] for non-null values.
+    """
+    if pa is not None and isinstance(column, (pa.Array, pa.ChunkedArray)):
+        return _digest_arrow(column)
+    column = np.asarray(column)
+    if column.dtype.kind in "SU":
+        return _digest_fixed_width(column)
+    if column.dtype.kind in "iu":
+        return column.reshape(-1).astype(np.uint64)
+    raise TypeError("Unsupported column type %s." % column.dtype)
+
+
+def valid_rows(column):
+    """
+    Return a boolean array telling which values of a column are not null, or
+    None if the column has no null values. Only Arrow arrays have nulls.
+    """
+    if pa is not None and isinstance(column, (pa.Array, pa.ChunkedArray)):
+        return _valid_arrow(column)
+    return None
+
+
+def drop_null_counts(column, counts):
+    """
+    Return the counts of the non-null values of a column, so that they line up
+    with digest_column(column). Raises a ValueError if there is not one count
+    per value.
+    """
+    counts = np.asarray(counts)
+    valid = valid_rows(column)
+    if valid is None:
+        return counts
+    if len(counts) != len(valid):
+        raise ValueError("Got %d counts for %d values." % (len(counts), len(valid)))
+    return counts[valid]
+
+
+def insert_column(sketch, column, counts=None):
+    """
+    Insert the values of a column into a sketch. The digests are computed from
+    the column buffers and passed to the batch path of the sketch as integer
+    keys, optionally with counts for weighted sketches (one per value; the
+    counts of null values are dropped with them).
+    """
+    digests = digest_column(column)
+    if counts is not None:
+        counts = drop_null_counts(column, counts)
+        if len(counts) != len(digests):
+            raise ValueError("Got %d counts for %d values." % (len(counts), len(digests)))
+    if counts is None:
+        sketch.insert_many(digests)
+    else:
+        sketch.insert_many(digests, counts)
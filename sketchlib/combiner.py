@@ -0,0 +1,99 @@
+"""
+A pre-aggregating buffer in front of any sketch.
+
+Real streams are skewed: a few keys account for most of the events. A Combiner
+sums the counts of repeated keys in a bounded dictionary and only inserts each
+distinct key once, with its total count, when the dictionary is full or when
+the sketch is read.
+"""
+from sketchlib._inserting import is_weighted, takes_counts
+
+
+class Combiner:
+    """
+    Wraps a sketch and buffers its insertions. For weighted sketches such as
+    CountMin, F2Estimate, QuantileSketch or MisraGries, the counts of a key are
+    summed; for set sketches such as BlockedBloomFilter or LogDistinctCount, whose
+    insert takes a single token, repeated keys are dropped. Sketches with a delete
+    method (the counting BloomFilter, CuckooFilter) count every insertion, so
+    they receive each key as many times as it was inserted.
+
+    Any other attribute is read from the wrapped sketch after flushing the
+    buffer, so a Combiner can be queried like the sketch itself.
+    """
+
+    def __init__(self, sketch, capacity=10000):
+        """
+        sketch: the sketch to feed.
+        capacity: number of distinct keys buffered before a flush.
+        """
+        self._sketch = sketch
+        self._capacity = capacity
+        self._buffer = {}
+        self._weighted = is_weighted(sketch)
+        self._counting = not self._weighted and callable(getattr(sketch, "delete", None))
+        batch = getattr(sketch, "insert_many", None)
+        if batch is not None and self._weighted and not takes_counts(batch):
+            batch = None
+        self._insert_many = batch
+
+    def insert(self, token, count=1):
+        """ Buffer a token with its count. """
+        buffer = self._buffer
+        buffer[token] = buffer.get(token, 0) + count
+        if len(buffer) >= self._capacity:
+            self.flush()
+
+    def insert_many(self, tokens, counts=None):
+        """ Buffer a batch of tokens, optionally with their counts. """
+        if counts is None:
+            for token in tokens:
+                self.insert(token)
+        else:
+            for token, count in zip(tokens, counts):
+                self.insert(token, count)
+
+    def flush(self):
+        """ Insert the buffered keys into the sketch, through its batch path when it has one. """
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, {}
+        sketch = self._sketch
+        if self._counting:
+            # A key inserted twice and deleted once must stay in the sketch
+            tokens = [token for token, count in buffer.items() for _ in range(count)]
+        else:
+            tokens = list(buffer)
+        if self._insert_many is not None:
+            if self._weighted:
+                self._insert_many(tokens, list(buffer.values()))
+            else:
+                self._insert_many(tokens)
+        elif self._weighted:
+            for token, count in buffer.items():
+                sketch.insert(token, count)
+        else:
+            for token in tokens:
+                sketch.insert(token)
+
+    @property
+    def sketch(self):
+        """ Return the wrapped sketch, after flushing the buffer. """
+        self.flush()
+        return self._sketch
+
+    def merge(self, other):
+        """ Merge another sketch, or the sketch of another Combiner, into the wrapped sketch. """
+        if isinstance(other, Combiner):
+            other = other.sketch
+        self.sketch.merge(other)
+
+    def __len__(self):
+        """ Return the number of buffered keys. """
+        return len(self._buffer)
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not found on the Combiner
+        if "_sketch" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.sketch, name)
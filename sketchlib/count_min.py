@@ -1,38 +1,67 @@
 from math import ceil, inf, pow, log
-import mmh3
 import numpy as np
 from copy import deepcopy
+from sketchlib.hashing import get_hash_family, fastrange, fastrange_many, fastrange_fold
+from sketchlib.checkpoint import CheckpointMixin
+from sketchlib.sparse import SparseTableMixin, SPARSE_FILL
+from sketchlib.memory import MemoryMixin
 
-class CountMin:
+class CountMin(SparseTableMixin, CheckpointMixin, MemoryMixin):
     """ Implements a Count-Min Sketch for approximate frequency estimation. """
 
-    # Class-level constant for 128-bit maximum integer
-    _max_128_int = pow(2, 128) - 1
-
-    def __init__(self, width=1, delta=0.05, seed=10):
+    def __init__(self, width=1, delta=0.05, seed=10, hash_family=None, sparse=True):
         """ 
         Initialize a CountMin sketch.
         width: The width of the table.
         delta: Failure probability.
         seed: Seed for hash functions.
+        hash_family: Hash family (see sketchlib.hashing), default is MurmurHash.
+        sparse: Keep the counts of the touched cells in a dict until they fill
+        1/16 of the table, instead of allocating the table at once (see sketchlib.sparse).
         """
         self._delta = delta
         self._width = width
+        self._hash_family = get_hash_family(hash_family)
         self._depth = ceil(log(1 / self._delta))
         
-        # Initialize the count table
-        self._table = np.zeros((self._depth, self._width), dtype=int)
+        # Initialize the count table, or the counts of the touched cells by flat index
+        self._init_sparse(sparse, int(self._depth * self._width * SPARSE_FILL))
         
         # Initialize hash seeds for each depth layer
         self._hash_seeds = np.arange(self._depth) * seed
 
+    def _empty_table(self):
+        return np.zeros((self._depth, self._width), dtype=int)
+
+    def _table_from_sparse(self):
+        table = self._empty_table()
+        if self._sparse:
+            cells = np.fromiter(self._sparse.keys(), dtype=np.intp, count=len(self._sparse))
+            table.reshape(-1)[cells] = np.fromiter(self._sparse.values(), dtype=int, count=len(self._sparse))
+        return table
+
+    def _add_sparse(self, cells, counts):
+        """ Add counts to the cells with the given flat indices. """
+        if self._table is not None:
+            np.add.at(self._table.reshape(-1), cells, counts)
+            self._mark_dirty(cells)
+            return
+        sparse = self._sparse
+        for cell, count in zip(cells, counts):
+            sparse[cell] = sparse.get(cell, 0) + count
+        self._mark_dirty()
+        self._check_fill()
+
     @classmethod
     def from_existing(cls, original_cm):
         """ Create a new CountMin instance based on an existing one. """
         new_cm = deepcopy(original_cm)
         
-        # Reset the table to zeros
-        new_cm._table = np.zeros((new_cm._depth, new_cm._width), dtype=int)
+        # Reset the table to zeros, or the sparse counts to an empty dict
+        if original_cm._table is None:
+            new_cm._sparse = {}
+        else:
+            new_cm._table = np.zeros_like(original_cm._table)
         
         return new_cm
 
@@ -41,24 +70,50 @@ class CountMin:
         Compute the hash of a token using the given seed. 
         Maps the hash value to a bin number.
         """
-        hash_value = mmh3.hash128(token, seed, signed=False) / CountMin._max_128_int
-        bin_number = int(hash_value * self._width)
-        return bin_number
+        return fastrange(self._hash_family.hash(token, seed), self._width)
 
     def insert(self, token, count):
         """ Insert a token with its count into the sketch. """
+        if self._table is None:
+            cells = [row * self._width + self._hash(token, seed) for row, seed in enumerate(self._hash_seeds)]
+            self._add_sparse(cells, [count] * self._depth)
+            return
         for row in range(self._depth):
             col = self._hash(token, self._hash_seeds[row])
             
             # Update the corresponding count in the table
             self._table[row, col] += count
+            self._mark_dirty(row * self._width + col)
+
+    def insert_many(self, tokens, counts=None):
+        """ Insert a batch of tokens, optionally with their counts (default 1). """
+        digests = self._hash_family.digest_many(tokens)
+        hashes = self._hash_family.mix_many(digests[None, :], self._hash_seeds[:, None])
+        cols = fastrange_many(hashes, self._width)
+        counts = 1 if counts is None else np.asarray(counts)
+        rows = np.arange(self._depth)[:, None]
+        if self._table is None:
+            # Sum the counts of each touched cell, then add them to the dict
+            cells, inverse = np.unique(rows * self._width + cols, return_inverse=True)
+            if len(self._sparse) + len(cells) > self._sparse_limit:
+                self._densify()
+            else:
+                sums = np.zeros(len(cells), dtype=int)
+                np.add.at(sums, inverse.reshape(-1), np.broadcast_to(counts, cols.shape).reshape(-1))
+                self._add_sparse(cells.tolist(), sums.tolist())
+                return
+        np.add.at(self._table, (rows, cols), counts)
+        self._mark_dirty(rows * self._width + cols)
 
     def estimate_count(self, token):
         """ 
         Estimate the frequency count of a token.
         The estimate satisfies: true count <= estimate <= true count + phi * total count
         """
-        estimates = np.zeros(self._depth, dtype=int)
+        if self._table is None:
+            return min(self._sparse.get(row * self._width + self._hash(token, seed), 0)
+                       for row, seed in enumerate(self._hash_seeds))
+        estimates = np.zeros(self._depth, dtype=self._table.dtype)
         
         for row in range(self._depth):
             col = self._hash(token, self._hash_seeds[row])
@@ -68,5 +123,53 @@ class CountMin:
         return estimates.min()
 
     def merge(self, other_count_min):
-        """ Merge this CountMin sketch with another one. Both should have the same seeds. """
-        self._table += other_count_min._table
+        """ Merge this CountMin sketch with another one. Both should have the same seeds.
+        If one of them was folded (see fold), the wider one is folded to the width
+        of the other first, so self may become narrower. Sparse and dense sketches
+        can be merged; self becomes dense if other is. """
+        self._check_mergeable(other_count_min)
+        if other_count_min._width < self._width:
+            self.fold(self._width // other_count_min._width)
+        if other_count_min._table is None and other_count_min._width == self._width:
+            self._add_sparse(list(other_count_min._sparse.keys()), list(other_count_min._sparse.values()))
+            return
+        table = other_count_min.get_table()
+        if other_count_min._width > self._width:
+            table = fastrange_fold(table, other_count_min._width // self._width)
+        self._densify()
+        self._table += table
+        self._mark_dirty()
+
+    def _check_mergeable(self, other):
+        """ Raise a ValueError, before anything is folded, if other does not have
+        the same hash functions or a width that is a multiple or a divisor of ours. """
+        narrow, wide = sorted((self._width, other._width))
+        if (wide % narrow != 0 or not np.array_equal(self._hash_seeds, other._hash_seeds)
+                or self._hash_family != other._hash_family):
+            raise ValueError("Sketches must have the same delta, seed and hash family, "
+                             "and widths that are multiples of each other.")
+
+    def fold(self, factor):
+        """
+        Shrink the table by summing groups of factor consecutive columns. The
+        folded sketch is the sketch of width width // factor that would have seen
+        the same stream, so its estimates are those of the narrower sketch. The
+        width must be a multiple of factor.
+        """
+        if self._width % factor != 0:
+            raise ValueError("Cannot fold a width of %d by %s." % (self._width, factor))
+        width = self._width // factor
+        if self._table is None:
+            sparse = {}
+            for cell, count in self._sparse.items():
+                row, col = divmod(cell, self._width)
+                folded = row * width + col // factor
+                sparse[folded] = sparse.get(folded, 0) + count
+            self._sparse = sparse
+        else:
+            self._table = fastrange_fold(self._table, factor)
+        self._width = width
+        self._sparse_limit = int(self._depth * width * SPARSE_FILL)
+        self._mark_resized()
+        if self._table is None:
+            self._check_fill()
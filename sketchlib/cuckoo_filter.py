@@ -0,0 +1,217 @@
+import math
+import random
+import numpy as np
+from copy import deepcopy
+from sketchlib.hashing import get_hash_family, fastrange, fastrange_many
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+class CuckooFilterFullError(RuntimeError):
+    """ Raised when an element cannot be inserted because the filter is full. """
+
+
+class CuckooFilter(VersionedMixin, MemoryMixin):
+    """
+    Implements a Cuckoo Filter (Fan et al. 2014) for approximate set membership
+    with deletions. Each element is stored as a small fingerprint in one of two
+    buckets of 4 slots. An element is found, inserted or deleted with a single
+    hash value and at most two bucket probes.
+    """
+
+    # Number of slots per bucket and target load factor
+    _bucket_size = 4
+    _load_factor = 0.95
+
+    def __init__(self, n=10000, delta=0.01, seed=42, max_kicks=500, hash_family=None):
+        """
+        Initialize a Cuckoo Filter.
+        n: Maximum number of elements to be inserted.
+        delta: Desired false positive rate.
+        seed: Seed for hash functions.
+        max_kicks: Number of relocations tried before an insertion fails.
+        hash_family: Hash family (see sketchlib.hashing), default is MurmurHash.
+        """
+        self._n = n
+        self._delta = delta
+        self._seed = seed
+        self._max_kicks = max_kicks
+        self._hash_family = get_hash_family(hash_family)
+
+        # A lookup compares 2 * bucket_size fingerprints, each matching with
+        # probability 2^-f, so f = log2(2 * bucket_size / delta), within 8 to 16 bits.
+        self._f = min(16, max(8, math.ceil(math.log2(2 * self._bucket_size / delta))))
+        self._fp_mask = (1 << self._f) - 1
+        dtype = np.uint8 if self._f <= 8 else np.uint16
+
+        self._num_buckets = max(1, math.ceil(n / (self._bucket_size * self._load_factor)))
+        self._buckets = np.zeros((self._num_buckets, self._bucket_size), dtype=dtype)
+        self._count = 0
+        self._random = random.Random(seed)
+
+    def _locate(self, token):
+        """
+        Return the first bucket and the fingerprint of a token. The bucket uses
+        the high bits of the hash value and the fingerprint the low bits; 0 marks
+        an empty slot, so it is not a valid fingerprint.
+        """
+        h = self._hash_family.hash(token, self._seed)
+        return fastrange(h, self._num_buckets), (h & self._fp_mask) or 1
+
+    def _alt(self, i, fp):
+        """
+        Return the other bucket of a fingerprint stored in bucket i. The map
+        i -> (g(fp) - i) mod num_buckets is its own inverse.
+        """
+        return (fastrange((fp * _GOLDEN) & _MASK64, self._num_buckets) - i) % self._num_buckets
+
+    def _locate_many(self, keys):
+        """ Vectorized _locate and _alt. Returns the two buckets and the fingerprints. """
+        h = self._hash_family.hash_many(keys, self._seed)
+        i1 = fastrange_many(h, self._num_buckets)
+        fp = (h & np.uint64(self._fp_mask)).astype(self._buckets.dtype)
+        fp[fp == 0] = 1
+        with np.errstate(over="ignore"):
+            g = fastrange_many(fp.astype(np.uint64) * np.uint64(_GOLDEN), self._num_buckets)
+        i2 = (g - i1) % self._num_buckets
+        return i1, i2, fp
+
+    def _place(self, i, fp):
+        """ Store fp in an empty slot of bucket i. Returns False if the bucket is full. """
+        row = self._buckets[i]
+        for j, value in enumerate(row.tolist()):
+            if value == 0:
+                row[j] = fp
+                return True
+        return False
+
+    def _insert_fingerprint(self, i1, fp):
+        """ Insert a fingerprint in bucket i1 or its alternative, relocating others if needed. """
+        self._bump_version()
+        i2 = self._alt(i1, fp)
+        if self._place(i1, fp) or self._place(i2, fp):
+            self._count += 1
+            return
+
+        # Kick out a random fingerprint and move it to its other bucket, and so on.
+        i = self._random.choice((i1, i2))
+        path = []
+        for _ in range(self._max_kicks):
+            j = self._random.randrange(self._bucket_size)
+            old = int(self._buckets[i, j])
+            self._buckets[i, j] = fp
+            path.append((i, j, old))
+            fp = old
+            i = self._alt(i, fp)
+            if self._place(i, fp):
+                self._count += 1
+                return
+
+        # Undo the relocations so that the filter is left unchanged
+        for i, j, old in reversed(path):
+            self._buckets[i, j] = old
+        raise CuckooFilterFullError(
+            "Cuckoo filter is full (%d elements in %d slots)." % (self._count, self._buckets.size))
+
+    def insert(self, x):
+        """ Insert an element. Raises CuckooFilterFullError if the filter is full. """
+        i1, fp = self._locate(x)
+        self._insert_fingerprint(i1, fp)
+
+    def membership(self, x):
+        """
+        Check if an element is likely to be in the set.
+        Note: There can be false positives.
+        """
+        i1, fp = self._locate(x)
+        return fp in self._buckets[i1].tolist() or fp in self._buckets[self._alt(i1, fp)].tolist()
+
+    def delete(self, x):
+        """
+        Delete an element from the filter. Returns False if it was not found.
+        Only elements that were inserted should be deleted, otherwise an element
+        sharing the same fingerprint may be removed.
+        """
+        i1, fp = self._locate(x)
+        for i in (i1, self._alt(i1, fp)):
+            row = self._buckets[i]
+            for j, value in enumerate(row.tolist()):
+                if value == fp:
+                    row[j] = 0
+                    self._count -= 1
+                    self._bump_version()
+                    return True
+        return False
+
+    def insert_many(self, keys):
+        """
+        Insert a batch of elements, hashed at once. Raises CuckooFilterFullError
+        if the filter gets full; the elements before the failing one are inserted.
+        """
+        i1, _, fp = self._locate_many(keys)
+        for i, f in zip(i1.tolist(), fp.tolist()):
+            self._insert_fingerprint(i, f)
+
+    def contains_many(self, keys):
+        """ Check a batch of elements. Returns a boolean array. """
+        i1, i2, fp = self._locate_many(keys)
+        fp = fp[:, None]
+        return np.any(self._buckets[i1] == fp, axis=1) | np.any(self._buckets[i2] == fp, axis=1)
+
+    def delete_many(self, keys):
+        """ Delete a batch of elements. Returns a boolean array telling which were found. """
+        i1, _, fp = self._locate_many(keys)
+        found = np.zeros(len(fp), dtype=bool)
+        for k, (i, f) in enumerate(zip(i1.tolist(), fp.tolist())):
+            for b in (i, self._alt(i, f)):
+                row = self._buckets[b]
+                hits = np.flatnonzero(row == f)
+                if len(hits):
+                    row[hits[0]] = 0
+                    self._count -= 1
+                    self._bump_version()
+                    found[k] = True
+                    break
+        return found
+
+    def __len__(self):
+        """ Return the number of stored fingerprints. """
+        return self._count
+
+    def load_factor(self):
+        """ Return the fraction of occupied slots. """
+        return self._count / self._buckets.size
+
+    def merge(self, S):
+        """
+        Merge another filter with the same parameters into this one by inserting
+        its fingerprints. Raises CuckooFilterFullError if they do not fit, and
+        ValueError if the filters do not have the same number of buckets,
+        fingerprint size, seed and hash family.
+        """
+        if ((self._num_buckets, self._f, self._seed, self._hash_family)
+                != (S._num_buckets, S._f, S._seed, S._hash_family)):
+            raise ValueError("Cuckoo filters must have the same number of buckets, fingerprint size, "
+                             "seed and hash family.")
+        self._bump_version()
+        for i, j in zip(*np.nonzero(S._buckets)):
+            self._insert_fingerprint(int(i), int(S._buckets[i, j]))
+
+    def __add__(self, S):
+        """ Return a new filter that is a merge of self and S. """
+        merged_filter = deepcopy(self)
+        merged_filter.merge(S)
+        return merged_filter
+
+    def get_filter(self):
+        """ Return the bucket array, one row of fingerprints per bucket (0 is empty). """
+        return self._buckets
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create a new Cuckoo filter based on the parameters of an existing one. """
+        return cls(n=original._n, delta=original._delta, seed=original._seed,
+                   max_kicks=original._max_kicks, hash_family=original._hash_family)
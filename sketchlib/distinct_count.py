@@ -1,12 +1,13 @@
 from abc import abstractmethod
-import mmh3
 import math
 from bisect import bisect_left, insort
-import statistics
 from copy import deepcopy
 import numpy as np
+from sketchlib.hashing import get_hash_family
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin, memoized
 
-class AbstractDistinctCount:
+class AbstractDistinctCount(VersionedMixin, MemoryMixin):
     @abstractmethod
     def insert(self, token):
         pass
@@ -37,17 +38,17 @@ class LogDistinctCount(AbstractDistinctCount):
     suggested in Bar-Yossef et al. (2002) to have a faster update time.
     """
 
-    _max_128_int = pow(2, 128) - 1
-
-    def __init__(self, epsilon=0.01, delta=0.01, seed=42):
+    def __init__(self, epsilon=0.01, delta=0.01, seed=42, hash_family=None):
         """
         epsilon: approximation error,
         delta: failure probability,
-        seed: seed for hash function.
+        seed: seed for hash function,
+        hash_family: hash family (see sketchlib.hashing), default is MurmurHash.
         """
         self._epsilon = epsilon
         self._delta = delta
         self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
         self._c = 2
         self._width = self._c * int((1 / self._epsilon) ** 2)
         self._depth = self._c * int(math.log(1 / self._delta, 2))
@@ -61,8 +62,8 @@ class LogDistinctCount(AbstractDistinctCount):
         return i if i != len(a) and a[i] == x else -1
 
     def _hash(self, token, seed):
-        """ Compute hash of the token based on the seed and hash_type. """
-        return mmh3.hash128(token, seed, signed=False) / LogDistinctCount._max_128_int
+        """ Compute hash of the token based on the seed, as a value in [0, 1]. """
+        return self._hash_family.hash(token, seed) / 2**64
 
     def _insert_into_table(self, i, hash_value):
         """ Insert a hash value into the i-th row of the table while maintaining the sorted order. """
@@ -76,15 +77,38 @@ class LogDistinctCount(AbstractDistinctCount):
 
     def insert(self, token):
         """ Insert a token into the sketch. """
+        self._bump_version()
         if len(self._naive_lst) < self._width:
-            self._naive_lst.add(token)
+            # Tokens are kept as digests, so that integer digests of tokens
+            # (see sketchlib.pipeline) count the same as the tokens
+            self._naive_lst.add(self._hash_family.digest(token))
 
         for i, seed in enumerate(self._seeds):
             hash_value = self._hash(token, seed)
             self._insert_into_table(i, hash_value)
 
+    def insert_many(self, tokens, chunk_size=65536):
+        """ Insert a batch of tokens. Repeated tokens are only hashed once, and
+        all rows are hashed at once. The table is the same as after inserting
+        the tokens one by one: each row keeps the smallest width hash values. """
+        self._bump_version()
+        family = self._hash_family
+        digests = np.unique(family.digest_many(tokens))
+        # Like insert, stop once width distinct digests are kept
+        for d in digests.tolist():
+            if len(self._naive_lst) >= self._width:
+                break
+            self._naive_lst.add(d)
+
+        for start in range(0, len(digests), chunk_size):
+            hashes = family.mix_many(digests[None, start:start + chunk_size], self._seeds[:, None]) / 2**64
+            for i in range(self._depth):
+                row = np.unique(np.concatenate([self._table[i], hashes[i]]))
+                self._table[i] = row[:self._width].tolist()
+
     def merge(self, S):
         """ Merge S with self. """
+        self._bump_version()
         self._naive_lst |= S._naive_lst
         self._naive_lst = set(list(self._naive_lst)[:self._width])
 
@@ -92,15 +116,85 @@ class LogDistinctCount(AbstractDistinctCount):
             for x in S._table[i]:
                 self._insert_into_table(i, x)
 
+    @memoized
     def estimator(self):
-        """ Estimate the number of distinct elements in the stream so far. """
+        """ Estimate the number of distinct elements in the stream so far. Cached
+        until the sketch changes. """
         if len(self._naive_lst) < self._width:
             return len(self._naive_lst)
 
-        est = [int(self._width / row[-1]) for row in self._table]
-        return int(statistics.median(est))
+        est = np.floor(self._width / np.array([row[-1] for row in self._table]))
+        return int(np.median(est))
+
+    def _is_exact(self):
+        """ Return True if _naive_lst holds the digests of all the tokens. """
+        return len(self._naive_lst) < self._width
+
+    def _set_counts(self, other):
+        """
+        Return the estimated sizes of the union of the streams of self and other,
+        of their intersection and of the tokens of self that are not in other. If
+        both sketches still hold all their digests, the sizes are exact. Otherwise,
+        the width smallest hash values of the union of two rows are a sample of
+        the union, so the fractions of them that are in both rows and only in the
+        row of self estimate the fractions of the union; the median over the rows
+        is taken.
+        """
+        if (self._width, self._depth, self._seed) != (other._width, other._depth, other._seed) \
+                or self._hash_family != other._hash_family:
+            raise ValueError("Sketches must have the same epsilon, delta, seed and hash family.")
+        if self._is_exact() and other._is_exact():
+            a, b = self._naive_lst, other._naive_lst
+            return len(a | b), len(a & b), len(a - b)
+
+        unions, intersections, differences = [], [], []
+        for row, other_row in zip(self._table, other._table):
+            union, both, only_self = _bottom_k_union(row, other_row, self._width)
+            # The same estimate as estimator() for the merged sketch
+            size = int(self._width / union[-1]) if len(union) >= self._width else len(union)
+            unions.append(size)
+            intersections.append(size * both.mean())
+            differences.append(size * only_self.mean())
+        return np.median(unions), np.median(intersections), np.median(differences)
+
+    def union_count(self, other):
+        """ Estimate the number of distinct tokens in the streams of self or other. """
+        return int(self._set_counts(other)[0])
+
+    def intersection_count(self, other):
+        """ Estimate the number of distinct tokens in the streams of both self and other. """
+        return int(self._set_counts(other)[1])
+
+    def difference_count(self, other):
+        """ Estimate the number of distinct tokens in the stream of self but not of other. """
+        return int(self._set_counts(other)[2])
+
+    def jaccard(self, other):
+        """ Estimate the Jaccard similarity of the sets of tokens of self and other. """
+        union, intersection, _ = self._set_counts(other)
+        return float(intersection / union) if union else 1.0
 
     @classmethod
     def from_existing(cls, original):
         """ Create a new sketch with the same parameters as an existing sketch. """
-        return cls(epsilon=original._epsilon, delta=original._delta, seed=original._seed)
+        return cls(epsilon=original._epsilon, delta=original._delta, seed=original._seed,
+                   hash_family=original._hash_family)
+
+
+def _bottom_k_union(a, b, k):
+    """
+    Merge two sorted rows of distinct hash values. Returns the k smallest values
+    of their union, and boolean arrays telling which of them are in both rows and
+    which are only in a. The stable sort of two sorted runs takes linear time, and
+    a value in both rows ends up next to its copy.
+    """
+    values = np.concatenate([a, b])
+    from_a = np.concatenate([np.ones(len(a), dtype=bool), np.zeros(len(b), dtype=bool)])
+    order = np.argsort(values, kind="stable")
+    values, from_a = values[order], from_a[order]
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    repeated = np.zeros(len(values), dtype=bool)
+    repeated[:-1] = ~first[1:]
+    keep = np.flatnonzero(first)[:k]
+    return values[keep], repeated[keep], from_a[keep] & ~repeated[keep]
@@ -1,53 +1,142 @@
-import mmh3
-import statistics
 import math
 import numpy as np
 from copy import deepcopy
+from sketchlib.hashing import get_hash_family
+from sketchlib.checkpoint import CheckpointMixin
+from sketchlib.sparse import SparseTableMixin, SPARSE_FILL
+from sketchlib.versioning import memoized
+from sketchlib.memory import MemoryMixin
 
-class F2Estimate():
+# Largest number of sign computations (keys times cells) for building the table
+# of a sparse sketch, which becoming dense and get_table do
+_MAX_SPARSE_WORK = 2**24
+
+class F2Estimate(SparseTableMixin, CheckpointMixin, MemoryMixin):
     """ 
     This is the tug-of-war sketch for estimating the second frequency moment of a stream 
     proposed by Alon et al. 2000.
     """
     
-    # Class-level constant for 128-bit maximum integer
-    _max_128_int = pow(2, 128) - 1
-    
-    def __init__(self, epsilon=0.01, delta=0.01, seed=42):
+    def __init__(self, epsilon=0.01, delta=0.01, seed=42, hash_family=None, sparse=True):
         """ 
         Initialize an F2Estimate instance.
         epsilon: relative error,
         delta: failure probability,
-        seed: seed for hash function.
+        seed: seed for hash function,
+        hash_family: hash family (see sketchlib.hashing), default is MurmurHash,
+        sparse: keep the weight of each key in a dict until there are too many
+        keys, instead of allocating the table at once (see sketchlib.sparse).
         """
         
         self._epsilon = epsilon
         self._delta = delta
         self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
         self._c = 3  # Constant multiplier to increase table width and depth
 
         # Calculate the table dimensions
         self._width = self._c * int(1 / (self._epsilon * self._epsilon))
         self._depth = self._c * int(math.log(1 / self._delta, 2))
 
-        # Initialize hash table and seeds
-        self._table = np.zeros((self._depth, self._width), dtype=int)
-        self._seeds = (np.arange(self._depth * self._width) * self._seed).reshape(self._depth, self._width)
+        # Initialize the hash table and its seeds, or the weights of the keys by
+        # digest. The seeds are as large as the table, so they are only
+        # allocated with it. Becoming dense builds the table from the keys, so
+        # the number of keys is also bounded by _MAX_SPARSE_WORK.
+        cells = self._depth * self._width
+        self._seeds = None
+        if not sparse:
+            self._seeds = self._cell_seeds()
+        self._init_sparse(sparse, max(1, min(int(cells * SPARSE_FILL), _MAX_SPARSE_WORK // cells)))
+
+    def _cell_seeds(self):
+        """ Return the seeds of the cells of the table. """
+        if self._seeds is not None:
+            return self._seeds
+        return (np.arange(self._depth * self._width) * self._seed).reshape(self._depth, self._width)
+
+    def _empty_table(self):
+        return np.zeros((self._depth, self._width), dtype=int)
+
+    def _table_from_sparse(self):
+        table = self._empty_table()
+        if self._sparse:
+            digests = np.fromiter(self._sparse.keys(), dtype=np.uint64, count=len(self._sparse))
+            weights = np.fromiter(self._sparse.values(), dtype=int, count=len(self._sparse))
+            self._add_digests(table, self._cell_seeds(), digests, weights)
+        return table
+
+    def _densify(self):
+        if self._table is None:
+            self._seeds = self._cell_seeds()
+        super()._densify()
+
+    def _add_digests(self, table, seeds, digests, counts):
+        """ Add the signs of a batch of digests, times their counts, to a table.
+        The signs of a chunk of digests are computed at once and summed with their counts. """
+        family = self._hash_family
+        chunk_size = max(1, 2**22 // table.size)
+        for start in range(0, len(digests), chunk_size):
+            h = family.mix_many(digests[start:start + chunk_size, None, None], seeds)
+            signs = (h >> np.uint64(63)).astype(np.int64) * 2 - 1
+            update = np.tensordot(counts[start:start + chunk_size], signs, axes=1)
+            np.add(table, update, out=table, casting="unsafe")
 
     def _hash(self, token, seed):
         """ Compute the {-1,+1} hash of a token based on the seed. """
-        x = mmh3.hash128(token, seed, signed=False) / F2Estimate._max_128_int
-        return -1 if x <= 0.5 else 1
+        return 1 if self._hash_family.hash(token, seed) >> 63 else -1
+
+    def _signs(self, token):
+        """ Compute the {-1,+1} hashes of a token for all cells of the table at once. """
+        family = self._hash_family
+        h = family.mix_many(np.uint64(family.digest(token)), self._seeds)
+        return (h >> np.uint64(63)).astype(np.int64) * 2 - 1
 
     def insert(self, x, y):
         """ Insert token x into the stream with weight y. """
-        for i in range(self._depth):
-            for j in range(self._width):
-                self._table[i, j] += self._hash(x, self._seeds[i, j]) * y
+        if self._table is None:
+            d = self._hash_family.digest(x)
+            self._sparse[d] = self._sparse.get(d, 0) + y
+            self._mark_dirty()
+            self._check_fill()
+            return
+        np.add(self._table, self._signs(x) * y, out=self._table, casting="unsafe")
+        self._mark_dirty()
+
+    def insert_many(self, tokens, counts=None):
+        """ Insert a batch of tokens, optionally with their weights (default 1). The
+        signs of a chunk of tokens are computed at once and summed with their weights. """
+        digests = self._hash_family.digest_many(tokens)
+        counts = np.ones(len(digests), dtype=int) if counts is None else np.asarray(counts)
+        if self._table is None:
+            # Sum the weights of each key, then add them to the dict
+            keys, inverse = np.unique(digests, return_inverse=True)
+            if len(self._sparse) + len(keys) > self._sparse_limit:
+                self._densify()
+            else:
+                weights = np.zeros(len(keys), dtype=int)
+                np.add.at(weights, inverse.reshape(-1), counts)
+                for d, weight in zip(keys.tolist(), weights.tolist()):
+                    self._sparse[d] = self._sparse.get(d, 0) + weight
+                self._mark_dirty()
+                return
+        self._add_digests(self._table, self._seeds, digests, counts)
+        self._mark_dirty()
 
     def merge(self, S):
-        """ Merge this F2Estimate instance with another one, S. """
-        self._table += S._table
+        """ Merge this F2Estimate instance with another one, S. Sparse and dense
+        sketches can be merged; self becomes dense if S is. """
+        if S._table is not None:
+            self._densify()
+            self._table += S._table
+        elif self._table is not None:
+            digests = np.fromiter(S._sparse.keys(), dtype=np.uint64, count=len(S._sparse))
+            weights = np.fromiter(S._sparse.values(), dtype=int, count=len(S._sparse))
+            self._add_digests(self._table, self._seeds, digests, weights)
+        else:
+            for d, weight in S._sparse.items():
+                self._sparse[d] = self._sparse.get(d, 0) + weight
+            self._check_fill()
+        self._mark_dirty()
 
     def __add__(self, S):
         """ Return the merged sketch of self and S using Python's addition operator. """
@@ -55,12 +144,55 @@ class F2Estimate():
         merged_sketch.merge(S)
         return merged_sketch
 
+    def _weights(self):
+        """ Return the weights of the keys of a sparse sketch. """
+        return np.fromiter(self._sparse.values(), dtype=float, count=len(self._sparse))
+
+    @memoized
     def estimator(self):
-        """ Return the F2 estimator of the current stream. """
-        avg = [statistics.mean(self._table[i]**2) for i in range(self._depth)]
-        return statistics.median(avg)
+        """ Return the F2 estimator of the current stream: the median over the rows
+        of the mean squared counter. A sparse sketch holds the weight of each key,
+        so its estimate is exact. Cached until the sketch changes. """
+        if self._table is None:
+            return float(np.sum(self._weights() ** 2))
+        avg = np.mean(self._table.astype(float) ** 2, axis=1)
+        return float(np.median(avg))
+
+    def _check_compatible(self, other):
+        """ Raise a ValueError if other does not have the same table and hash functions. """
+        if ((self._depth, self._width, self._seed) != (other._depth, other._width, other._seed)
+                or self._hash_family != other._hash_family):
+            raise ValueError("Sketches must have the same epsilon, delta, seed and hash family.")
+
+    def inner_product(self, other):
+        """ Estimate the inner product sum_x f(x) g(x) of the weights f of this stream
+        and g of the stream of other, a sketch with the same parameters: the median
+        over the rows of the mean product of the counters of both tables. If both
+        sketches are sparse, the inner product over their shared keys is exact. """
+        self._check_compatible(other)
+        if self._table is None and other._table is None:
+            return float(sum(weight * other._sparse.get(d, 0) for d, weight in self._sparse.items()))
+        products = np.einsum("ij,ij->i", self.get_table().astype(float), other.get_table().astype(float))
+        return float(np.median(products / self._width))
+
+    def join_size(self, other):
+        """ Estimate the size of the equi-join of this stream with the stream of other
+        on the tokens, where the weights are the numbers of rows of each token. """
+        return self.inner_product(other)
+
+    def inner_product_error(self, other):
+        """ Return the error bound sqrt(8 / width * F2(self) * F2(other)) of inner_product,
+        from the F2 estimates of both sketches. Each row is within this bound with
+        probability at least 3/4, so the median is within it with a probability that
+        grows exponentially with the depth. The bound is 0 if both sketches are
+        sparse, since inner_product is then exact. """
+        self._check_compatible(other)
+        if self._table is None and other._table is None:
+            return 0.0
+        return math.sqrt(8 / self._width * self.estimator() * other.estimator())
 
     @classmethod
     def from_existing(cls, original):
         """ Create a new F2Estimate instance based on the parameters of an existing one. """
-        return F2Estimate(epsilon=original._epsilon, delta=original._delta, seed=original._seed)
+        return F2Estimate(epsilon=original._epsilon, delta=original._delta, seed=original._seed,
+                          hash_family=original._hash_family, sparse=original._table is None)
@@ -0,0 +1,266 @@
+"""
+Seeded hash families shared by the sketches in this package.
+
+A key is hashed in two steps. It is first reduced to a 64-bit digest that does
+not depend on the seed: integer keys are used as they are, str and bytes keys
+are hashed once with MurmurHash3. The family then mixes the digest with a seed
+into a 64-bit hash value using integer arithmetic only. Both steps work on a
+single key and, vectorized, on NumPy arrays of keys, and both give the same
+result.
+
+Hash values are mapped to a range [0, m) with fastrange / fastrange_many.
+"""
+from functools import lru_cache
+import mmh3
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+_MASK32 = (1 << 32) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+# fastrange uses the high 32 bits of the hash for ranges up to this size
+_MAX_FAST_RANGE = 1 << 32
+
+_U32 = np.uint64(32)
+_U33 = np.uint64(33)
+_C1 = np.uint64(0xff51afd7ed558ccd)
+_C2 = np.uint64(0xc4ceb9fe1a85ec53)
+
+
+def _fmix64(x):
+    """ The 64-bit finalizer of MurmurHash3 on a Python int. """
+    x ^= x >> 33
+    x = (x * 0xff51afd7ed558ccd) & _MASK64
+    x ^= x >> 33
+    x = (x * 0xc4ceb9fe1a85ec53) & _MASK64
+    x ^= x >> 33
+    return x
+
+
+def _fmix64_many(x):
+    """ The 64-bit finalizer of MurmurHash3 on a uint64 array. """
+    with np.errstate(over="ignore"):
+        x = x ^ (x >> _U33)
+        x = x * _C1
+        x = x ^ (x >> _U33)
+        x = x * _C2
+        return x ^ (x >> _U33)
+
+
+@lru_cache(maxsize=4096)
+def _derive(seed, i):
+    """ The i-th 64-bit parameter derived from a seed. """
+    return _fmix64(((seed * 8 + i + 1) * _GOLDEN) & _MASK64)
+
+
+def _derive_many(seeds, i):
+    """ Vectorized _derive for an array of seeds. """
+    seeds = np.asarray(seeds).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return _fmix64_many((seeds * np.uint64(8) + np.uint64(i + 1)) * np.uint64(_GOLDEN))
+
+
+def digest(key):
+    """ Reduce a key to a 64-bit integer that does not depend on the seed.
+    Integer keys are taken modulo 2^64, str keys are encoded as UTF-8 and
+    bytes-like keys are hashed with MurmurHash3.
+    """
+    if isinstance(key, (int, np.integer)):
+        return int(key) & _MASK64
+    if isinstance(key, str):
+        key = key.encode()
+    return mmh3.hash64(key, signed=False)[0]
+
+
+def digest_many(keys):
+    """ Vectorized digest. Integer arrays are converted without a Python loop. """
+    if isinstance(keys, np.ndarray) and keys.dtype.kind in "iu":
+        return keys.astype(np.uint64, copy=False)
+    keys = list(keys)
+    return np.fromiter((digest(key) for key in keys), dtype=np.uint64, count=len(keys))
+
+
+def fastrange(h, m):
+    """ Map a 64-bit hash value to [0, m) without a division. """
+    if m <= _MAX_FAST_RANGE:
+        return ((h >> 32) * m) >> 32
+    return h % m
+
+
+def fastrange_many(h, m):
+    """ Vectorized fastrange. Returns an array of indices. """
+    if m <= _MAX_FAST_RANGE:
+        return (((h >> _U32) * np.uint64(m)) >> _U32).astype(np.intp)
+    return (h % np.uint64(m)).astype(np.intp)
+
+
+def fastrange_fold(values, factor):
+    """
+    Sum groups of factor consecutive values along the last axis of an array
+    indexed by fastrange. The index of a hash value in [0, m // factor) is its
+    index in [0, m) divided by factor, so the result is the array that a range of
+    m // factor would have built. m must be a multiple of factor and at most 2^32.
+    """
+    m = values.shape[-1]
+    if factor < 1 or m % factor != 0:
+        raise ValueError("Cannot fold a range of %d into %s parts." % (m, factor))
+    if m > _MAX_FAST_RANGE:
+        raise ValueError("Cannot fold a range of more than 2^32 values.")
+    return values.reshape(values.shape[:-1] + (m // factor, factor)).sum(axis=-1, dtype=values.dtype)
+
+
+class HashFamily:
+    """ Base class of the seeded hash families. Subclasses implement mix and mix_many. """
+
+    name = None
+
+    def __init__(self):
+        # Digest of the last str or bytes key, so that hashing the same key
+        # with several seeds in a row only runs MurmurHash3 once.
+        self._last = (None, 0)
+
+    def digest(self, key):
+        """ Same as the module level digest, memoizing the last key. """
+        last = self._last
+        if last[0] is key:
+            return last[1]
+        d = digest(key)
+        if isinstance(key, (str, bytes)):
+            self._last = (key, d)
+        return d
+
+    def digest_many(self, keys):
+        """ Same as the module level digest_many. """
+        return digest_many(keys)
+
+    def mix(self, x, seed):
+        """ Mix a 64-bit digest with a seed into a 64-bit hash value. """
+        raise NotImplementedError
+
+    def mix_many(self, x, seeds):
+        """ Vectorized mix. x and seeds are broadcast against each other. """
+        raise NotImplementedError
+
+    def hash(self, key, seed):
+        """ Return the 64-bit hash value of a key. """
+        return self.mix(self.digest(key), int(seed))
+
+    def hash_many(self, keys, seed):
+        """ Return the 64-bit hash values of a batch of keys as a uint64 array. """
+        return self.mix_many(self.digest_many(keys), seed)
+
+    def index(self, key, seed, m):
+        """ Return the hash value of a key mapped to [0, m). """
+        return fastrange(self.hash(key, seed), m)
+
+    def index_many(self, keys, seed, m):
+        """ Return the hash values of a batch of keys mapped to [0, m). """
+        return fastrange_many(self.hash_many(keys, seed), m)
+
+    def __eq__(self, other):
+        return type(self) is type(other)
+
+    def __hash__(self):
+        return hash(type(self))
+
+    def __repr__(self):
+        return "%s()" % type(self).__name__
+
+
+class MurmurHash(HashFamily):
+    """ Mixes the digest with a seed key using the MurmurHash3 finalizer. This is the default. """
+
+    name = "murmur"
+
+    def mix(self, x, seed):
+        return _fmix64(x ^ _derive(seed, 0))
+
+    def mix_many(self, x, seeds):
+        return _fmix64_many(np.asarray(x, dtype=np.uint64) ^ _derive_many(seeds, 0))
+
+
+class MultiplyShift(HashFamily):
+    """ Two independent vector multiply-shift functions on the two 32-bit halves
+    of the digest, each giving 32 bits of the hash value:
+    h(x) = ((a0 * x0 + a1 * x1 + b) mod 2^64) >> 32.
+    """
+
+    name = "multiply_shift"
+
+    def mix(self, x, seed):
+        x0, x1 = x & _MASK32, x >> 32
+        hi = ((_derive(seed, 0) * x0 + _derive(seed, 1) * x1 + _derive(seed, 2)) & _MASK64) >> 32
+        lo = ((_derive(seed, 3) * x0 + _derive(seed, 4) * x1 + _derive(seed, 5)) & _MASK64) >> 32
+        return (hi << 32) | lo
+
+    def mix_many(self, x, seeds):
+        x = np.asarray(x, dtype=np.uint64)
+        x0, x1 = x & np.uint64(_MASK32), x >> _U32
+        a = [_derive_many(seeds, i) for i in range(6)]
+        with np.errstate(over="ignore"):
+            hi = (a[0] * x0 + a[1] * x1 + a[2]) >> _U32
+            lo = (a[3] * x0 + a[4] * x1 + a[5]) >> _U32
+            return (hi << _U32) | lo
+
+
+@lru_cache(maxsize=1)
+def _tabulation_tables():
+    """ The (8, 256) random tables of Tabulation, shared by all seeds. """
+    rng = np.random.default_rng(_GOLDEN)
+    return np.frombuffer(rng.bytes(8 * 256 * 8), dtype=np.uint64).reshape(8, 256)
+
+
+@lru_cache(maxsize=1)
+def _tabulation_pair_tables():
+    """ The (4, 65536) tables of the XORs of the entries of two consecutive
+    bytes, so that mix_many needs 4 lookups per value instead of 8. """
+    tables = _tabulation_tables()
+    return np.stack([(tables[2 * j + 1][:, None] ^ tables[2 * j][None, :]).reshape(-1) for j in range(4)])
+
+
+class Tabulation(HashFamily):
+    """ Simple tabulation hashing: the XOR of 8 random table entries, one per
+    byte of the digest XORed with a key derived from the seed. All seeds share
+    the same tables: 16KB of byte tables for mix, and 2MB of byte-pair tables
+    for mix_many, built the first time mix_many is called.
+    """
+
+    name = "tabulation"
+
+    def mix(self, x, seed):
+        tables = _tabulation_tables()
+        x ^= _derive(seed, 0)
+        h = 0
+        for i in range(8):
+            h ^= int(tables[i, (x >> (8 * i)) & 255])
+        return h
+
+    def mix_many(self, x, seeds):
+        tables = _tabulation_pair_tables()
+        x = np.asarray(x, dtype=np.uint64) ^ _derive_many(seeds, 0)
+        # The 16-bit words of each value, lowest first, index the pair tables directly
+        words = np.ascontiguousarray(x, dtype="<u8").reshape(-1).view("<u2").reshape(-1, 4)
+        h = tables[0].take(words[:, 0])
+        for i in range(1, 4):
+            h ^= tables[i].take(words[:, i])
+        return h.reshape(x.shape)
+
+
+FAMILIES = {family.name: family for family in (MurmurHash, MultiplyShift, Tabulation)}
+
+
+def get_hash_family(hash_family=None):
+    """ Return a hash family given an instance, a class, a name in FAMILIES,
+    or None for the default MurmurHash family.
+    """
+    if hash_family is None:
+        return MurmurHash()
+    if isinstance(hash_family, HashFamily):
+        return hash_family
+    if isinstance(hash_family, str):
+        if hash_family not in FAMILIES:
+            raise ValueError("Unknown hash family %r, expected one of %s." % (hash_family, sorted(FAMILIES)))
+        return FAMILIES[hash_family]()
+    if isinstance(hash_family, type) and issubclass(hash_family, HashFamily):
+        return hash_family()
+    raise TypeError("hash_family must be a HashFamily, a family name or None.")
@@ -1,11 +1,14 @@
 from sketchlib.count_min import CountMin
 from heapq import heappush, heappop, heapify
-from math import ceil
+from math import ceil, exp, log
+import time
 from abc import abstractmethod
 from copy import deepcopy
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin, memoized
 
 
-class AbstractHeavyHitters:
+class AbstractHeavyHitters(VersionedMixin, MemoryMixin):
     @abstractmethod
     def insert(self, token, count):
         pass
@@ -65,8 +68,9 @@ class CountMinCashRegister(AbstractHeavyHitters):
 
     def update_heap(self, token, count):
         """ Update the min heap based on the newly inserted token. """
+        self._bump_version()
         cutoff = self._phi * self._l1_norm
-        self._count_min.insert(str(token), count)
+        self._count_min.insert(token, count)
         point_query = self._count_min.estimate_count(token)
         if point_query >= cutoff:
             heappush(self._min_heap, (point_query, token))
@@ -78,13 +82,15 @@ class CountMinCashRegister(AbstractHeavyHitters):
         while self._min_heap and self._min_heap[0][0] < cutoff:
             heappop(self._min_heap)
 
+    @memoized
     def get_heavy_hitters(self):
-        """ Retrieve all heavy hitters from the min heap. """
+        """ Retrieve all heavy hitters from the min heap. Cached until the sketch changes. """
         return {item: self._count_min.estimate_count(item) for _, item in self._min_heap}
 
     def merge(self, other):
         """ Merges another heavy-hitter instance into this one. Both instances being
             merged need to share all parameters and hash seeds; otherwise, the merge will fail. """
+        self._bump_version()
         self._count_min.merge(other._count_min)
         self._l1_norm += other._l1_norm
         self._min_heap.extend(other._min_heap)
@@ -123,35 +129,60 @@ class MisraGries(AbstractHeavyHitters):
         self._k = ceil(1 / (self._phi * self._epsilon))
 
     def insert(self, token, count=1):
-        """ Insert a token into the counters. """
-        for _ in range(count):
-            self._m += 1
-            self._update_counters(token)
+        """ Insert a token into the counters. This is equivalent to inserting
+            the token count times, but takes at most one decrement sweep per
+            counter that is evicted. """
+        self._bump_version()
+        self._m += count
+        self._update_counters(token, count)
 
-    def _update_counters(self, token):
-        """ Update the counters based on the newly inserted token. """
-        if token in self._counters:
-            self._counters[token] += 1
+    def insert_many(self, tokens, counts=None):
+        """ Insert a batch of tokens, optionally with their counts. Repeated
+            tokens in the batch are aggregated first. """
+        batch = {}
+        if counts is None:
+            for token in tokens:
+                batch[token] = batch.get(token, 0) + 1
         else:
+            for token, count in zip(tokens, counts):
+                batch[token] = batch.get(token, 0) + count
+        for token, count in batch.items():
+            self.insert(token, count)
+
+    def _update_counters(self, token, count=1):
+        """ Update the counters based on the newly inserted token. """
+        while count > 0:
+            if token in self._counters:
+                self._counters[token] += count
+                return
             if len(self._counters) < self._k - 1:
-                self._counters[token] = 1
-            else:
-                self._decrement_counters()
+                self._counters[token] = count
+                return
+            if not self._counters:
+                return
+
+            # Each remaining occurrence decrements all counters until one of
+            # them reaches zero and frees a slot for the token.
+            amount = min(min(self._counters.values()), count)
+            self._decrement_counters(amount)
+            count -= amount
 
-    def _decrement_counters(self):
-        """ Decrement all counters and remove those that reach zero. """
+    def _decrement_counters(self, amount=1):
+        """ Decrement all counters by amount and remove those that reach zero. """
         for key in list(self._counters.keys()):
-            self._counters[key] -= 1
-            if self._counters[key] == 0:
+            self._counters[key] -= amount
+            if self._counters[key] <= 0:
                 del self._counters[key]
 
+    @memoized
     def get_heavy_hitters(self):
-        """ Retrieve all heavy hitters based on the set threshold. """
+        """ Retrieve all heavy hitters based on the set threshold. Cached until the sketch changes. """
         threshold = (1 - self._epsilon) * self._phi * self._m
         return {k: v for k, v in self._counters.items() if v > threshold}
 
     def merge(self, other):
         """ Merge another Misra-Gries instance into this one. """
+        self._bump_version()
         self._m += other._m
         for key, value in other._counters.items():
             self._counters[key] = self._counters.get(key, 0) + value
@@ -168,3 +199,209 @@ class MisraGries(AbstractHeavyHitters):
                     keys_to_delete.append(key)
             for key in keys_to_delete:
                 del self._counters[key]
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Creates a new, empty instance with the same parameters as an existing one. """
+        return cls(phi=original._phi, epsilon=original._epsilon)
+
+# --------------------------------------------------------------------------
+
+class _ForwardDecay:
+    """
+    Exponential decay with a landmark (forward decay, Cormode et al. 2009). An
+    item of count c at time t weighs c * exp(-rate * (now - t)) at time now.
+    Instead of scaling every stored count down as time passes, the count is
+    scaled up to c * exp(rate * (t - landmark)) when it is inserted, and the
+    stored values are scaled down by exp(-rate * (now - landmark)) when they
+    are read. When the scale of new counts reaches 2^64, the stored values are
+    renormalized and the landmark moves to the current time, which happens once
+    every 64 half-lives.
+    """
+
+    _max_log_scale = 64 * log(2)
+
+    def _init_decay(self, half_life):
+        """ Initialize the decay rate, the landmark and the current time. """
+        self._half_life = half_life
+        self._rate = log(2) / half_life
+        self._landmark = None
+        self._now = None
+
+    def _scale(self, timestamp):
+        """ Return the factor applied to a count inserted at timestamp. """
+        if timestamp is None:
+            timestamp = time.time()
+        if self._landmark is None:
+            self._landmark = timestamp
+        if self._now is None or timestamp > self._now:
+            self._now = timestamp
+        exponent = self._rate * (timestamp - self._landmark)
+        if exponent > self._max_log_scale:
+            self._move_landmark(timestamp)
+            exponent = 0.0
+        return exp(exponent)
+
+    def _move_landmark(self, landmark):
+        """ Renormalize the stored values relative to a new landmark. """
+        self._rescale(exp(-self._rate * (landmark - self._landmark)))
+        self._landmark = landmark
+
+    def _decay_factor(self, timestamp):
+        """ Return the factor that turns stored values into decayed counts at timestamp. """
+        if self._landmark is None:
+            return 1.0
+        if timestamp is None:
+            timestamp = self._now
+        return exp(-self._rate * (timestamp - self._landmark))
+
+    def _align(self, other):
+        """ Move the landmark of self to that of other if it is later, and return
+        the factor that converts the stored values of other to the landmark of self. """
+        if other._landmark is None:
+            return 1.0
+        if self._landmark is None:
+            self._landmark = other._landmark
+        elif other._landmark > self._landmark:
+            self._move_landmark(other._landmark)
+        if other._now is not None and (self._now is None or other._now > self._now):
+            self._now = other._now
+        return exp(-self._rate * (self._landmark - other._landmark))
+
+# --------------------------------------------------------------------------
+
+class DecayedMisraGries(_ForwardDecay, MisraGries):
+    """ Misra-Gries heavy hitters of an exponentially decayed stream. Counts
+        are real numbers; a count inserted half_life time units ago weighs
+        half as much as a new one. """
+
+    def __init__(self, phi=0.05, epsilon=0.2, half_life=3600):
+        """
+        phi: threshold for heavy hitters, as a fraction of the decayed stream length
+        epsilon: not return any element whose decayed count is less than (phi-epsilon) * m
+        half_life: time after which the weight of an item is halved
+        """
+        super().__init__(phi, epsilon)
+        self._init_decay(half_life)
+
+    def insert(self, token, count=1, timestamp=None):
+        """ Insert a token with a count at a timestamp (default: the current
+            time). Timestamps may arrive out of order. """
+        self._bump_version()
+        weight = count * self._scale(timestamp)
+        self._m += weight
+        self._update_counters(token, weight)
+
+    def insert_many(self, tokens, counts=None, timestamp=None):
+        """ Insert a batch of tokens at the same timestamp, optionally with their counts. """
+        batch = {}
+        if counts is None:
+            for token in tokens:
+                batch[token] = batch.get(token, 0) + 1
+        else:
+            for token, count in zip(tokens, counts):
+                batch[token] = batch.get(token, 0) + count
+        self._bump_version()
+        scale = self._scale(timestamp)
+        for token, count in batch.items():
+            self._m += count * scale
+            self._update_counters(token, count * scale)
+
+    def _rescale(self, factor):
+        self._m *= factor
+        for key in self._counters:
+            self._counters[key] *= factor
+
+    @memoized
+    def get_heavy_hitters(self, timestamp=None):
+        """ Retrieve the heavy hitters and their decayed counts at timestamp
+            (default: the latest timestamp inserted). """
+        factor = self._decay_factor(timestamp)
+        threshold = (1 - self._epsilon) * self._phi * self._m
+        return {k: v * factor for k, v in self._counters.items() if v > threshold}
+
+    def decayed_count(self, timestamp=None):
+        """ Return the decayed length of the stream at timestamp. """
+        return self._m * self._decay_factor(timestamp)
+
+    def merge(self, other):
+        """ Merge another instance with the same half-life into this one. """
+        self._bump_version()
+        factor = self._align(other)
+        self._m += other._m * factor
+        for key, value in other._counters.items():
+            self._counters[key] = self._counters.get(key, 0) + value * factor
+        self._prune_counters()
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Creates a new, empty instance with the same parameters as an existing one. """
+        return cls(phi=original._phi, epsilon=original._epsilon, half_life=original._half_life)
+
+# --------------------------------------------------------------------------
+
+class DecayedCountMinCashRegister(_ForwardDecay, CountMinCashRegister):
+    """ Count-Min heavy hitters of an exponentially decayed stream. The
+        Count-Min table holds floats; a count inserted half_life time units
+        ago weighs half as much as a new one. """
+
+    def __init__(self, phi=0.05, epsilon=0.2, delta=0.01, seed=42, half_life=3600):
+        """
+        phi: threshold for heavy hitters, as a fraction of the decayed stream length
+        epsilon: not return any element whose decayed count is less than (phi-epsilon) * l1_norm
+        delta: failure probability
+        seed: seed for hash function
+        half_life: time after which the weight of an item is halved
+        """
+        super().__init__(phi, epsilon, delta, seed)
+        self._init_decay(half_life)
+
+    def _init_params(self, phi, epsilon, delta, seed):
+        """ Initialize parameters and create a CountMin object with a float table. """
+        super()._init_params(phi, epsilon, delta, seed)
+        self._count_min._densify()
+        self._count_min._table = self._count_min._table.astype(float)
+
+    def insert(self, token, count=1, timestamp=None):
+        """ Insert a token with a count at a timestamp (default: the current
+            time). Timestamps may arrive out of order. """
+        weight = count * self._scale(timestamp)
+        self.update_l1_norm(weight)
+        self.update_heap(token, weight)
+
+    def _rescale(self, factor):
+        self._l1_norm *= factor
+        self._count_min._table *= factor
+        self._count_min._mark_dirty()
+        # Scaling all priorities by the same positive factor keeps the heap order
+        self._min_heap = [(value * factor, token) for value, token in self._min_heap]
+
+    @memoized
+    def get_heavy_hitters(self, timestamp=None):
+        """ Retrieve the heavy hitters and their decayed counts at timestamp
+            (default: the latest timestamp inserted). """
+        factor = self._decay_factor(timestamp)
+        return {item: self._count_min.estimate_count(item) * factor for _, item in self._min_heap}
+
+    def decayed_count(self, timestamp=None):
+        """ Return the decayed length of the stream at timestamp. """
+        return self._l1_norm * self._decay_factor(timestamp)
+
+    def merge(self, other):
+        """ Merge another instance with the same parameters, hash seeds and half-life into this one. """
+        self._bump_version()
+        factor = self._align(other)
+        self._count_min._table += other._count_min._table * factor
+        self._count_min._mark_dirty()
+        self._l1_norm += other._l1_norm * factor
+        self._min_heap.extend((value * factor, token) for value, token in other._min_heap)
+        heapify(self._min_heap)
+        self.remove_below_cutoff(self._phi * self._l1_norm)
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Creates a new, empty instance that can be merged with an existing one. """
+        new_instance = cls(original._phi, original._epsilon, original._delta, original._seed,
+                           original._half_life)
+        new_instance._count_min = CountMin.from_existing(original._count_min)
+        return new_instance
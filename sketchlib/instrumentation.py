@@ -0,0 +1,322 @@
+"""
+Opt-in instrumentation for the sketches in this package.
+
+When disabled (the default) nothing in the sketches is touched, so there is no
+overhead at all. enable() swaps the instrumented methods for wrappers that update
+the counters and timing histograms below, and disable() puts the original
+functions back.
+"""
+import time
+import inspect
+import threading
+import importlib
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Counters that are reported, in export order
+COUNTERS = ("hash_calls", "table_writes", "heap_pushes", "heap_pops", "decrement_sweeps")
+
+# Operations for which timing histograms are kept
+TIMERS = ("insert", "merge", "query")
+
+# Upper bounds (in seconds) of the histogram buckets
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+           1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+
+def _cells(sketch):
+    """ Number of cells of a sketch table. """
+    return sketch._depth * sketch._width
+
+
+def _f2_cells(sketch):
+    """ Number of cells an F2Estimate insert hashes and writes: a sparse sketch
+    only digests the token and updates one entry of its dict. """
+    return 1 if sketch._table is None else _cells(sketch)
+
+
+class _PerKey:
+    """ Counter cost of a batch method: cost (as in _TARGETS) for each key of
+    its first argument. """
+
+    def __init__(self, cost):
+        self.cost = cost
+
+
+# Instrumented functions: (module, class or None, attribute, counters, timer, label).
+# A counter cost is either an int, the name of an attribute of the sketch, a
+# callable taking the sketch or a _PerKey cost for batch methods. Module level
+# functions use the given label. Sketches that hash a token with all their seeds
+# in one vectorized call count one hash call per seed in their insert.
+_TARGETS = [
+    ("sketchlib.bloom_filter", "BloomFilter", "_hash", {"hash_calls": 1}, None, None),
+    ("sketchlib.bloom_filter", "BloomFilter", "insert", {"table_writes": "_k"}, "insert", None),
+    ("sketchlib.bloom_filter", "BloomFilter", "delete", {"table_writes": "_k"}, None, None),
+    ("sketchlib.bloom_filter", "BloomFilter", "membership", {}, "query", None),
+    ("sketchlib.bloom_filter", "BloomFilter", "merge", {}, "merge", None),
+    ("sketchlib.bloom_filter", "BloomFilter", "insert_many",
+     {"hash_calls": _PerKey("_k"), "table_writes": _PerKey("_k")}, "insert", None),
+    ("sketchlib.bloom_filter", "BloomFilter", "contains_many", {"hash_calls": _PerKey("_k")}, "query", None),
+    ("sketchlib.bloom_filter", "BlockedBloomFilter", "insert",
+     {"hash_calls": lambda bf: len(bf._seeds), "table_writes": "_k"}, "insert", None),
+    ("sketchlib.bloom_filter", "BlockedBloomFilter", "membership",
+     {"hash_calls": lambda bf: len(bf._seeds)}, "query", None),
+    ("sketchlib.bloom_filter", "BlockedBloomFilter", "merge", {}, "merge", None),
+    ("sketchlib.bloom_filter", "BlockedBloomFilter", "insert_many",
+     {"hash_calls": _PerKey(lambda bf: len(bf._seeds)), "table_writes": _PerKey("_k")}, "insert", None),
+    ("sketchlib.bloom_filter", "BlockedBloomFilter", "contains_many",
+     {"hash_calls": _PerKey(lambda bf: len(bf._seeds))}, "query", None),
+    ("sketchlib.count_min", "CountMin", "_hash", {"hash_calls": 1}, None, None),
+    ("sketchlib.count_min", "CountMin", "insert", {"table_writes": "_depth"}, "insert", None),
+    ("sketchlib.count_min", "CountMin", "estimate_count", {}, "query", None),
+    ("sketchlib.count_min", "CountMin", "merge", {}, "merge", None),
+    ("sketchlib.count_min", "CountMin", "insert_many",
+     {"hash_calls": _PerKey("_depth"), "table_writes": _PerKey("_depth")}, "insert", None),
+    ("sketchlib.distinct_count", "LogDistinctCount", "_hash", {"hash_calls": 1}, None, None),
+    ("sketchlib.distinct_count", "LogDistinctCount", "_insert_into_table", {"table_writes": 1}, None, None),
+    ("sketchlib.distinct_count", "LogDistinctCount", "insert", {}, "insert", None),
+    ("sketchlib.distinct_count", "LogDistinctCount", "estimator", {}, "query", None),
+    ("sketchlib.distinct_count", "LogDistinctCount", "merge", {}, "merge", None),
+    ("sketchlib.distinct_count", "LogDistinctCount", "insert_many",
+     {"hash_calls": _PerKey("_depth"), "table_writes": _PerKey("_depth")}, "insert", None),
+    ("sketchlib.f2_estimate", "F2Estimate", "_hash", {"hash_calls": 1}, None, None),
+    ("sketchlib.f2_estimate", "F2Estimate", "insert",
+     {"hash_calls": _f2_cells, "table_writes": _f2_cells}, "insert", None),
+    ("sketchlib.f2_estimate", "F2Estimate", "estimator", {}, "query", None),
+    ("sketchlib.f2_estimate", "F2Estimate", "merge", {}, "merge", None),
+    ("sketchlib.f2_estimate", "F2Estimate", "insert_many",
+     {"hash_calls": _PerKey(_f2_cells), "table_writes": _PerKey(_f2_cells)}, "insert", None),
+    ("sketchlib.heavy_hitters", None, "heappush", {"heap_pushes": 1}, None, "CountMinCashRegister"),
+    ("sketchlib.heavy_hitters", None, "heappop", {"heap_pops": 1}, None, "CountMinCashRegister"),
+    ("sketchlib.heavy_hitters", "CountMinCashRegister", "insert", {}, "insert", None),
+    ("sketchlib.heavy_hitters", "CountMinCashRegister", "get_heavy_hitters", {}, "query", None),
+    ("sketchlib.heavy_hitters", "CountMinCashRegister", "merge", {}, "merge", None),
+    ("sketchlib.heavy_hitters", "MisraGries", "_decrement_counters", {"decrement_sweeps": 1}, None, None),
+    ("sketchlib.heavy_hitters", "MisraGries", "_prune_counters", {"decrement_sweeps": 1}, None, None),
+    ("sketchlib.heavy_hitters", "MisraGries", "insert", {}, "insert", None),
+    ("sketchlib.heavy_hitters", "MisraGries", "get_heavy_hitters", {}, "query", None),
+    ("sketchlib.heavy_hitters", "MisraGries", "merge", {}, "merge", None),
+    ("sketchlib.minhash", "MinHash", "_hash", {"hash_calls": 1}, None, None),
+    ("sketchlib.minhash", "MinHash", "insert", {"hash_calls": "_k"}, "insert", None),
+    ("sketchlib.minhash", "MinHash", "estimate_jaccard_similarity", {}, "query", None),
+    ("sketchlib.minhash", "MinHash", "merge", {}, "merge", None),
+    ("sketchlib.minhash", "MinHash", "insert_many", {"hash_calls": _PerKey("_k")}, "insert", None),
+    ("sketchlib.quantile_sketch", "QuantileSketch", "insert", {}, "insert", None),
+    ("sketchlib.quantile_sketch", "QuantileSketch", "query", {}, "query", None),
+    ("sketchlib.quantile_sketch", "QuantileSketch", "merge", {}, "merge", None),
+    # The batch inserts each distinct value through insert, whose CountMins are counted
+    ("sketchlib.quantile_sketch", "QuantileSketch", "insert_many", {}, "insert", None),
+    ("sketchlib.rsv_sampling", "RsvSampling", "insert", {}, "insert", None),
+    ("sketchlib.rsv_sampling", "RsvSampling", "reservoir", {}, "query", None),
+    ("sketchlib.rsv_sampling", "RsvSampling", "merge", {}, "merge", None),
+]
+
+
+class Histogram:
+    """ A cumulative histogram of durations using the fixed BUCKETS. """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        """ Record one duration. """
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def to_dict(self):
+        """ Return the histogram with cumulative bucket counts keyed by upper bound. """
+        buckets, total = {}, 0
+        for bound, c in zip(BUCKETS + (float("inf"),), self.counts):
+            total += c
+            buckets[bound] = total
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class Metrics:
+    """ Counters and timing histograms, labelled by the name of the sketch class. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """ Clear all counters and histograms. """
+        with self._lock:
+            self._counters = {name: {} for name in COUNTERS}
+            self._timings = {name: {} for name in TIMERS}
+
+    def count(self, counter, label, amount=1):
+        """ Add amount to a counter. """
+        with self._lock:
+            values = self._counters[counter]
+            values[label] = values.get(label, 0) + amount
+
+    def observe(self, timer, label, seconds):
+        """ Record a duration for the given operation. """
+        with self._lock:
+            histograms = self._timings[timer]
+            if label not in histograms:
+                histograms[label] = Histogram()
+            histograms[label].observe(seconds)
+
+    def snapshot(self):
+        """ Return a copy of all counters and histograms as a dict. """
+        with self._lock:
+            return {
+                "counters": {name: dict(values) for name, values in self._counters.items()},
+                "timings": {name: {label: h.to_dict() for label, h in histograms.items()}
+                            for name, histograms in self._timings.items()},
+            }
+
+    def to_prometheus(self, prefix="sketchlib"):
+        """ Return the metrics in the Prometheus text exposition format. """
+        snap = self.snapshot()
+        lines = []
+        for name in COUNTERS:
+            metric = "%s_%s_total" % (prefix, name)
+            lines.append("# TYPE %s counter" % metric)
+            for label, value in sorted(snap["counters"][name].items()):
+                lines.append('%s{sketch="%s"} %d' % (metric, label, value))
+        for name in TIMERS:
+            metric = "%s_%s_seconds" % (prefix, name)
+            lines.append("# TYPE %s histogram" % metric)
+            for label, h in sorted(snap["timings"][name].items()):
+                for bound, c in h["buckets"].items():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append('%s_bucket{sketch="%s",le="%s"} %d' % (metric, label, le, c))
+                lines.append('%s_sum{sketch="%s"} %r' % (metric, label, h["sum"]))
+                lines.append('%s_count{sketch="%s"} %d' % (metric, label, h["count"]))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# Saved originals: (owner, attribute, original, owned) where owned tells whether
+# the attribute was defined on the owner itself rather than inherited.
+_patched = []
+_patch_lock = threading.Lock()
+
+
+def _cost(spec, obj, batch=None):
+    """ Resolve a counter cost given in _TARGETS; batch is the keys of a batch method. """
+    if isinstance(spec, _PerKey):
+        return _cost(spec.cost, obj) * len(batch)
+    if isinstance(spec, int):
+        return spec
+    if isinstance(spec, str):
+        return getattr(obj, spec)
+    return spec(obj)
+
+
+def _wrap_method(original, counters, timer):
+    """ Return a wrapper of a sketch method that updates the metrics. """
+    local = metrics._local
+    per_key = any(isinstance(spec, _PerKey) for spec in counters.values())
+    # The name of the argument holding the keys of a batch method
+    keys = list(inspect.signature(original).parameters)[1] if per_key else None
+
+    @wraps(original)
+    def wrapper(self, *args, **kwargs):
+        label = type(self).__name__
+        batch = None
+        if per_key:
+            batch = args[0] if args else kwargs[keys]
+            if not hasattr(batch, "__len__"):
+                # Count the keys of an iterator without consuming them
+                batch = list(batch)
+                if args:
+                    args = (batch,) + args[1:]
+                else:
+                    kwargs[keys] = batch
+        for counter, spec in counters.items():
+            metrics.count(counter, label, _cost(spec, self, batch))
+        if timer is None:
+            return original(self, *args, **kwargs)
+
+        # Only the outermost timed call is recorded, so that e.g. the CountMin
+        # queries made inside CountMinCashRegister.insert are not double counted.
+        depth = getattr(local, "depth", 0)
+        local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            local.depth = depth
+            if depth == 0:
+                metrics.observe(timer, label, time.perf_counter() - start)
+    return wrapper
+
+
+def _wrap_function(original, counters, label):
+    """ Return a wrapper of a module level function that updates the counters. """
+    @wraps(original)
+    def wrapper(*args, **kwargs):
+        for counter, spec in counters.items():
+            metrics.count(counter, label, spec)
+        return original(*args, **kwargs)
+    return wrapper
+
+
+def enable():
+    """ Install the instrumentation wrappers. Calling it twice has no effect. """
+    with _patch_lock:
+        if _patched:
+            return
+        for module_name, class_name, attribute, counters, timer, label in _TARGETS:
+            module = importlib.import_module(module_name)
+            if class_name is None:
+                owner = module
+                original = getattr(module, attribute)
+                wrapper = _wrap_function(original, counters, label)
+            else:
+                owner = getattr(module, class_name)
+                original = getattr(owner, attribute)
+                wrapper = _wrap_method(original, counters, timer)
+            _patched.append((owner, attribute, original, attribute in vars(owner)))
+            setattr(owner, attribute, wrapper)
+
+
+def disable():
+    """ Restore the original, uninstrumented functions. """
+    with _patch_lock:
+        while _patched:
+            owner, attribute, original, owned = _patched.pop()
+            if owned:
+                setattr(owner, attribute, original)
+            else:
+                delattr(owner, attribute)
+
+
+def is_enabled():
+    """ Return True if the instrumentation wrappers are installed. """
+    return bool(_patched)
+
+
+@contextmanager
+def instrumented():
+    """ Enable instrumentation for the duration of a with block. """
+    enable()
+    try:
+        yield metrics
+    finally:
+        disable()
+
+
+def snapshot():
+    """ Return the current metrics as a dict. """
+    return metrics.snapshot()
+
+
+def to_prometheus(prefix="sketchlib"):
+    """ Return the current metrics in the Prometheus text format. """
+    return metrics.to_prometheus(prefix)
+
+
+def reset():
+    """ Clear the current metrics. """
+    metrics.reset()
@@ -0,0 +1,362 @@
+"""
+Keyed sketch families: one sketch per group (customer, endpoint, region, ...)
+with the state of every group stored in a single NumPy array.
+
+A dictionary maps each group to a row of the array. Rows are allocated when a
+group is first inserted, and the array grows geometrically. Row 0 is never
+assigned to a group, so it stays empty, and queries about unknown groups are
+answered from it as if the group had an empty sketch.
+
+Batches of (group, token) pairs are ingested with a few vectorized updates
+instead of one Python call per pair and per group. Every group behaves like
+the corresponding single sketch built with the same parameters.
+"""
+import math
+import numpy as np
+from sketchlib.hashing import get_hash_family, fastrange, fastrange_many
+from sketchlib.memory import MemoryMixin
+
+
+class _KeyedSketch(MemoryMixin):
+    """ Base class of the keyed sketches. Subclasses set _shape, _dtype and _fill. """
+
+    # Initial number of rows, including the empty row 0
+    _initial_capacity = 16
+
+    def __init__(self):
+        self._groups = {}
+        self._state = np.full((self._initial_capacity,) + self._shape, self._fill, dtype=self._dtype)
+
+    def _grow(self, size):
+        """ Make room for at least size rows, doubling the capacity. """
+        capacity = len(self._state)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        state = np.full((capacity,) + self._shape, self._fill, dtype=self._dtype)
+        state[:len(self._state)] = self._state
+        self._state = state
+        self._on_grow(capacity)
+
+    def _on_grow(self, capacity):
+        """ Hook for subclasses with per-group arrays besides the state. """
+
+    def _row(self, group, create=True):
+        """ Return the row of a group, allocating it if create is True (0 if unknown). """
+        row = self._groups.get(group)
+        if row is None:
+            if not create:
+                return 0
+            row = len(self._groups) + 1
+            self._grow(row + 1)
+            self._groups[group] = row
+        return row
+
+    def _rows(self, groups, create=True):
+        """ Return the rows of a batch of groups as an array. NumPy arrays of groups
+        are looked up once per distinct group. """
+        if isinstance(groups, np.ndarray):
+            unique, inverse = np.unique(groups, return_inverse=True)
+            rows = np.array([self._row(g, create) for g in unique.tolist()], dtype=np.intp)
+            return rows[inverse.reshape(-1)]
+        groups = list(groups)
+        return np.fromiter((self._row(g, create) for g in groups), dtype=np.intp, count=len(groups))
+
+    def groups(self):
+        """ Return the list of groups, in order of first insertion. """
+        return list(self._groups)
+
+    def __len__(self):
+        """ Return the number of groups. """
+        return len(self._groups)
+
+    def __contains__(self, group):
+        return group in self._groups
+
+    def _merge_rows(self, rows, other_rows, other):
+        """ Combine the state of other_rows of other into rows of self. """
+        self._state[rows] += other._state[other_rows]
+
+    def merge(self, other):
+        """ Merge another keyed sketch with the same parameters, group by group. """
+        other_rows = np.array(list(other._groups.values()), dtype=np.intp)
+        rows = self._rows(other._groups.keys())
+        if len(rows):
+            self._merge_rows(rows, other_rows, other)
+
+    def __add__(self, other):
+        """ Return a new keyed sketch that is the merge of self and other. """
+        merged = self.from_existing(self)
+        merged.merge(self)
+        merged.merge(other)
+        return merged
+
+# --------------------------------------------------------------------------
+
+class KeyedCountMin(_KeyedSketch):
+    """ One CountMin sketch per group, stored as a (groups, depth, width) array. """
+
+    def __init__(self, width=1, delta=0.05, seed=10, hash_family=None):
+        """
+        width: The width of each table.
+        delta: Failure probability.
+        seed: Seed for hash functions.
+        hash_family: Hash family (see sketchlib.hashing), default is MurmurHash.
+        """
+        self._width = width
+        self._delta = delta
+        self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
+        self._depth = math.ceil(math.log(1 / delta))
+        self._hash_seeds = np.arange(self._depth) * seed
+        self._shape, self._dtype, self._fill = (self._depth, self._width), int, 0
+        super().__init__()
+
+    def _columns(self, tokens):
+        """ Return the (depth, N) columns of a batch of tokens. """
+        digests = self._hash_family.digest_many(tokens)
+        hashes = self._hash_family.mix_many(digests[None, :], self._hash_seeds[:, None])
+        return fastrange_many(hashes, self._width)
+
+    def insert(self, group, token, count=1):
+        """ Insert a token with its count into the sketch of a group. """
+        table = self._state[self._row(group)]
+        for row, seed in enumerate(self._hash_seeds):
+            table[row, fastrange(self._hash_family.hash(token, seed), self._width)] += count
+
+    def insert_many(self, groups, tokens, counts=None):
+        """ Insert a batch of (group, token) pairs, optionally with their counts. """
+        rows = self._rows(groups)
+        counts = 1 if counts is None else np.asarray(counts)
+        np.add.at(self._state, (rows, np.arange(self._depth)[:, None], self._columns(tokens)), counts)
+
+    def estimate_count(self, group, token):
+        """ Estimate the frequency count of a token in a group. """
+        table = self._state[self._row(group, create=False)]
+        return min(table[row, fastrange(self._hash_family.hash(token, seed), self._width)]
+                   for row, seed in enumerate(self._hash_seeds))
+
+    def estimate_count_many(self, groups, tokens):
+        """ Estimate the counts of a batch of (group, token) pairs. Returns an array. """
+        rows = self._rows(groups, create=False)
+        return self._state[rows, np.arange(self._depth)[:, None], self._columns(tokens)].min(axis=0)
+
+    def get_table(self, group):
+        """ Return the (depth, width) table of a group. """
+        return self._state[self._row(group, create=False)]
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create an empty keyed sketch with the same parameters as an existing one. """
+        return cls(width=original._width, delta=original._delta, seed=original._seed,
+                   hash_family=original._hash_family)
+
+# --------------------------------------------------------------------------
+
+class KeyedLogDistinctCount(_KeyedSketch):
+    """
+    One LogDistinctCount sketch per group, stored as a (groups, depth, width)
+    array. Each row keeps the width smallest distinct hash values in increasing
+    order, padded with inf. As long as a group has fewer than width distinct
+    tokens, the number of hash values in its first row is its exact count.
+    """
+
+    def __init__(self, epsilon=0.01, delta=0.01, seed=42, hash_family=None):
+        """
+        epsilon: approximation error,
+        delta: failure probability,
+        seed: seed for hash function,
+        hash_family: hash family (see sketchlib.hashing), default is MurmurHash.
+        """
+        self._epsilon = epsilon
+        self._delta = delta
+        self._seed = seed
+        self._hash_family = get_hash_family(hash_family)
+        self._c = 2
+        self._width = self._c * int((1 / epsilon) ** 2)
+        self._depth = self._c * int(math.log(1 / delta, 2))
+        self._seeds = np.arange(self._depth) * seed
+        self._shape, self._dtype, self._fill = (self._depth, self._width), float, np.inf
+        super().__init__()
+
+    def _smallest(self, values):
+        """ Keep the width smallest distinct values along the last axis, in order. """
+        values = np.sort(values, axis=-1)
+        duplicate = np.zeros(values.shape, dtype=bool)
+        duplicate[..., 1:] = values[..., 1:] == values[..., :-1]
+        values[duplicate] = np.inf
+        return np.sort(values, axis=-1)[..., :self._width]
+
+    def insert(self, group, token):
+        """ Insert a token into the sketch of a group. """
+        self.insert_many([group], [token])
+
+    def insert_many(self, groups, tokens, chunk_size=65536):
+        """ Insert a batch of (group, token) pairs. """
+        rows = self._rows(groups)
+        digests = self._hash_family.digest_many(tokens)
+        for start in range(0, len(rows), chunk_size):
+            self._insert_hashes(rows[start:start + chunk_size], digests[start:start + chunk_size])
+
+    def _insert_hashes(self, rows, digests):
+        hashes = (self._hash_family.mix_many(digests[None, :], self._seeds[:, None]) / 2**64).T
+
+        # Values not below the largest kept value of a full row cannot enter it
+        hashes[hashes >= self._state[rows, :, -1]] = np.inf
+        keep = np.isfinite(hashes).any(axis=1)
+        rows, hashes = rows[keep], hashes[keep]
+        if not len(rows):
+            return
+
+        # Sort the new and the kept values by (group, level, value) into one flat
+        # list, so a hot group does not pad every other group to its size
+        touched, inverse = np.unique(rows, return_inverse=True)
+        existing = self._state[touched].reshape(-1)
+        keys = np.concatenate([np.repeat(np.arange(len(touched) * self._depth), self._width),
+                               (inverse[:, None] * self._depth + np.arange(self._depth)).reshape(-1)])
+        values = np.concatenate([existing, hashes.reshape(-1)])
+        finite = np.isfinite(values)
+        keys, values = keys[finite], values[finite]
+        order = np.lexsort((values, keys))
+        keys, values = keys[order], values[order]
+
+        # Drop repeated values, then keep the width smallest of each (group, level)
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (values[1:] != values[:-1])
+        keys, values = keys[first], values[first]
+        start = np.ones(len(keys), dtype=bool)
+        start[1:] = keys[1:] != keys[:-1]
+        index = np.arange(len(keys))
+        ranks = index - np.maximum.accumulate(np.where(start, index, 0))
+        kept = ranks < self._width
+
+        smallest = np.full((len(touched) * self._depth, self._width), np.inf)
+        smallest[keys[kept], ranks[kept]] = values[kept]
+        self._state[touched] = smallest.reshape(len(touched), self._depth, self._width)
+
+    def _merge_rows(self, rows, other_rows, other):
+        values = np.concatenate([self._state[rows], other._state[other_rows]], axis=2)
+        self._state[rows] = self._smallest(values)
+
+    def _estimates(self, tables):
+        """ Estimate the number of distinct tokens of a (groups, depth, width) array. """
+        exact = np.isfinite(tables[:, 0]).sum(axis=1)
+        with np.errstate(divide="ignore"):
+            est = np.median((self._width / tables[:, :, -1]).astype(np.int64), axis=1).astype(np.int64)
+        return np.where(exact < self._width, exact, est)
+
+    def estimator(self, group):
+        """ Estimate the number of distinct tokens of a group. """
+        return int(self._estimates(self._state[[self._row(group, create=False)]])[0])
+
+    def estimator_many(self, groups=None):
+        """ Estimate the number of distinct tokens of a batch of groups (default: all
+        groups, in the order of groups()). Returns an array. """
+        rows = np.arange(1, len(self._groups) + 1) if groups is None else self._rows(groups, create=False)
+        return self._estimates(self._state[rows])
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create an empty keyed sketch with the same parameters as an existing one. """
+        return cls(epsilon=original._epsilon, delta=original._delta, seed=original._seed,
+                   hash_family=original._hash_family)
+
+# --------------------------------------------------------------------------
+
+class KeyedQuantileSketch(_KeyedSketch):
+    """
+    One QuantileSketch per group, stored as a (groups, levels, depth, width)
+    array: one CountMin table per dyadic level. Values are integers in [1, n].
+    """
+
+    def __init__(self, epsilon=0.1, delta=0.01, n=10**9, seed=42):
+        """
+        epsilon: error bound
+        delta: probability of error
+        n: the elements in the stream are in the range [1, n]
+        seed: seed for hash functions
+        """
+        self._epsilon, self._delta, self._range_elements, self._seed = epsilon, delta, n, seed
+        self._hash_family = get_hash_family(None)
+        self._num_levels = math.ceil(math.log2(n)) + 2
+        self._width = int(2 * math.log2(n) / epsilon)
+        self._depth = math.ceil(math.log(1 / delta))
+        self._hash_seeds = np.arange(self._depth) * seed
+        self._shape, self._dtype, self._fill = (self._num_levels, self._depth, self._width), int, 0
+        self._l1_norm = np.zeros(self._initial_capacity, dtype=int)
+        super().__init__()
+
+    def _on_grow(self, capacity):
+        l1_norm = np.zeros(capacity, dtype=int)
+        l1_norm[:len(self._l1_norm)] = self._l1_norm
+        self._l1_norm = l1_norm
+
+    def _columns(self, positions):
+        """ Return the (depth,) + positions.shape columns of dyadic positions. """
+        seeds = self._hash_seeds.reshape((-1,) + (1,) * positions.ndim)
+        hashes = self._hash_family.mix_many(positions.astype(np.uint64)[None], seeds)
+        return fastrange_many(hashes, self._width)
+
+    def insert(self, group, x, count=1):
+        """ Insert an element x into the sketch of a group with a given count. """
+        self.insert_many([group], [x], [count])
+
+    def insert_many(self, groups, values, counts=None):
+        """ Insert a batch of (group, value) pairs, optionally with their counts. """
+        rows = self._rows(groups)
+        values = np.asarray(values, dtype=np.int64)
+        counts = np.ones(len(values), dtype=int) if counts is None else np.asarray(counts)
+
+        # The position of x at level i is ceil(x / 2^i)
+        levels = np.arange(self._num_levels)
+        positions = ((values[None, :] - 1) >> levels[:, None]) + 1
+        index = (rows, levels[None, :, None], np.arange(self._depth)[:, None, None], self._columns(positions))
+        np.add.at(self._state, index, counts)
+        np.add.at(self._l1_norm, rows, counts)
+
+    def _prefix_counts(self, rows, upper):
+        """ Estimate the count of elements in [1, upper] for each row. The dyadic
+        decomposition of [1, upper] has one interval at each level i where bit i of
+        upper is set, at position 2 * (upper >> (i + 1)) + 1. """
+        total = np.zeros(len(rows), dtype=int)
+        depth = np.arange(self._depth)[:, None]
+        for i in range(self._num_levels):
+            bit = (upper >> i) & 1
+            if not bit.any():
+                continue
+            columns = self._columns(2 * (upper >> (i + 1)) + 1)
+            total += bit * self._state[rows, i, depth, columns].min(axis=0)
+        return total
+
+    def query(self, group, q):
+        """ Query the sketch of a group for the qth quantile. """
+        return int(self.query_many([group], q)[0])
+
+    def query_many(self, groups, q):
+        """ Query the sketches of a batch of groups for the qth quantile, with one
+        binary search run on all groups at once. Returns an array. """
+        rows = self._rows(groups, create=False)
+        threshold = q * self._l1_norm[rows]
+        lower = np.ones(len(rows), dtype=np.int64)
+        upper = np.full(len(rows), self._range_elements, dtype=np.int64)
+        result = np.zeros(len(rows), dtype=np.int64)
+        while True:
+            active = lower <= upper
+            if not active.any():
+                return result
+            mid = (lower + upper) // 2
+            below = self._prefix_counts(rows, mid) < threshold
+            lower = np.where(active & below, mid + 1, lower)
+            result = np.where(active & ~below, mid, result)
+            upper = np.where(active & ~below, mid - 1, upper)
+
+    def _merge_rows(self, rows, other_rows, other):
+        self._state[rows] += other._state[other_rows]
+        self._l1_norm[rows] += other._l1_norm[other_rows]
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create an empty keyed sketch with the same parameters as an existing one. """
+        return cls(epsilon=original._epsilon, delta=original._delta,
+                   n=original._range_elements, seed=original._seed)
@@ -0,0 +1,51 @@
+"""
+Memory footprint of sketches.
+
+nbytes(obj) follows the attributes of an object and adds up the sizes of the
+NumPy arrays, lists, sets, dicts, tuples (including heaps, which are lists)
+and scalars it holds. Objects reached twice are counted once. Classes,
+modules, functions and methods are not followed. Sketches get it as a method
+from MemoryMixin.
+"""
+import sys
+import types
+import numpy as np
+
+_NOT_FOLLOWED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType)
+
+
+def nbytes(obj):
+    """ Return the number of bytes used by obj and everything it references. """
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if id(x) in seen or isinstance(x, _NOT_FOLLOWED):
+            continue
+        seen.add(id(x))
+        total += sys.getsizeof(x)
+        if isinstance(x, np.ndarray):
+            # Arrays that do not own their data (views, frombuffer) count it separately
+            if not x.flags.owndata:
+                total += x.nbytes
+            if x.dtype.hasobject:
+                stack.extend(x.reshape(-1).tolist())
+        elif isinstance(x, dict):
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple, set, frozenset)):
+            stack.extend(x)
+        elif hasattr(x, "__dict__"):
+            stack.append(x.__dict__)
+    return total
+
+
+class MemoryMixin:
+    """ Adds an nbytes method to a sketch. """
+
+    def nbytes(self):
+        """ Return the number of bytes used by the sketch and everything it references
+        (its tables, lists and dicts). """
+        return nbytes(self)
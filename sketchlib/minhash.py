@@ -1,38 +1,64 @@
-import mmh3
 import math
 import random
 import numpy as np
 from copy import deepcopy
+from sketchlib.hashing import get_hash_family
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin
 
 
-class MinHash:
+class MinHash(VersionedMixin, MemoryMixin):
     """ MinHash Sketch """
 
-    max_128_int = pow(2, 128) - 1
-
-    def __init__(self, epsilon=0.1, seed=42):
+    def __init__(self, epsilon=0.1, seed=42, hash_family=None, bits=64):
         """
         epsilon: approximation error for Jaccard similarity,
-        seed: seed for hash function.
+        seed: seed for hash function,
+        hash_family: hash family (see sketchlib.hashing), default is MurmurHash,
+        bits: 64 or 32, the number of bits of each signature value.
         """
+        if bits not in (32, 64):
+            raise ValueError("bits must be 32 or 64.")
         self._epsilon = epsilon
         self._k = 4 * math.ceil(1 / pow(self._epsilon, 2))
         self._seed = seed
+        self._bits = bits
+        self._hash_family = get_hash_family(hash_family)
         self._seeds = np.arange(self._k) * self._seed
-        self._minhash_signature = np.ones(self._k, dtype=float)
+        self._dtype = np.uint64 if bits == 64 else np.uint32
+        self._minhash_signature = np.full(self._k, np.iinfo(self._dtype).max, dtype=self._dtype)
+
+    def _truncate(self, hashes):
+        """ Keep the high bits of 64-bit hashes. The minimum of the high bits is the high bits of the minimum. """
+        return (hashes >> np.uint64(64 - self._bits)).astype(self._dtype)
 
     def insert(self, token):
         """ Inserts a token into the set. """
-        for i in range(self._k):
-            current_hash = self._hash(token, self._seeds[i])
-            if current_hash < self._minhash_signature[i]:
-                self._minhash_signature[i] = current_hash
+        self._bump_version()
+        family = self._hash_family
+        hashes = family.mix_many(np.uint64(family.digest(token)), self._seeds)
+        np.minimum(self._minhash_signature, self._truncate(hashes), out=self._minhash_signature)
+
+    def insert_many(self, tokens, chunk_size=4096):
+        """ Inserts a batch of tokens. NumPy integer arrays are hashed without a Python loop. """
+        self._bump_version()
+        family = self._hash_family
+        digests = family.digest_many(tokens)
+        for start in range(0, len(digests), chunk_size):
+            hashes = family.mix_many(digests[start:start + chunk_size, None], self._seeds[None, :])
+            if len(hashes):
+                np.minimum(self._minhash_signature, self._truncate(hashes.min(axis=0)),
+                           out=self._minhash_signature)
 
     def merge(self, other_mh):
         """ Merges two minhash signatures resulting in a single signature 
-        representing the union of the two original sets. """
+        representing the union of the two original sets. If one of them was
+        folded (see fold), the other one is folded like it first. self is left
+        unchanged if the minhashes are incompatible. """
         try:
+            other_mh = self._fold_like(other_mh)
             self._check_mergeability(other_mh)
+            self._bump_version()
             self._minhash_signature = np.minimum(self._minhash_signature, other_mh._minhash_signature)
         except AttributeError:
             print("Merge attempted on incompatible minhash instances.")
@@ -44,13 +70,56 @@ class MinHash:
         return merged_minhash
 
     def _hash(self, token, seed):
-        """ Compute the hash of a token. """
-        return mmh3.hash(token, seed, signed=False) / MinHash.max_128_int
+        """ Compute the hash of a token, truncated to the bits of the signature. """
+        return self._hash_family.hash(token, seed) >> (64 - self._bits)
+
+    def fold(self, factor=1, bits=None):
+        """
+        Shrink the signature to its first k // factor values and, if bits is 32,
+        to the high 32 bits of each value. Each value is the minimum of one hash
+        function, so the folded signature is the signature of a minhash with fewer
+        hash functions or bits that would have seen the same set. The number of
+        values k must be a multiple of factor.
+        """
+        bits = self._bits if bits is None else bits
+        if factor < 1 or self._k % factor != 0:
+            raise ValueError("Cannot fold %d signature values by %s." % (self._k, factor))
+        if bits not in (32, 64) or bits > self._bits:
+            raise ValueError("Cannot fold %d-bit signature values to %s bits." % (self._bits, bits))
+        self._bump_version()
+        self._k //= factor
+        self._seeds = self._seeds[:self._k]
+        signature = self._minhash_signature[:self._k]
+        if bits != self._bits:
+            signature = (signature >> np.uint64(self._bits - bits)).astype(np.uint32)
+        self._bits = bits
+        self._dtype = signature.dtype.type
+        self._minhash_signature = signature.copy()
+
+    def _fold_like(self, other_mh):
+        """ Fold self or a copy of other_mh so that both have the signature
+        length and bits of the smaller one. Returns the other minhash. Nothing
+        is folded if they are not folds of compatible minhashes. """
+        k, bits = min(self._k, other_mh._k), min(self._bits, other_mh._bits)
+        if self._k % k != 0 or other_mh._k % k != 0:
+            raise AttributeError("Minhash signature lengths must be multiples of each other to fold them.")
+        if not np.array_equal(self._seeds[:k], other_mh._seeds[:k]):
+            raise AttributeError("Minhash hash functions must have same seed values for valid result.")
+        if self._hash_family != other_mh._hash_family:
+            raise AttributeError("Minhash signatures must use the same hash family for valid result.")
+        if (self._k, self._bits) != (k, bits):
+            self.fold(self._k // k, bits)
+        if (other_mh._k, other_mh._bits) != (k, bits):
+            other_mh = deepcopy(other_mh)
+            other_mh.fold(other_mh._k // k, bits)
+        return other_mh
 
     @classmethod
     def from_existing(cls, original):
-        """ Creates a new minhash based on the parameters of an existing minhash. """
-        new_minhash = cls(epsilon=original._epsilon, seed=original._seed)
+        """ Creates a new minhash based on the parameters of an existing minhash, folded like it. """
+        new_minhash = cls(epsilon=original._epsilon, seed=original._seed, hash_family=original._hash_family,
+                          bits=original._bits)
+        new_minhash._fold_like(original)
         return new_minhash
 
     def _check_mergeability(self, other_minhash):
@@ -60,12 +129,140 @@ class MinHash:
         else:
             if not np.array_equal(self._seeds, other_minhash._seeds):
                 raise AttributeError("Minhash hash functions must have same seed values for valid result.")
+            if self._hash_family != other_minhash._hash_family:
+                raise AttributeError("Minhash signatures must use the same hash family for valid result.")
+            if self._bits != other_minhash._bits:
+                raise AttributeError("Minhash signatures must have the same number of bits for valid result.")
 
     def estimate_jaccard_similarity(self, other_mh):
-        """ Provides an estimate for the Jaccard Similarity of two sets. """
+        """ Provides an estimate for the Jaccard Similarity of two sets. If one of
+        the minhashes was folded, the other one is compared as if folded like it. """
+        if (self._k, self._bits) != (other_mh._k, other_mh._bits):
+            folded = deepcopy(self)
+            return folded.estimate_jaccard_similarity(folded._fold_like(other_mh))
         counter = np.sum(self._minhash_signature == other_mh._minhash_signature)
         return counter / self._k
 
-    def get_signature(self):
-        """ Returns the minhash signature. """
-        return self._minhash_signature
+    def get_signature(self, bits=None):
+        """ Returns the minhash signature, or its b lowest bits (b-bit minhash) if bits is given. """
+        if bits is None:
+            return self._minhash_signature
+        return truncate_signatures(self._minhash_signature, bits)
+
+# --------------------------------------------------------------------------
+
+def _bit_dtype(bits):
+    """ Return the smallest unsigned integer type with at least bits bits. """
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if bits <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError("bits must be between 1 and 64.")
+
+
+def truncate_signatures(signatures, bits):
+    """ Keep the b lowest bits of signature values (b-bit minhash, Li and Konig
+    2010), in the smallest unsigned integer type that holds them. """
+    if not 1 <= bits <= 64:
+        raise ValueError("bits must be between 1 and 64.")
+    signatures = np.asarray(signatures)
+    mask = (1 << bits) - 1
+    return (signatures.astype(np.uint64) & np.uint64(mask)).astype(_bit_dtype(bits))
+
+
+class MinHashMatrix(MemoryMixin):
+    """
+    A matrix of minhash signatures, one row per set, for computing the Jaccard
+    similarities of many sets at once. Signatures can be truncated to their b
+    lowest bits to save memory; the estimates are then corrected for the
+    matches of 2^-b that happen by chance.
+    """
+
+    def __init__(self, signatures, bits=None):
+        """
+        signatures: 2-d array of signatures (one row per set) from MinHash
+            instances with the same parameters,
+        bits: if given, keep only the b lowest bits of each value.
+        """
+        signatures = np.atleast_2d(np.asarray(signatures))
+        self._bits = bits
+        self._signatures = signatures if bits is None else truncate_signatures(signatures, bits)
+
+    @classmethod
+    def from_minhashes(cls, minhashes, bits=None):
+        """ Stack the signatures of MinHash instances with the same parameters. """
+        minhashes = list(minhashes)
+        for other in minhashes[1:]:
+            minhashes[0]._check_mergeability(other)
+        return cls(np.stack([m.get_signature() for m in minhashes]), bits=bits)
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def get_signatures(self):
+        """ Returns the matrix of signatures. """
+        return self._signatures
+
+    def _rows(self, other):
+        """ Signatures of a MinHash, a MinHashMatrix or an array, truncated like self. """
+        if isinstance(other, MinHashMatrix):
+            if other._bits != self._bits:
+                raise ValueError("Signatures must be truncated to the same number of bits.")
+            return other._signatures
+        if isinstance(other, MinHash):
+            other = other.get_signature()
+        other = np.atleast_2d(np.asarray(other))
+        return other if self._bits is None else truncate_signatures(other, self._bits)
+
+    def _estimate(self, matches, k):
+        """ Turn numbers of matching values into Jaccard similarity estimates. """
+        similarity = matches / k
+        if self._bits is not None:
+            chance = 2.0 ** -self._bits
+            similarity = np.clip((similarity - chance) / (1 - chance), 0, 1)
+        return similarity
+
+    def _matches(self, a, b):
+        """ Number of matching values between each row of a and each row of b. """
+        return (a[:, None, :] == b[None, :, :]).sum(axis=2)
+
+    def jaccard(self, other=None, chunk_size=None):
+        """
+        Estimate the Jaccard similarities of each row with each row of other (a
+        MinHash, a MinHashMatrix or an array of signatures), or of all pairs of
+        rows if other is None. Returns a len(self) x len(other) array. Rows of
+        self are processed chunk_size at a time so that the comparisons take
+        about 16 MB at a time.
+        """
+        b = self._signatures if other is None else self._rows(other)
+        a = self._signatures
+        k = a.shape[1]
+        if chunk_size is None:
+            chunk_size = max(1, 2**24 // max(1, len(b) * k))
+        result = np.empty((len(a), len(b)))
+        for start in range(0, len(a), chunk_size):
+            result[start:start + chunk_size] = self._estimate(self._matches(a[start:start + chunk_size], b), k)
+        return result
+
+    def pairs_above(self, threshold, other=None, chunk_size=None):
+        """
+        Return the pairs of rows (i, j) whose estimated similarity is at least
+        threshold, as arrays i, j and similarities, without keeping the whole
+        similarity matrix. If other is None, the pairs of rows of self with i < j
+        are returned.
+        """
+        b = self._signatures if other is None else self._rows(other)
+        a = self._signatures
+        k = a.shape[1]
+        if chunk_size is None:
+            chunk_size = max(1, 2**24 // max(1, len(b) * k))
+        rows, cols, values = [], [], []
+        for start in range(0, len(a), chunk_size):
+            similarity = self._estimate(self._matches(a[start:start + chunk_size], b), k)
+            i, j = np.nonzero(similarity >= threshold)
+            keep = i + start < j if other is None else slice(None)
+            rows.append(i[keep] + start)
+            cols.append(j[keep])
+            values.append(similarity[i[keep], j[keep]])
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
@@ -0,0 +1,98 @@
+"""
+Hash-once fan-out to several sketches.
+
+Every sketch of this package hashes a key in two steps (see sketchlib.hashing):
+the key is reduced to a 64-bit digest, and the digest is mixed with a seed per
+row or hash function. The digest of an integer key is the key itself, so
+inserting the digest of a key into a sketch has the same effect as inserting
+the key. A SketchPipeline computes the digests of a batch once and passes them
+to every registered sketch, which then only runs the cheap integer mixing.
+"""
+import numpy as np
+from sketchlib.hashing import digest, digest_many
+from sketchlib.columnar import digest_column, drop_null_counts, pa
+from sketchlib._inserting import is_weighted, insert_batch
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.bloom_filter import BloomFilter, BlockedBloomFilter
+from sketchlib.cuckoo_filter import CuckooFilter
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.minhash import MinHash
+
+# Sketches that only use the digests of their keys. Other sketches, such as
+# heavy hitters that return their keys or quantile sketches that compare
+# values, receive the original keys.
+HASHED_SKETCHES = (CountMin, F2Estimate, BloomFilter, BlockedBloomFilter, CuckooFilter,
+                   LogDistinctCount, MinHash)
+
+
+class SketchPipeline:
+    """ Feeds the same keys to several sketches, hashing each key only once. """
+
+    def __init__(self, sketches=None):
+        """
+        sketches: dict of the sketches to feed, by name.
+        """
+        self._sketches = {}
+        self._hashed = {}
+        self._weighted = {}
+        for name, sketch in (sketches or {}).items():
+            self.add(name, sketch)
+
+    def add(self, name, sketch, hashed=None):
+        """
+        Register a sketch under a name. hashed tells whether the sketch receives
+        digests instead of keys; by default, it does if it is one of HASHED_SKETCHES.
+        """
+        self._sketches[name] = sketch
+        self._hashed[name] = isinstance(sketch, HASHED_SKETCHES) if hashed is None else hashed
+        self._weighted[name] = is_weighted(sketch)
+
+    def __getitem__(self, name):
+        return self._sketches[name]
+
+    def __contains__(self, name):
+        return name in self._sketches
+
+    def __len__(self):
+        return len(self._sketches)
+
+    def names(self):
+        """ Return the names of the registered sketches. """
+        return list(self._sketches)
+
+    def insert(self, key, count=1):
+        """ Insert a key into all sketches. Weighted sketches receive count. """
+        d = digest(key)
+        for name, sketch in self._sketches.items():
+            token = d if self._hashed[name] else key
+            if self._weighted[name]:
+                sketch.insert(token, count)
+            else:
+                sketch.insert(token)
+
+    def insert_many(self, keys, counts=None):
+        """
+        Insert a batch of keys into all sketches, optionally with counts for
+        the weighted sketches. Keys can be a list, a NumPy array or an Arrow
+        array; string columns are hashed from their buffers (see
+        sketchlib.columnar). Null values of an Arrow array are skipped, along
+        with their counts.
+        """
+        digests = self.digests(keys) if any(self._hashed.values()) else None
+        if pa is not None and isinstance(keys, (pa.Array, pa.ChunkedArray)):
+            if counts is not None:
+                counts = drop_null_counts(keys, counts)
+            keys = keys.drop_null().to_pylist()
+        for name, sketch in self._sketches.items():
+            tokens = digests if self._hashed[name] else keys
+            insert_batch(sketch, tokens, counts if self._weighted[name] else None)
+
+    @staticmethod
+    def digests(keys):
+        """ Return the digests of a batch of keys as a uint64 array. """
+        if pa is not None and isinstance(keys, (pa.Array, pa.ChunkedArray)):
+            return digest_column(keys)
+        if isinstance(keys, np.ndarray) and keys.dtype.kind in "SUiu":
+            return digest_column(keys)
+        return digest_many(keys)
@@ -0,0 +1,239 @@
+"""
+Memory-budget planner.
+
+plan(cls, memory_budget=..., target_error=...) chooses the constructor
+parameters of a sketch class from a memory budget in bytes, a target error, or
+both, and predicts the size of the sketch and its error, and optionally
+measures its insert throughput.
+
+The error of a plan is the guarantee of the sketch, which holds with
+probability 1 - delta where the sketch has a failure probability:
+
+- CountMin: additive error of a count, as a fraction of the total count.
+- F2Estimate, LogDistinctCount: relative error of the estimate.
+- QuantileSketch: rank error, as a fraction of the total count.
+- MinHash: additive error of the Jaccard similarity.
+- BloomFilter, BlockedBloomFilter, CuckooFilter: false positive rate with n
+  keys inserted.
+- MisraGries, CountMinCashRegister: additive error of a count, as a fraction
+  of the total count (phi * epsilon).
+
+Sizes are predicted from the constructor formulas for a full sketch (tables,
+plus lists, sets and dicts at their maximum length), so they can be compared
+with the nbytes() method of the sketch once it has seen enough data. The tables
+of CountMin and F2Estimate start sparse (see sketchlib.sparse) and only reach
+this size once they become dense; BloomFilter and QuantileSketch allocate their
+tables on the first insert.
+"""
+import math
+import time
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.quantile_sketch import QuantileSketch
+from sketchlib.minhash import MinHash
+from sketchlib.bloom_filter import BloomFilter, BlockedBloomFilter
+from sketchlib.cuckoo_filter import CuckooFilter
+from sketchlib.heavy_hitters import MisraGries, CountMinCashRegister
+from sketchlib._inserting import is_weighted
+
+# Approximate sizes of a Python float in a list, and of a set or dict entry
+# with a short key and an int value
+_LIST_FLOAT_BYTES = 32
+_SET_ENTRY_BYTES = 100
+_DICT_ENTRY_BYTES = 120
+
+# Approximate size of the attributes of a sketch object besides its tables
+_OBJECT_BYTES = 1000
+
+# Bounds of the error searched when only a memory budget is given
+_MIN_ERROR = 1e-9
+_MAX_ERROR = 0.5
+
+
+def _count_min(error, delta, kwargs):
+    width = math.ceil(math.e / error)
+    return dict(kwargs, width=width, delta=delta)
+
+
+def _count_min_error(params):
+    return math.e / params["width"]
+
+
+def _count_min_nbytes(params):
+    return _OBJECT_BYTES + 8 * math.ceil(math.log(1 / params["delta"])) * params["width"]
+
+
+def _f2_nbytes(params):
+    width = 3 * int(1 / params["epsilon"] ** 2)
+    depth = 3 * int(math.log(1 / params["delta"], 2))
+    # The table and one hash seed per cell
+    return 16 * width * depth
+
+
+def _log_distinct_count_nbytes(params):
+    width = 2 * int((1 / params["epsilon"]) ** 2)
+    depth = 2 * int(math.log(1 / params["delta"], 2))
+    # depth sorted lists of width hash values, and a set of up to width tokens
+    return _LIST_FLOAT_BYTES * width * depth + _SET_ENTRY_BYTES * width
+
+
+def _quantile_nbytes(params):
+    n = params.get("n", 10**9)
+    levels = math.ceil(math.log2(n)) + 2
+    width = int(2 * math.log2(n) / params["epsilon"])
+    return levels * _count_min_nbytes(dict(width=width, delta=params["delta"]))
+
+
+def _minhash_nbytes(params):
+    # One uint64 (or uint32 with bits=32) signature value and one int64 hash
+    # seed per hash function
+    k = 4 * math.ceil(1 / params["epsilon"] ** 2)
+    return (params.get("bits", 64) // 8 + 8) * k
+
+
+def _bloom_nbytes(params):
+    n = params.get("n", 10000)
+    return 8 * math.ceil(n * math.log2(1 / params["delta"]) / math.log(2))
+
+
+def _blocked_bloom_nbytes(params):
+    n = params.get("n", 10000)
+    return BlockedBloomFilter._block_bytes * BlockedBloomFilter._blocks_for(n, params["delta"])
+
+
+def _cuckoo_nbytes(params):
+    n = params.get("n", 10000)
+    f = min(16, max(8, math.ceil(math.log2(8 / params["delta"]))))
+    num_buckets = max(1, math.ceil(n / (4 * 0.95)))
+    return num_buckets * 4 * (1 if f <= 8 else 2)
+
+
+def _cuckoo_error(params):
+    # A lookup compares 8 fingerprints of f bits
+    f = min(16, max(8, math.ceil(math.log2(8 / params["delta"]))))
+    return min(1.0, 8 / 2 ** f)
+
+
+def _heavy_hitters(error, delta, kwargs):
+    phi = kwargs.get("phi", 0.05)
+    return dict(kwargs, phi=phi, epsilon=error / phi)
+
+
+def _count_min_cash_register(error, delta, kwargs):
+    return dict(_heavy_hitters(error, delta, kwargs), delta=delta)
+
+
+def _heavy_hitters_error(params):
+    return params["phi"] * params["epsilon"]
+
+
+def _misra_gries_nbytes(params):
+    k = math.ceil(1 / (params["phi"] * params["epsilon"]))
+    return _DICT_ENTRY_BYTES * k
+
+
+def _count_min_cash_register_nbytes(params):
+    width = math.ceil(1 / (params["phi"] * params["epsilon"]))
+    # At most 1 / phi tokens are above the cutoff in the heap
+    heap = _DICT_ENTRY_BYTES * math.ceil(1 / params["phi"])
+    return _count_min_nbytes(dict(width=width, delta=params["delta"])) + heap
+
+
+def _epsilon(error, delta, kwargs):
+    return dict(kwargs, epsilon=error, delta=delta)
+
+
+def _epsilon_only(error, delta, kwargs):
+    return dict(kwargs, epsilon=error)
+
+
+def _false_positive_rate(error, delta, kwargs):
+    return dict(kwargs, delta=error)
+
+
+def _epsilon_error(params):
+    return params["epsilon"]
+
+
+def _delta_error(params):
+    return params["delta"]
+
+
+# For each class: the constructor parameters for an error, the error of the
+# parameters (after rounding) and the size of a full sketch.
+_SPECS = {
+    CountMin: (_count_min, _count_min_error, _count_min_nbytes),
+    F2Estimate: (_epsilon, _epsilon_error, _f2_nbytes),
+    LogDistinctCount: (_epsilon, _epsilon_error, _log_distinct_count_nbytes),
+    QuantileSketch: (_epsilon, _epsilon_error, _quantile_nbytes),
+    MinHash: (_epsilon_only, _epsilon_error, _minhash_nbytes),
+    BloomFilter: (_false_positive_rate, _delta_error, _bloom_nbytes),
+    BlockedBloomFilter: (_false_positive_rate, _delta_error, _blocked_bloom_nbytes),
+    CuckooFilter: (_false_positive_rate, _cuckoo_error, _cuckoo_nbytes),
+    MisraGries: (_heavy_hitters, _heavy_hitters_error, _misra_gries_nbytes),
+    CountMinCashRegister: (_count_min_cash_register, _heavy_hitters_error, _count_min_cash_register_nbytes),
+}
+
+
+def measure_throughput(sketch, num_keys=2000):
+    """ Return the number of scalar inserts per second into a sketch. """
+    weighted = is_weighted(sketch)
+    start = time.perf_counter()
+    for i in range(num_keys):
+        if weighted:
+            sketch.insert(i % 1000 + 1, 1)
+        else:
+            sketch.insert(i % 1000 + 1)
+    return num_keys / (time.perf_counter() - start)
+
+
+def plan(cls, memory_budget=None, target_error=None, delta=0.01, benchmark=False, **kwargs):
+    """
+    Plan the parameters of a sketch class.
+
+    cls: the sketch class, e.g. CountMin.
+    memory_budget: maximum size of the sketch in bytes.
+    target_error: the error to reach (see the module docstring).
+    delta: failure probability, for the sketches that have one.
+    benchmark: whether to build the sketch and measure its insert throughput.
+    This allocates the planned sketch, so it is off by default.
+    kwargs: other constructor parameters, such as n for the filters and the
+    quantile sketch or phi for the heavy hitters.
+
+    With only a memory budget, the smallest error that fits is chosen. With
+    both, a ValueError is raised if the target error needs more memory than the
+    budget. Returns a dict with the constructor parameters ("params"), the
+    predicted error ("error"), the predicted size in bytes ("nbytes") and the
+    measured inserts per second ("throughput", None without benchmark).
+    """
+    if cls not in _SPECS:
+        raise TypeError("No plan for %s." % cls.__name__)
+    if memory_budget is None and target_error is None:
+        raise ValueError("Either memory_budget or target_error must be given.")
+    make_params, error_of, nbytes_of = _SPECS[cls]
+
+    if target_error is not None:
+        params = make_params(target_error, delta, kwargs)
+        size = nbytes_of(params)
+        if memory_budget is not None and size > memory_budget:
+            raise ValueError("An error of %g needs %d bytes, more than the budget of %d bytes."
+                             % (target_error, size, memory_budget))
+    else:
+        params = make_params(_MAX_ERROR, delta, kwargs)
+        if nbytes_of(params) > memory_budget:
+            raise ValueError("The smallest %s needs %d bytes, more than the budget of %d bytes."
+                             % (cls.__name__, nbytes_of(params), memory_budget))
+        # Bisect on a log scale for the smallest error whose sketch fits
+        low, high = math.log(_MIN_ERROR), math.log(_MAX_ERROR)
+        for _ in range(60):
+            middle = (low + high) / 2
+            if nbytes_of(make_params(math.exp(middle), delta, kwargs)) <= memory_budget:
+                high = middle
+            else:
+                low = middle
+        params = make_params(math.exp(high), delta, kwargs)
+
+    throughput = measure_throughput(cls(**params)) if benchmark else None
+    return {"params": params, "error": error_of(params), "nbytes": nbytes_of(params),
+            "throughput": throughput}
@@ -1,9 +1,12 @@
 from sketchlib.count_min import CountMin
-from math import log2, ceil, floor
+from math import log, log2, ceil, floor
 from copy import deepcopy
+import numpy as np
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin, memoized
 
 
-class QuantileSketch:
+class QuantileSketch(VersionedMixin, MemoryMixin):
     """ A quantile sketch based on Count-Min and dyadic intervals. """
 
     def __init__(self, epsilon=0.1, delta=0.01, n=10**9, seed=42):
@@ -17,12 +20,18 @@ class QuantileSketch:
         self._l1_norm, self._seed = 0, seed
         self._num_dyadic_intervals = ceil(log2(n)) + 1
 
-        # Initialize Count-Min sketch for each dyadic interval
-        cm_sketch_width = int(2 * log2(self._range_elements) / epsilon)
-        self._cm_sketch = [
-            CountMin(width=cm_sketch_width, delta=delta, seed=seed) 
-            for _ in range(self._num_dyadic_intervals + 1)
-        ]
+        # The Count-Min sketches of the dyadic intervals are created by the first write (see _count_mins)
+        self._cm_sketch = None
+
+    def _count_mins(self):
+        """ Return the Count-Min sketch of each dyadic interval, creating them on first use. """
+        if self._cm_sketch is None:
+            cm_sketch_width = int(2 * log2(self._range_elements) / self._epsilon)
+            self._cm_sketch = [
+                CountMin(width=cm_sketch_width, delta=self._delta, seed=self._seed)
+                for _ in range(self._num_dyadic_intervals + 1)
+            ]
+        return self._cm_sketch
 
     def _find_largest_inner_dyadic(self, a, b):
         """ Return the largest dyadic interval that is contained in [a, b]."""
@@ -53,22 +62,41 @@ class QuantileSketch:
         """ Given a list of dyadic intervals, return the estimate of the count of elements 
         in the union of these intervals.
         """
+        if self._cm_sketch is None:
+            return 0
         total_count = 0
         for a, b in intervals:
             level = int(log2(b - a + 1))
             position = ceil(a / 2 ** level)
-            total_count += self._cm_sketch[level].estimate_count(str(position))
+            total_count += self._cm_sketch[level].estimate_count(position)
         return total_count
 
     def insert(self, x, count=1):
         """ Insert an element x into the sketch with a given count. """
+        self._bump_version()
+        cm_sketch = self._count_mins()
         for i in range(self._num_dyadic_intervals + 1):
             position = ceil(x / (2 ** i))
-            self._cm_sketch[i].insert(str(position), count)
+            cm_sketch[i].insert(position, count)
         self._l1_norm += count
 
+    def insert_many(self, values, counts=None):
+        """ Insert a batch of elements, optionally with their counts. Repeated
+        elements are aggregated so that each one is only inserted once.
+        """
+        batch = {}
+        if counts is None:
+            for x in values:
+                batch[x] = batch.get(x, 0) + 1
+        else:
+            for x, count in zip(values, counts):
+                batch[x] = batch.get(x, 0) + count
+        for x, count in batch.items():
+            self.insert(x, count)
+
+    @memoized
     def query(self, q):
-        """ Query the sketch for the qth quantile. """
+        """ Query the sketch for the qth quantile. Cached until the sketch changes. """
         threshold, lower, upper = q * self._l1_norm, 1, self._range_elements
         result = None
         while lower <= upper:
@@ -84,9 +112,13 @@ class QuantileSketch:
 
     def merge(self, other):
         """ Merge self with another compatible sketch (same seed, epsilon, and delta) """
+        self._bump_version()
         self._l1_norm += other._l1_norm
+        if other._cm_sketch is None:
+            return
+        cm_sketch = self._count_mins()
         for i in range(self._num_dyadic_intervals + 1):
-            self._cm_sketch[i].merge(other._cm_sketch[i])
+            cm_sketch[i].merge(other._cm_sketch[i])
 
     def __add__(self, other):
         """ Return a new sketch that is the merge of self and other. """
@@ -103,3 +135,193 @@ class QuantileSketch:
             n=original._range_elements, 
             seed=original._seed
         )
+
+# --------------------------------------------------------------------------
+
+class _DenseStore:
+    """ Counts of consecutive integer bucket keys in a NumPy array that grows
+    contiguously. When the keys span more than max_buckets, the lowest buckets
+    are collapsed into one. """
+
+    def __init__(self, max_buckets):
+        self._max_buckets = max_buckets
+        self._counts = np.zeros(0)
+        self._offset = 0
+        self._min_key = None
+        self._max_key = None
+
+    def _ensure(self, low, high):
+        """ Make room for the keys low to high, collapsing the lowest buckets if
+        needed, and return the lowest key that has its own bucket. """
+        if self._min_key is not None:
+            low, high = min(low, self._min_key), max(high, self._max_key)
+        low = max(low, high - self._max_buckets + 1)
+
+        if low < self._offset or high >= self._offset + len(self._counts):
+            # Grow to at least twice the size, leaving room on both sides
+            span = high - low + 1
+            length = min(max(span, 2 * len(self._counts), 64), max(span, self._max_buckets))
+            offset = low - (length - span) // 2
+            counts = np.zeros(length)
+            if self._min_key is not None:
+                self._move(counts, offset, low)
+            self._counts, self._offset = counts, offset
+        elif self._min_key is not None and low > self._min_key:
+            self._move(self._counts, self._offset, low)
+
+        self._min_key, self._max_key = low, high
+        return low
+
+    def _move(self, counts, offset, low):
+        """ Copy the buckets into counts, whose first key is offset, adding those
+        below low to the bucket of low. """
+        start, stop = self._min_key - self._offset, self._max_key - self._offset + 1
+        keys = np.arange(self._min_key, self._max_key + 1)
+        old = self._counts[start:stop].copy()
+        self._counts[start:stop] = 0
+        np.add.at(counts, np.maximum(keys, low) - offset, old)
+
+    def add(self, key, count):
+        index = key - self._offset
+        if self._min_key is not None and self._min_key <= key <= self._max_key:
+            self._counts[index] += count
+            return
+        low = self._ensure(key, key)
+        self._counts[max(key, low) - self._offset] += count
+
+    def add_many(self, keys, counts):
+        if len(keys) == 0:
+            return
+        low = self._ensure(int(keys.min()), int(keys.max()))
+        indices = np.maximum(keys, low) - self._offset
+        self._counts += np.bincount(indices, weights=counts, minlength=len(self._counts))
+
+    def buckets(self):
+        """ Return the keys and the counts of the buckets, in increasing key order. """
+        if self._min_key is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        start, stop = self._min_key - self._offset, self._max_key - self._offset + 1
+        return np.arange(self._min_key, self._max_key + 1), self._counts[start:stop]
+
+    def merge(self, other):
+        keys, counts = other.buckets()
+        self.add_many(keys, counts)
+
+
+class DDSketch(VersionedMixin, MemoryMixin):
+    """
+    A relative-error quantile sketch for real values (Masson et al. 2019). The
+    values are mapped to logarithmic buckets (gamma^(k-1), gamma^k], with
+    gamma = (1 + alpha) / (1 - alpha), so every quantile is estimated within a
+    relative error alpha of a value of the stream of the right rank.
+    """
+
+    def __init__(self, alpha=0.01, max_buckets=2048, min_value=1e-9):
+        """
+        alpha: relative accuracy
+        max_buckets: maximum number of buckets for positive and for negative values
+        min_value: values whose absolute value is below min_value count as 0
+        """
+        self._alpha = alpha
+        self._max_buckets = max_buckets
+        self._min_value = min_value
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = log(self._gamma)
+        self._positive = _DenseStore(max_buckets)
+        self._negative = _DenseStore(max_buckets)
+        self._zero_count = 0.0
+        self._count = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+
+    def _key(self, x):
+        """ Return the bucket key of a positive value. """
+        return ceil(log(x) / self._log_gamma)
+
+    def _value(self, keys):
+        """ Return the representative value of buckets, within a relative error alpha of all values of the bucket. """
+        return 2 * np.power(self._gamma, keys) / (self._gamma + 1)
+
+    def insert(self, x, count=1):
+        """ Insert a value with a given count (default 1). """
+        self._bump_version()
+        if x > self._min_value:
+            self._positive.add(self._key(x), count)
+        elif x < -self._min_value:
+            self._negative.add(self._key(-x), count)
+        else:
+            self._zero_count += count
+        self._count += count
+        self._min = min(self._min, x)
+        self._max = max(self._max, x)
+
+    def insert_many(self, values, counts=None):
+        """ Insert a batch of values, optionally with their counts. """
+        values = np.asarray(values, dtype=float).reshape(-1)
+        if len(values) == 0:
+            return
+        self._bump_version()
+        counts = np.ones(len(values)) if counts is None else np.asarray(counts, dtype=float).reshape(-1)
+        with np.errstate(divide="ignore"):
+            keys = np.ceil(np.log(np.abs(values)) / self._log_gamma)
+        positive = values > self._min_value
+        negative = values < -self._min_value
+        self._positive.add_many(keys[positive].astype(np.int64), counts[positive])
+        self._negative.add_many(keys[negative].astype(np.int64), counts[negative])
+        self._zero_count += counts[~(positive | negative)].sum()
+        self._count += counts.sum()
+        self._min = min(self._min, values.min())
+        self._max = max(self._max, values.max())
+
+    def count(self):
+        """ Return the total count of the values inserted. """
+        return self._count
+
+    @memoized
+    def query(self, q):
+        """ Query the sketch for the qth quantile. Returns None if the sketch is empty.
+        Cached until the sketch changes. """
+        return None if self._count == 0 else float(self.query_many([q])[0])
+
+    def query_many(self, qs):
+        """ Query the sketch for several quantiles at once. """
+        qs = np.asarray(qs, dtype=float)
+        if self._count == 0:
+            return np.full(qs.shape, np.nan)
+
+        # All buckets in increasing order of value: negative values from the
+        # largest magnitude, then zero, then positive values
+        negative_keys, negative_counts = self._negative.buckets()
+        positive_keys, positive_counts = self._positive.buckets()
+        values = np.concatenate([-self._value(negative_keys[::-1]), [0.0], self._value(positive_keys)])
+        counts = np.concatenate([negative_counts[::-1], [self._zero_count], positive_counts])
+
+        cumulative = np.cumsum(counts)
+        ranks = np.clip(qs, 0, 1) * (self._count - 1)
+        indices = np.minimum(np.searchsorted(cumulative, ranks, side="right"), len(values) - 1)
+        estimates = np.clip(values[indices], self._min, self._max)
+        # The minimum and the maximum are exact
+        return np.where(qs <= 0, self._min, np.where(qs >= 1, self._max, estimates))
+
+    def merge(self, other):
+        """ Merge self with another sketch with the same alpha. """
+        if self._alpha != other._alpha:
+            raise ValueError("Cannot merge sketches with different alpha.")
+        self._bump_version()
+        self._positive.merge(other._positive)
+        self._negative.merge(other._negative)
+        self._zero_count += other._zero_count
+        self._count += other._count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def __add__(self, other):
+        """ Return a new sketch that is the merge of self and other. """
+        merged_sketch = deepcopy(self)
+        merged_sketch.merge(other)
+        return merged_sketch
+
+    @classmethod
+    def from_existing(cls, original):
+        """ Create a new, empty instance with the same parameters as an existing one. """
+        return cls(alpha=original._alpha, max_buckets=original._max_buckets, min_value=original._min_value)
@@ -1,7 +1,9 @@
 import random
 from copy import deepcopy
+from sketchlib.memory import MemoryMixin
+from sketchlib.versioning import VersionedMixin
 
-class RsvSampling:
+class RsvSampling(VersionedMixin, MemoryMixin):
     """ 
     Implements a reservoir sampling algorithm to sample a fixed-size subset
     of a stream of items whose size is unknown a priori.
@@ -23,6 +25,7 @@ class RsvSampling:
         
         token: Item to be inserted into the stream.
         """
+        self._bump_version()
         self._stream_length += 1  # Increment the counter for the stream length
 
         # If reservoir is not yet full, simply append
@@ -46,6 +49,7 @@ class RsvSampling:
         
         S: Another RsvSampling object to merge with.
         """
+        self._bump_version()
         # Combine both reservoirs and resample to maintain the original size
         self._rsv = random.sample(self._rsv + S._rsv, self._rsv_size)
 
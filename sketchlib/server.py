@@ -0,0 +1,579 @@
+"""
+Local sketch server.
+
+A SketchServer hosts named sketches in one asyncio process and serves them
+over a Unix domain socket or a localhost TCP port. Producers send batches of
+tokens instead of keeping their own sketches, so all hashing and table updates
+happen in the server, one request at a time.
+
+Each message is a frame: an 8-byte little-endian length followed by a pickled
+request or response. Requests are tuples:
+
+- ("create", name, sketch): host sketch under name, unless name exists.
+- ("insert", name, tokens, counts): insert a batch (counts may be None).
+- ("query", name, method, args, kwargs): call a read-only method of the sketch
+  (one of QUERY_METHODS).
+- ("merge", name, sketch): merge a sketch into the hosted one.
+- ("get", name): return a copy of the sketch.
+- ("names",) and ("snapshot",).
+
+Responses are ("ok", value) or ("error", message). Frames are unpickled, so a
+peer must be trusted before its first frame is read. A Unix socket is created
+with mode 0600, so only the server's user can connect to it. TCP is limited to
+loopback addresses and requires an authentication key: when a connection
+opens, server and client each send a random challenge and check that the other
+side answers with its HMAC-SHA256 under the key (the handshake can also be
+enabled on a Unix socket by giving a key). Sketch names are also file names in
+the snapshot directory, so they are restricted to letters, digits, "_", "-"
+and ".".
+
+SketchClient is the producer side: a thread-safe pool of connections that
+buffers small inserts per sketch and sends them as large batches.
+
+The server can be run as a script:
+
+    python -m sketchlib.server --unix /tmp/sketchlib.sock --snapshot-dir /var/lib/sketches --snapshot-interval 60
+    python -m sketchlib.server --port 7000 --authkey-file /etc/sketchlib/key
+"""
+import os
+import re
+import sys
+import glob
+import hmac
+import stat
+import queue
+import pickle
+import socket
+import struct
+import asyncio
+import logging
+import argparse
+import threading
+import ipaddress
+from contextlib import contextmanager
+
+from sketchlib.checkpoint import CheckpointMixin
+from sketchlib._inserting import insert_batch
+
+_LENGTH = struct.Struct("<Q")
+
+# Size of the random challenges of the handshake and of their HMAC-SHA256 answers
+_CHALLENGE_SIZE = 32
+
+# Methods that the "query" request may call; none of them changes the sketch
+QUERY_METHODS = frozenset([
+    "contains_many", "count", "decayed_count", "difference_count", "estimate_count", "estimate_count_many",
+    "estimate_jaccard_similarity", "estimator", "estimator_many", "expected_false_positive_rate",
+    "get_filter", "get_heavy_hitters", "get_signature", "get_table", "groups", "inner_product",
+    "inner_product_error", "intersection_count", "is_sparse", "jaccard", "join_size", "load_factor",
+    "membership", "nbytes", "query", "query_many", "reservoir", "union_count", "version",
+])
+
+_NAME = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]*")
+
+logger = logging.getLogger(__name__)
+
+
+class SketchServerError(RuntimeError):
+    """ Raised by the client when the server could not handle a request. """
+    pass
+
+
+def _pack(message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return _LENGTH.pack(len(data)) + data
+
+
+def _check_name(name):
+    """ Raise a ValueError if name cannot be used as a snapshot file name. """
+    if not isinstance(name, str) or not _NAME.fullmatch(name):
+        raise ValueError("Invalid sketch name %r: use letters, digits, '_', '-' and '.'." % (name,))
+
+
+def is_loopback(host):
+    """ Return True if host (an address or a host name) only resolves to loopback addresses. """
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(infos) and all(ipaddress.ip_address(info[4][0].split("%")[0]).is_loopback for info in infos)
+
+
+def _answer(authkey, side, challenge):
+    """ The answer to a challenge; side keeps a peer from replaying the other's answer. """
+    return hmac.new(authkey, side + challenge, "sha256").digest()
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by the server.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class SketchServer:
+    """
+    Hosts named sketches and serves insert, query and merge requests. If a
+    snapshot directory is given, the sketches found there are loaded at start,
+    and all sketches are saved there every snapshot_interval seconds and when
+    the server stops. Sketches with checkpoint support (CountMin, F2Estimate,
+    BloomFilter) are saved incrementally, others are pickled.
+    """
+
+    def __init__(self, sketches=None, snapshot_dir=None, snapshot_interval=None, authkey=None):
+        """
+        sketches: dict of the sketches to host, by name.
+        snapshot_dir: directory of the snapshots, or None for no snapshots.
+        snapshot_interval: seconds between two snapshots, or None to save only at stop.
+        authkey: bytes shared with the clients, required to serve over TCP.
+        """
+        self._authkey = authkey
+        self._sketches = {}
+        for name, sketch in (sketches or {}).items():
+            self.add(name, sketch)
+        self._snapshot_dir = snapshot_dir
+        self._snapshot_interval = snapshot_interval
+        self._server = None
+        self._snapshot_task = None
+        self._thread = None
+        self._loop = None
+        if snapshot_dir is not None:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            self._load_snapshots()
+
+    def add(self, name, sketch):
+        """ Host a sketch under a name, replacing any sketch of that name. """
+        _check_name(name)
+        self._sketches[name] = sketch
+
+    def __getitem__(self, name):
+        return self._sketches[name]
+
+    def __contains__(self, name):
+        return name in self._sketches
+
+    def names(self):
+        """ Return the names of the hosted sketches. """
+        return sorted(self._sketches)
+
+    # ----------------------------------------------------------------------
+    # Snapshots
+
+    def _load_snapshots(self):
+        for path in glob.glob(os.path.join(self._snapshot_dir, "*.ckpt")):
+            self._sketches[os.path.basename(path)[:-5]] = CheckpointMixin.restore(path)
+        for path in glob.glob(os.path.join(self._snapshot_dir, "*.pkl")):
+            with open(path, "rb") as f:
+                self._sketches[os.path.basename(path)[:-4]] = pickle.load(f)
+
+    def snapshot(self):
+        """ Save all sketches to the snapshot directory and return the number of bytes written. """
+        if self._snapshot_dir is None:
+            return 0
+        written = 0
+        for name, sketch in self._sketches.items():
+            if isinstance(sketch, CheckpointMixin):
+                written += sketch.checkpoint(os.path.join(self._snapshot_dir, name + ".ckpt"))
+                continue
+            path = os.path.join(self._snapshot_dir, name + ".pkl")
+            data = pickle.dumps(sketch, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            written += len(data)
+        return written
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self._snapshot_interval)
+            try:
+                self.snapshot()
+            except Exception:
+                # Keep serving and try again at the next interval
+                logger.exception("Snapshot to %s failed.", self._snapshot_dir)
+
+    # ----------------------------------------------------------------------
+    # Requests
+
+    def _sketch(self, name):
+        if name not in self._sketches:
+            raise KeyError("No sketch named %r." % name)
+        return self._sketches[name]
+
+    def handle(self, request):
+        """ Execute a request tuple and return its result. """
+        op, args = request[0], request[1:]
+        if op == "insert":
+            name, tokens, counts = args
+            insert_batch(self._sketch(name), tokens, counts)
+            return len(tokens)
+        if op == "query":
+            name, method, method_args, method_kwargs = args
+            if method not in QUERY_METHODS:
+                raise AttributeError("Cannot call %r: queries are limited to read-only methods." % (method,))
+            return getattr(self._sketch(name), method)(*method_args, **method_kwargs)
+        if op == "merge":
+            name, sketch = args
+            _check_name(name)
+            if name in self._sketches:
+                self._sketches[name].merge(sketch)
+            else:
+                self._sketches[name] = sketch
+            return None
+        if op == "create":
+            name, sketch = args
+            _check_name(name)
+            created = name not in self._sketches
+            if created:
+                self._sketches[name] = sketch
+            return created
+        if op == "get":
+            return self._sketch(args[0])
+        if op == "names":
+            return self.names()
+        if op == "snapshot":
+            return self.snapshot()
+        raise ValueError("Unknown request %r." % op)
+
+    async def _authenticate(self, reader, writer):
+        """ Return True if the peer proved that it knows the key, after proving it ourselves. """
+        challenge = os.urandom(_CHALLENGE_SIZE)
+        writer.write(challenge)
+        await writer.drain()
+        answer = await reader.readexactly(_CHALLENGE_SIZE)
+        peer_challenge = await reader.readexactly(_CHALLENGE_SIZE)
+        if not hmac.compare_digest(answer, _answer(self._authkey, b"client", challenge)):
+            return False
+        writer.write(_answer(self._authkey, b"server", peer_challenge))
+        await writer.drain()
+        return True
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            if self._authkey is not None and not await self._authenticate(reader, writer):
+                logger.warning("Closed a connection that failed authentication.")
+                return
+            while True:
+                header = await reader.readexactly(_LENGTH.size)
+                request = pickle.loads(await reader.readexactly(_LENGTH.unpack(header)[0]))
+                try:
+                    response = ("ok", self.handle(request))
+                except Exception as e:
+                    response = ("error", "%s: %s" % (type(e).__name__, e))
+                writer.write(_pack(response))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # ----------------------------------------------------------------------
+    # Running the server
+
+    async def start(self, address):
+        """
+        Start serving on address, the path of a Unix socket or a (host, port)
+        tuple with a loopback host; port 0 picks a free port. Returns the address served.
+        """
+        if isinstance(address, str):
+            self._server = await asyncio.start_unix_server(self._handle_connection, sock=self._unix_socket(address))
+        else:
+            host, port = address
+            if not is_loopback(host):
+                raise ValueError("Refusing to serve on %r: requests are unpickled, so TCP is "
+                                 "limited to loopback addresses." % (host,))
+            if self._authkey is None:
+                raise ValueError("Refusing to serve on TCP without an authkey: requests are unpickled, "
+                                 "so clients must authenticate.")
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+            address = self._server.sockets[0].getsockname()[:2]
+        if self._snapshot_dir is not None and self._snapshot_interval:
+            self._snapshot_task = asyncio.ensure_future(self._snapshot_loop())
+        return address
+
+    @staticmethod
+    def _unix_socket(path):
+        """ Bind a Unix socket at path that only our user can connect to. """
+        try:
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise ValueError("Refusing to replace %r: it exists and is not a socket." % (path,))
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(path)
+            # Connections are refused until the server listens, after the mode is set
+            os.chmod(path, 0o600)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def stop(self):
+        """ Stop serving and save a last snapshot. """
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.snapshot()
+
+    def serve_forever(self, address):
+        """ Serve on address until interrupted. """
+        async def run():
+            await self.start(address)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await self.stop()
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+
+    def start_background(self, address):
+        """ Serve on address from an event loop in a background thread and return the address served. """
+        started = threading.Event()
+        result = {}
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                result["address"] = self._loop.run_until_complete(self.start(address))
+            except Exception as e:
+                result["error"] = e
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        if "error" in result:
+            raise result["error"]
+        return result["address"]
+
+    def stop_background(self):
+        """ Stop a server started with start_background. """
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_background()
+
+# --------------------------------------------------------------------------
+
+class SketchClient:
+    """
+    Client of a SketchServer. Inserts are buffered per sketch and sent as one
+    batch when batch_size tokens are buffered, when the sketch is queried, on
+    flush() and on close(). Connections are kept in a pool, so the client can
+    be shared by several threads.
+    """
+
+    def __init__(self, address, batch_size=10000, pool_size=4, timeout=None, authkey=None):
+        """
+        address: the path of a Unix socket or a (host, port) tuple.
+        batch_size: number of buffered tokens that triggers a send.
+        pool_size: maximum number of idle connections kept open.
+        timeout: socket timeout in seconds.
+        authkey: the key of the server, if it has one.
+        """
+        self._address = address
+        self._authkey = authkey
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if isinstance(self._address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._address if isinstance(self._address, str) else tuple(self._address))
+            if self._authkey is not None:
+                self._authenticate(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _authenticate(self, sock):
+        challenge = _recv_exactly(sock, _CHALLENGE_SIZE)
+        own_challenge = os.urandom(_CHALLENGE_SIZE)
+        sock.sendall(_answer(self._authkey, b"client", challenge) + own_challenge)
+        try:
+            answer = _recv_exactly(sock, _CHALLENGE_SIZE)
+        except ConnectionError:
+            raise SketchServerError("The server rejected the authentication key.")
+        if not hmac.compare_digest(answer, _answer(self._authkey, b"server", own_challenge)):
+            raise SketchServerError("The server failed to authenticate.")
+
+    @contextmanager
+    def _connection(self):
+        try:
+            sock = self._pool.get_nowait()
+        except queue.Empty:
+            sock = self._connect()
+        try:
+            yield sock
+        except BaseException:
+            sock.close()
+            raise
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def request(self, *request):
+        """ Send a request tuple and return the result. """
+        with self._connection() as sock:
+            sock.sendall(_pack(request))
+            length = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))[0]
+            status, value = pickle.loads(_recv_exactly(sock, length))
+        if status != "ok":
+            raise SketchServerError(value)
+        return value
+
+    def create(self, name, sketch):
+        """ Host sketch under name on the server, unless a sketch of that name
+            exists. Returns True if the sketch was created. """
+        return self.request("create", name, sketch)
+
+    def insert(self, name, token, count=None):
+        """ Buffer a token (with a count for weighted sketches) for the sketch name. """
+        self.insert_many(name, [token], None if count is None else [count])
+
+    def insert_many(self, name, tokens, counts=None):
+        """ Buffer a batch of tokens, optionally with their counts, for the sketch name. """
+        with self._lock:
+            buffered, buffered_counts = self._buffers.setdefault(name, ([], None))
+            if counts is not None and buffered_counts is None:
+                buffered_counts = [1] * len(buffered)
+            if buffered_counts is not None:
+                buffered_counts.extend([1] * len(tokens) if counts is None else counts)
+            buffered.extend(tokens)
+            self._buffers[name] = (buffered, buffered_counts)
+            full = len(buffered) >= self._batch_size
+        if full:
+            self.flush(name)
+
+    def flush(self, name=None):
+        """ Send the buffered inserts of a sketch (default: of all sketches). """
+        with self._lock:
+            names = list(self._buffers) if name is None else [name]
+            batches = [(n, self._buffers.pop(n)) for n in names if n in self._buffers]
+        for i, (n, (tokens, counts)) in enumerate(batches):
+            try:
+                if tokens:
+                    self.request("insert", n, tokens, counts)
+            except BaseException:
+                # Keep the batches that were not acknowledged for the next flush
+                for unsent, (unsent_tokens, unsent_counts) in batches[i:]:
+                    self._requeue(unsent, unsent_tokens, unsent_counts)
+                raise
+
+    def _requeue(self, name, tokens, counts):
+        """ Put a batch back in front of the tokens buffered since it was taken. """
+        with self._lock:
+            buffered, buffered_counts = self._buffers.get(name, ([], None))
+            if counts is not None or buffered_counts is not None:
+                counts = ([1] * len(tokens) if counts is None else counts) + \
+                         ([1] * len(buffered) if buffered_counts is None else buffered_counts)
+            self._buffers[name] = (tokens + buffered, counts)
+
+    def query(self, name, method, *args, **kwargs):
+        """ Call a method of the sketch name on the server, after sending its buffered inserts. """
+        self.flush(name)
+        return self.request("query", name, method, args, kwargs)
+
+    def merge(self, name, sketch):
+        """ Merge a local sketch into the sketch name, or host it if there is none. """
+        self.flush(name)
+        return self.request("merge", name, sketch)
+
+    def get(self, name):
+        """ Return a copy of the sketch name. """
+        self.flush(name)
+        return self.request("get", name)
+
+    def names(self):
+        """ Return the names of the sketches on the server. """
+        return self.request("names")
+
+    def snapshot(self):
+        """ Send all buffered inserts and ask the server to save its sketches. """
+        self.flush()
+        return self.request("snapshot")
+
+    def close(self):
+        """ Send all buffered inserts and close the connections. """
+        self.flush()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m sketchlib.server",
+                                     description="Serve named sketches over a local socket.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--unix", default=None, help="path of the Unix socket")
+    group.add_argument("--port", type=int, default=None, help="TCP port")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP loopback host (default: 127.0.0.1)")
+    parser.add_argument("--authkey-file", default=None,
+                        help="file holding the key that clients must know (required with --port)")
+    parser.add_argument("--snapshot-dir", default=None, help="directory of the snapshots")
+    parser.add_argument("--snapshot-interval", type=float, default=None, help="seconds between snapshots")
+    args = parser.parse_args(argv)
+    if not is_loopback(args.host):
+        parser.error("--host must be a loopback address, since requests are unpickled")
+    if args.port is not None and args.authkey_file is None:
+        parser.error("--port requires --authkey-file, since requests are unpickled")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    authkey = None
+    if args.authkey_file is not None:
+        with open(args.authkey_file, "rb") as f:
+            authkey = f.read().strip()
+    server = SketchServer(snapshot_dir=args.snapshot_dir, snapshot_interval=args.snapshot_interval,
+                          authkey=authkey)
+    server.serve_forever(args.unix if args.unix is not None else (args.host, args.port))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Sketches shared by several writer threads without a global lock.
+
+Each thread inserts into its own replica of the sketch, created with
+from_existing, so writers do not wait for each other. The replicas are merged
+into a base sketch when the sketch is queried, or periodically on a timer.
+Only the replicas written since the last merge are merged, so queries on a
+sketch that did not change keep hitting its cached results (see
+sketchlib.versioning), and the replicas of threads that exited are dropped once
+merged.
+"""
+import threading
+
+
+class _Shard:
+    """ A replica of the sketch, the lock that protects it, whether it was written
+    since the last merge, and the thread that owns it (None for a stripe). """
+
+    def __init__(self, sketch, thread=None):
+        self.sketch = sketch
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.thread = thread
+
+
+class ShardedSketch:
+    """
+    Wraps a mergeable sketch (any sketch with from_existing and merge) for
+    concurrent writers. By default every writer thread gets its own replica. With
+    stripes=N, threads share N replicas instead, which bounds the memory when
+    there are many threads; this is meant for linear table sketches such as
+    CountMin, BloomFilter or F2Estimate.
+
+    insert and insert_many go to the replica of the calling thread. Any other
+    attribute is read from the base sketch after merging the replicas into it.
+    """
+
+    def __init__(self, sketch, stripes=None, merge_interval=None):
+        """
+        sketch: the base sketch. It receives the merged insertions.
+        stripes: number of shared replicas, or None for one replica per thread.
+        merge_interval: if set, merge the replicas every merge_interval seconds
+            in a background thread (stop it with close).
+        """
+        self._base = sketch
+        # Empty sketch that new replicas are copied from, cheaper to copy than the base
+        self._empty = type(sketch).from_existing(sketch)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stripes = stripes
+        self._shards = []
+        if stripes is not None:
+            self._shards = [_Shard(self._new_replica()) for _ in range(stripes)]
+        self._next_stripe = 0
+
+        self._closed = threading.Event()
+        self._timer = None
+        if merge_interval is not None:
+            self._timer = threading.Thread(target=self._merge_periodically, args=(merge_interval,), daemon=True)
+            self._timer.start()
+
+    def _new_replica(self):
+        return type(self._empty).from_existing(self._empty)
+
+    def _shard(self):
+        """ Return the shard of the calling thread, assigning one on first use. """
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            with self._lock:
+                if self._stripes is None:
+                    shard = _Shard(self._new_replica(), threading.current_thread())
+                    self._shards.append(shard)
+                else:
+                    shard = self._shards[self._next_stripe % self._stripes]
+                    self._next_stripe += 1
+            self._local.shard = shard
+        return shard
+
+    def insert(self, *args, **kwargs):
+        """ Insert into the replica of the calling thread. """
+        shard = self._shard()
+        with shard.lock:
+            shard.sketch.insert(*args, **kwargs)
+            shard.dirty = True
+
+    def insert_many(self, *args, **kwargs):
+        """ Insert a batch into the replica of the calling thread. """
+        shard = self._shard()
+        with shard.lock:
+            shard.sketch.insert_many(*args, **kwargs)
+            shard.dirty = True
+
+    def _merge_shards(self):
+        """ Merge the replicas written since the last merge into the base sketch
+        and reset them, and drop the replicas of threads that exited. Requires self._lock. """
+        for shard in list(self._shards):
+            with shard.lock:
+                # Checked before the merge: a thread that was already gone cannot
+                # have written after it, so its replica is complete once merged
+                alive = shard.thread is None or shard.thread.is_alive()
+                if shard.dirty:
+                    self._base.merge(shard.sketch)
+                    shard.sketch = self._new_replica()
+                    shard.dirty = False
+            if not alive:
+                self._shards.remove(shard)
+
+    def merge_shards(self):
+        """ Merge the replicas into the base sketch now. """
+        with self._lock:
+            self._merge_shards()
+
+    def _merge_periodically(self, interval):
+        while not self._closed.wait(interval):
+            self.merge_shards()
+
+    @property
+    def sketch(self):
+        """ Return the base sketch, after merging the replicas into it. """
+        self.merge_shards()
+        return self._base
+
+    def merge(self, other):
+        """ Merge another sketch, or the base of another ShardedSketch, into this one. """
+        if isinstance(other, ShardedSketch):
+            other = other.sketch
+        with self._lock:
+            self._base.merge(other)
+
+    def close(self):
+        """ Stop the background merges, if any, and merge the replicas a last time. """
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.merge_shards()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not found on the ShardedSketch
+        if "_base" not in self.__dict__:
+            raise AttributeError(name)
+        attr = getattr(self._base, name)
+        if not callable(attr):
+            with self._lock:
+                self._merge_shards()
+                return getattr(self._base, name)
+
+        # Methods merge the replicas when they are called, not when they are looked up
+        def locked(*args, **kwargs):
+            with self._lock:
+                self._merge_shards()
+                return attr(*args, **kwargs)
+        return locked
@@ -0,0 +1,53 @@
+"""
+Sparse tables that become dense.
+
+A sketch with the SparseTableMixin starts with its table set to None and its
+updates kept in a dict, _sparse, whose meaning depends on the sketch (the
+counts of the touched cells for CountMin, the total weight of each key for
+F2Estimate). Once the dict holds more than _sparse_limit entries, the dense
+table is built from it and the dict is dropped. A sketch that receives few
+updates therefore never allocates its table.
+"""
+
+# Fraction of the cells of the table that the sparse dict may hold. A dict
+# entry takes about 100 bytes and a cell 8 bytes, so the sparse dict stays
+# smaller than the table.
+SPARSE_FILL = 1 / 16
+
+
+class SparseTableMixin:
+    """
+    Adds a sparse representation to a sketch whose state is a single NumPy
+    table, _table. Subclasses implement _empty_table and _table_from_sparse, and
+    call _init_sparse from their constructor.
+    """
+
+    _sparse = None
+    _sparse_limit = 0
+
+    def _init_sparse(self, sparse, limit):
+        """ Start with an empty sparse dict of at most limit entries, or with an
+        empty dense table if sparse is False. """
+        self._sparse_limit = limit
+        self._sparse = {} if sparse else None
+        self._table = None if sparse else self._empty_table()
+
+    def is_sparse(self):
+        """ Return True while the sketch has not allocated its dense table. """
+        return self._table is None
+
+    def _check_fill(self):
+        if len(self._sparse) > self._sparse_limit:
+            self._densify()
+
+    def _densify(self):
+        """ Switch to the dense table. """
+        if self._table is None:
+            self._table = self._table_from_sparse()
+            self._sparse = None
+            self._mark_resized()
+
+    def get_table(self):
+        """ Return the dense table. While the sketch is sparse, this is a new array
+        built from the sparse dict, and the sketch stays sparse. """
+        return self._table_from_sparse() if self._table is None else self._table
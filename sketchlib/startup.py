@@ -0,0 +1,110 @@
+"""
+Startup cost of the package.
+
+A short-lived worker that creates many sketches and uses few of them pays for
+importing the package and for constructing every sketch, before any data
+arrives. measure_import times, in a fresh interpreter, the import of the
+package and the first use of a sketch class (which imports its module, see
+sketchlib/__init__.py). measure_constructors times the creation of many sketches
+and reports their size before and after their first insert, which shows the
+tables whose allocation is deferred. The module can also be run as a script:
+
+    python -m sketchlib.startup --count 1000
+"""
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+import sketchlib
+
+# Sketches measured by default, by name, with their constructor parameters
+DEFAULT_SKETCHES = {
+    "CountMin": {"width": 2719, "delta": 0.01},
+    "F2Estimate": {},
+    "BloomFilter": {},
+    "QuantileSketch": {},
+}
+
+_IMPORT_CODE = """
+import time
+start = time.perf_counter()
+import sketchlib
+for name in %r:
+    getattr(sketchlib, name)
+print(time.perf_counter() - start)
+"""
+
+
+def measure_import(names=(), repeats=3):
+    """ Return the median time in seconds to import sketchlib and look up the
+    given names in a fresh interpreter. Interpreter startup is not included. """
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_CODE % (list(names),)],
+                                check=True, capture_output=True, text=True).stdout
+        times.append(float(output))
+    return statistics.median(times)
+
+
+def measure_constructors(sketches=None, count=1000):
+    """
+    Create count instances of each sketch and return one record per sketch, a
+    dict with sketch, params, import (seconds to import the package and the
+    class in a fresh interpreter), construct (seconds per instance), nbytes
+    (size of a new instance) and inserted_nbytes (size after one insert).
+    """
+    sketches = DEFAULT_SKETCHES if sketches is None else sketches
+    records = []
+    for name, params in sketches.items():
+        cls = getattr(sketchlib, name)
+        start = time.perf_counter()
+        instances = [cls(**params) for _ in range(count)]
+        construct = (time.perf_counter() - start) / count
+        sketch = instances[0]
+        empty = sketch.nbytes()
+        sketch.insert_many([1])
+        records.append({"sketch": name, "params": params, "import": measure_import([name]),
+                        "construct": construct, "nbytes": empty, "inserted_nbytes": sketch.nbytes()})
+    return records
+
+
+def format_table(records):
+    """ Format records of measure_constructors as a markdown table. """
+    lines = ["| Sketch | Parameters | Import (ms) | Construct (us) | Bytes | Bytes after insert |",
+             "| --- | --- | --- | --- | --- | --- |"]
+    for r in records:
+        params = ", ".join("%s=%s" % item for item in r["params"].items())
+        lines.append("| %s | %s | %.1f | %.1f | %d | %d |" % (
+            r["sketch"], params, 1000 * r["import"], 10**6 * r["construct"], r["nbytes"], r["inserted_nbytes"]))
+    return "\n".join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m sketchlib.startup",
+                                     description="Measure the import time of the package and the construction "
+                                                 "time and size of sketches.")
+    parser.add_argument("sketches", nargs="*", help="sketch classes to measure (default: %s)"
+                        % ", ".join(DEFAULT_SKETCHES))
+    parser.add_argument("--count", type=int, default=1000, help="number of instances of each sketch to create")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, stdout=None):
+    """ Run the benchmark from the command line and return the exit code. """
+    args = parse_args(argv)
+    stdout = sys.stdout if stdout is None else stdout
+    unknown = [name for name in args.sketches if name not in sketchlib.__all__]
+    if unknown:
+        print("Unknown sketch: %s" % ", ".join(unknown), file=sys.stderr)
+        return 2
+    sketches = {name: DEFAULT_SKETCHES.get(name, {}) for name in args.sketches} or None
+
+    print("import sketchlib: %.1f ms" % (1000 * measure_import()), file=stdout)
+    print(format_table(measure_constructors(sketches, args.count)), file=stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
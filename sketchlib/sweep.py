@@ -0,0 +1,279 @@
+"""
+Accuracy-versus-resources sweeps.
+
+sweep(cls, grid, stream) builds one sketch per combination of the parameter
+grid, feeds it the stream and records the observed error against the exact
+answer, the insert throughput and the size in bytes. pareto_frontier keeps the
+configurations that no other configuration beats on all three, and cheapest
+picks the smallest one that meets an error target.
+
+Streams are synthetic (zipf_stream, uniform_stream, seeded so that sweeps are
+reproducible) or replayed from a file (replay_stream). The module can also be
+run as a script:
+
+    python -m sketchlib.sweep CountMin --stream zipf --length 100000 --max-error 0.001
+    python -m sketchlib.sweep LogDistinctCount --stream access.log --field 0
+"""
+import sys
+import time
+import argparse
+import itertools
+import inspect
+from collections import Counter
+import numpy as np
+
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.minhash import MinHash
+from sketchlib.quantile_sketch import QuantileSketch
+from sketchlib._inserting import is_weighted
+from sketchlib._reading import read_chunks, make_extractor, quantile_values
+
+# Parameter grids swept by default
+DEFAULT_GRIDS = {
+    CountMin: {"width": [100, 300, 1000, 3000, 10000], "delta": [0.1, 0.01]},
+    F2Estimate: {"epsilon": [0.5, 0.3, 0.2, 0.1], "delta": [0.25, 0.1]},
+    LogDistinctCount: {"epsilon": [0.3, 0.2, 0.1, 0.05], "delta": [0.25, 0.1]},
+    MinHash: {"epsilon": [0.3, 0.2, 0.1, 0.05]},
+    QuantileSketch: {"epsilon": [0.2, 0.1, 0.05, 0.02], "delta": [0.1, 0.01]},
+}
+
+# Quantiles whose rank error is measured for QuantileSketch
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def zipf_stream(length=20000, alpha=1.2, universe=10**5, seed=0):
+    """ Return a stream of integers in [1, universe] with Zipf-distributed frequencies. """
+    rng = np.random.default_rng(seed)
+    return (rng.zipf(alpha, length) - 1) % universe + 1
+
+
+def uniform_stream(length=20000, universe=10**5, seed=0):
+    """ Return a stream of integers drawn uniformly from [1, universe]. """
+    return np.random.default_rng(seed).integers(1, universe + 1, length)
+
+
+def replay_stream(path, field=None, delimiter=None, regex=None):
+    """ Return the values of a file as a list of bytes, one per line, extracted
+        as with the command-line tool (see sketchlib.__main__). """
+    extract = make_extractor(field, delimiter, regex)
+    tokens = []
+    with open(path, "rb") as f:
+        for chunk in read_chunks(f):
+            tokens.extend(extract(chunk))
+    return tokens
+
+
+def _tokens(stream):
+    """ Python values of a stream, as inserted one by one. """
+    return stream.tolist() if isinstance(stream, np.ndarray) else list(stream)
+
+
+def _feed(sketch, tokens, batch):
+    """ Insert tokens into a sketch and return the elapsed time. """
+    start = time.perf_counter()
+    if batch:
+        sketch.insert_many(tokens)
+    elif is_weighted(sketch):
+        for token in tokens:
+            sketch.insert(token, 1)
+    else:
+        for token in tokens:
+            sketch.insert(token)
+    return time.perf_counter() - start
+
+
+def _count_min_error(sketch, tokens, batch):
+    """ Largest additive error of a count, as a fraction of the stream length. """
+    elapsed = _feed(sketch, tokens, batch)
+    counts = Counter(tokens)
+    error = max(abs(sketch.estimate_count(token) - count) for token, count in counts.items())
+    return error / len(tokens), elapsed, len(tokens)
+
+
+def _f2_error(sketch, tokens, batch):
+    """ Relative error of the second frequency moment. """
+    elapsed = _feed(sketch, tokens, batch)
+    f2 = sum(count * count for count in Counter(tokens).values())
+    return abs(sketch.estimator() - f2) / f2, elapsed, len(tokens)
+
+
+def _distinct_error(sketch, tokens, batch):
+    """ Relative error of the number of distinct values. """
+    elapsed = _feed(sketch, tokens, batch)
+    distinct = len(set(tokens))
+    return abs(sketch.estimator() - distinct) / distinct, elapsed, len(tokens)
+
+
+def _jaccard_error(sketch, tokens, batch):
+    """ Absolute error of the Jaccard similarity of the first two thirds and
+        the last two thirds of the stream. """
+    third = len(tokens) // 3
+    first, second = tokens[:2 * third], tokens[third:]
+    other = type(sketch).from_existing(sketch)
+    elapsed = _feed(sketch, first, batch) + _feed(other, second, batch)
+    a, b = set(first), set(second)
+    jaccard = len(a & b) / len(a | b)
+    return abs(sketch.estimate_jaccard_similarity(other) - jaccard), elapsed, len(first) + len(second)
+
+
+def _quantile_error(sketch, tokens, batch):
+    """ Largest rank error over QUANTILES, as a fraction of the stream length. """
+    values, _ = quantile_values(tokens, sketch._range_elements)
+    elapsed = _feed(sketch, values, batch)
+    values = np.sort(values)
+    error = 0.0
+    for q in QUANTILES:
+        x = sketch.query(q)
+        low = np.searchsorted(values, x, side="left") / len(values)
+        high = np.searchsorted(values, x, side="right") / len(values)
+        error = max(error, low - q, q - high, 0.0)
+    return error, elapsed, len(values)
+
+
+_EVALUATORS = {
+    CountMin: _count_min_error,
+    F2Estimate: _f2_error,
+    LogDistinctCount: _distinct_error,
+    MinHash: _jaccard_error,
+    QuantileSketch: _quantile_error,
+}
+
+
+def _configurations(grid):
+    """ All combinations of a parameter grid, as dicts. """
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def sweep(cls, grid=None, stream=None, batch=False, repeats=1):
+    """
+    Sweep the parameter grid of a sketch class on a stream.
+
+    cls: CountMin, F2Estimate, LogDistinctCount, MinHash or QuantileSketch.
+    grid: dict mapping constructor parameters to lists of values (default: DEFAULT_GRIDS[cls]).
+    stream: list or array of tokens (default: zipf_stream()). QuantileSketch
+        uses the integer values of the stream; its n defaults to the largest one.
+    batch: insert with insert_many instead of one insert per token.
+    repeats: number of runs per configuration, with seeds 42, 43, ... when the
+        class takes a seed. Errors and throughputs are averaged.
+
+    Returns one record per configuration: a dict with the sketch name, the
+    parameters, the observed error, the throughput (inserts per second) and the
+    size in bytes after the stream.
+    """
+    if cls not in _EVALUATORS:
+        raise TypeError("No sweep for %s." % cls.__name__)
+    grid = DEFAULT_GRIDS[cls] if grid is None else grid
+    tokens = _tokens(zipf_stream() if stream is None else stream)
+    evaluate = _EVALUATORS[cls]
+    takes_seed = "seed" in inspect.signature(cls).parameters
+
+    records = []
+    for params in _configurations(grid):
+        if cls is QuantileSketch and "n" not in params:
+            values, _ = quantile_values(tokens, float("inf"))
+            params = dict(params, n=max(values))
+        errors, elapsed, inserted = [], 0.0, 0
+        for r in range(repeats):
+            kwargs = dict(params, seed=42 + r) if takes_seed and "seed" not in params and repeats > 1 else params
+            sketch = cls(**kwargs)
+            error, seconds, count = evaluate(sketch, tokens, batch)
+            errors.append(error)
+            elapsed += seconds
+            inserted += count
+        records.append({"sketch": cls.__name__, "params": params, "error": float(np.mean(errors)),
+                        "throughput": inserted / elapsed if elapsed > 0 else float("inf"),
+                        "nbytes": sketch.nbytes()})
+    return records
+
+
+def _dominates(a, b):
+    """ Return True if record a is at least as good as b on error, size and
+        throughput, and better on one of them. """
+    at_least = a["error"] <= b["error"] and a["nbytes"] <= b["nbytes"] and a["throughput"] >= b["throughput"]
+    better = a["error"] < b["error"] or a["nbytes"] < b["nbytes"] or a["throughput"] > b["throughput"]
+    return at_least and better
+
+
+def pareto_frontier(records):
+    """ Return the records that are not dominated by another one on error, size
+        and throughput, sorted by size. """
+    frontier = [r for r in records if not any(_dominates(other, r) for other in records)]
+    return sorted(frontier, key=lambda r: (r["nbytes"], r["error"]))
+
+
+def cheapest(records, max_error, cost="nbytes"):
+    """ Return the record with the lowest cost ("nbytes", or "throughput" for the
+        fastest) among those whose error is at most max_error, or None. """
+    feasible = [r for r in records if r["error"] <= max_error]
+    if not feasible:
+        return None
+    if cost == "throughput":
+        return max(feasible, key=lambda r: r["throughput"])
+    return min(feasible, key=lambda r: (r[cost], r["error"]))
+
+
+def format_table(records, frontier=None):
+    """ Format records as a markdown table. Records on the frontier, if given, are marked with *. """
+    frontier_ids = set() if frontier is None else {id(r) for r in frontier}
+    lines = ["| sketch | parameters | error | bytes | inserts/s | frontier |",
+             "| --- | --- | --- | --- | --- | --- |"]
+    for r in records:
+        params = ", ".join("%s=%s" % item for item in r["params"].items())
+        lines.append("| %s | %s | %.4g | %d | %.0f | %s |" % (
+            r["sketch"], params, r["error"], r["nbytes"], r["throughput"], "*" if id(r) in frontier_ids else ""))
+    return "\n".join(lines)
+
+
+_CLASSES = {cls.__name__: cls for cls in _EVALUATORS}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m sketchlib.sweep",
+                                     description="Sweep the parameters of a sketch and print the error, "
+                                                 "throughput and size of each configuration.")
+    parser.add_argument("sketch", choices=sorted(_CLASSES))
+    parser.add_argument("--stream", default="zipf", help="zipf, uniform or the path of a file to replay")
+    parser.add_argument("--length", type=int, default=20000, help="length of a synthetic stream")
+    parser.add_argument("--alpha", type=float, default=1.2, help="exponent of the zipf stream")
+    parser.add_argument("--universe", type=int, default=10**5, help="values of a synthetic stream are in [1, universe]")
+    parser.add_argument("--seed", type=int, default=0, help="seed of a synthetic stream")
+    parser.add_argument("--field", type=int, default=None, help="0-based column of a replayed file")
+    parser.add_argument("--delimiter", default=None, help="column delimiter (default: whitespace)")
+    parser.add_argument("--regex", default=None, help="extract the first group (or the match) of a regex")
+    parser.add_argument("--batch", action="store_true", help="insert with insert_many")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--max-error", type=float, default=None, help="print the cheapest configuration within this error")
+    parser.add_argument("--frontier-only", action="store_true", help="print only the Pareto frontier")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, stdout=None):
+    """ Run a sweep from the command line and return the exit code. """
+    args = parse_args(argv)
+    stdout = sys.stdout if stdout is None else stdout
+    if args.stream == "zipf":
+        stream = zipf_stream(args.length, args.alpha, args.universe, args.seed)
+    elif args.stream == "uniform":
+        stream = uniform_stream(args.length, args.universe, args.seed)
+    else:
+        stream = replay_stream(args.stream, args.field, args.delimiter, args.regex)
+
+    records = sweep(_CLASSES[args.sketch], stream=stream, batch=args.batch, repeats=args.repeats)
+    frontier = pareto_frontier(records)
+    print(format_table(frontier if args.frontier_only else records, frontier), file=stdout)
+    if args.max_error is not None:
+        best = cheapest(frontier, args.max_error)
+        if best is None:
+            print("\nNo configuration has an error of at most %g." % args.max_error, file=stdout)
+        else:
+            print("\nCheapest configuration with an error of at most %g: %s" % (args.max_error, best["params"]),
+                  file=stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
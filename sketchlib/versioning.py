@@ -0,0 +1,57 @@
+"""
+Mutation versions and memoized queries.
+
+A sketch with the VersionedMixin counts its mutations in _version: every
+method that changes the sketch calls _bump_version (sketches with the
+CheckpointMixin do so through _mark_dirty). Query methods decorated with
+memoized keep their results until the version changes, so polling a sketch
+that has not changed costs a dictionary lookup.
+"""
+import functools
+
+# Maximum number of distinct queries kept per version
+MAX_CACHED_QUERIES = 128
+
+
+class VersionedMixin:
+    """ Adds a mutation version counter to a sketch. """
+
+    _version = 0
+
+    def _bump_version(self):
+        self._version += 1
+
+    def version(self):
+        """ Return the number of mutations of the sketch so far. """
+        return self._version
+
+
+def _copy(result):
+    """ Copy mutable results, so that callers cannot change the cached ones. """
+    if isinstance(result, (dict, list, set)):
+        return result.copy()
+    return result
+
+
+def memoized(method):
+    """ Cache the results of a query method of a VersionedMixin for the current version. """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.__dict__.get("_query_cache")
+        if cache is None or cache[0] != self._version:
+            cache = (self._version, {})
+            self._query_cache = cache
+        results = cache[1]
+        try:
+            key = (name, args, tuple(sorted(kwargs.items())))
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        if key not in results:
+            if len(results) >= MAX_CACHED_QUERIES:
+                results.clear()
+            results[key] = method(self, *args, **kwargs)
+        return _copy(results[key])
+    return wrapper
@@ -1,5 +1,6 @@
 import unittest
-from sketchlib.bloom_filter import BloomFilter
+import numpy as np
+from sketchlib.bloom_filter import BloomFilter, BlockedBloomFilter, ScalableBloomFilter
 import random
 import string
 
@@ -93,6 +94,140 @@ class TestBloomFilter(unittest.TestCase):
             if bf_large.membership(elem):
                 false_positives += 1
 
+    def test_batch_matches_scalar(self):
+        bf1 = BloomFilter(n=5000, delta=0.01)
+        bf2 = BloomFilter.from_existing(bf1)
+        tokens = [random_string() for _ in range(2000)]
+        bf1.insert_many(tokens)
+        bf1.insert_many(np.arange(1000, dtype=np.uint64))
+        for token in tokens:
+            bf2.insert(token)
+        for i in range(1000):
+            bf2.insert(i)
+        self.assertTrue(np.array_equal(bf1.get_filter(), bf2.get_filter()))
+
+        queries = tokens[:100] + [random_string() for _ in range(100)]
+        self.assertEqual(list(bf1.contains_many(queries, chunk_size=64)), [bf2.membership(q) for q in queries])
+        self.assertTrue(bf1.contains_many(np.arange(1000)).all())
+        self.assertLess(bf1.contains_many(np.arange(10**6, 10**6 + 10000)).mean(), 0.02)
+
+    def test_fold(self):
+        bf = BloomFilter(n=1000, delta=0.01)
+        bf.insert_many(np.arange(1000))
+        half = BloomFilter.from_existing(bf)
+        half.fold(2)
+        self.assertEqual(half._m, bf._m // 2)
+        self.assertEqual(BloomFilter.from_existing(half)._m, half._m)
+
+        # Folding keeps every element, and merges with an unfolded filter
+        half.insert_many(np.arange(1000, 2000))
+        merged = bf + half
+        self.assertEqual(merged._m, half._m)
+        self.assertTrue(merged.contains_many(np.arange(2000)).all())
+        bf.fold(2)
+        self.assertTrue(bf.contains_many(np.arange(1000)).all())
+        self.assertTrue(np.array_equal(merged.get_filter(), bf.get_filter() + half.get_filter()))
+
+        # A filter with other hash functions is rejected before anything is folded
+        unfolded = BloomFilter(n=1000, delta=0.01)
+        with self.assertRaises(ValueError):
+            unfolded.merge(BloomFilter(n=1000, delta=0.01, seed=7))
+        with self.assertRaises(ValueError):
+            unfolded.merge(BloomFilter(n=300, delta=0.01))
+        self.assertEqual(unfolded._m, half._m * 2)
+
+
+class TestBlockedBloomFilter(unittest.TestCase):
+
+    def test_operations_and_merge(self):
+        bf = BlockedBloomFilter(n=1000, delta=0.01)
+        for elem in ['apple', 'banana', 'cherry']:
+            bf.insert(elem)
+        for elem in ['apple', 'banana', 'cherry']:
+            self.assertTrue(bf.membership(elem))
+        for elem in ['dragonfruit', 'elderberry', 'fig']:
+            self.assertFalse(bf.membership(elem))
+
+        bf2 = BlockedBloomFilter.from_existing(bf)
+        bf2.insert('grape')
+        bf3 = bf + bf2
+        bf.merge(bf2)
+        for elem in ['apple', 'grape']:
+            self.assertTrue(bf.membership(elem))
+            self.assertTrue(bf3.membership(elem))
+
+        # Filters with other seeds or sizes are rejected, and bf is left unchanged
+        for other in [BlockedBloomFilter(n=1000, delta=0.01, seed=7), BlockedBloomFilter(n=5000, delta=0.01),
+                      BlockedBloomFilter(n=1000, delta=0.001)]:
+            with self.assertRaises(ValueError):
+                bf.merge(other)
+        with self.assertRaises(ValueError):
+            bf + BlockedBloomFilter(n=1000, delta=0.01, seed=7)
+        self.assertTrue(np.array_equal(bf.get_filter(), bf3.get_filter()))
+
+    def test_batch_matches_scalar(self):
+        bf = BlockedBloomFilter(n=10000, delta=0.01)
+        bf.insert_many(np.arange(0, 10000, 2))
+        bf.insert_many([random_string() for _ in range(100)] + ['apple'])
+        for i in range(1, 10000, 2):
+            bf.insert(i)
+
+        keys = np.arange(20000)
+        result = bf.contains_many(keys, chunk_size=1000)
+        self.assertTrue(result[:10000].all())
+        self.assertEqual(list(result[10000:10500]), [bf.membership(i) for i in range(10000, 10500)])
+        self.assertTrue(bf.contains_many(['apple'])[0])
+
+    def test_false_positive_rate(self):
+        n, delta = 100000, 0.01
+        bf = BlockedBloomFilter(n=n, delta=delta)
+        self.assertLessEqual(bf.expected_false_positive_rate(), delta)
+
+        bf.insert_many(np.arange(n))
+        self.assertTrue(bf.contains_many(np.arange(n)).all())
+        false_positive_rate = bf.contains_many(np.arange(n, 11 * n)).mean()
+        self.assertLessEqual(false_positive_rate, 1.2 * delta)
+
+
+class TestScalableBloomFilter(unittest.TestCase):
+
+    def test_growth_and_false_positive_rate(self):
+        delta = 0.01
+        bf = ScalableBloomFilter(n=1000, delta=delta)
+        for i in range(30000):
+            bf.insert(i)
+
+        # The filter grew beyond its initial capacity and keeps all elements
+        self.assertGreater(len(bf._filters), 4)
+        self.assertTrue(all(bf.membership(i) for i in range(30000)))
+
+        false_positives = sum(bf.membership(i) for i in range(10**6, 10**6 + 50000))
+        self.assertLessEqual(false_positives, 1.2 * delta * 50000)
+
+    def test_merge(self):
+        bf = ScalableBloomFilter(n=100, delta=0.01)
+        bf2 = ScalableBloomFilter.from_existing(bf)
+        for i in range(500):
+            bf.insert(str(i))
+        for i in range(500, 1000):
+            bf2.insert(str(i))
+        bf.insert('apple')
+        self.assertTrue(490 <= len(bf) <= 501)
+
+        bf3 = bf + bf2
+        self.assertTrue(all(bf3.membership(str(i)) for i in range(1000)))
+        bf2.merge(bf)
+        self.assertTrue(all(bf2.membership(str(i)) for i in range(1000)))
+
+        # Filters with other parameters are rejected before anything is merged
+        for other in [ScalableBloomFilter(n=100, delta=0.01, seed=7), ScalableBloomFilter(n=200, delta=0.01),
+                      ScalableBloomFilter(n=100, delta=0.01, growth=4)]:
+            for i in range(500):
+                other.insert(str(i))
+            with self.assertRaises(ValueError):
+                bf.merge(other)
+        self.assertTrue(490 <= len(bf) <= 501)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+import os
+import copy
+import tempfile
+import unittest
+import numpy as np
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.bloom_filter import BloomFilter
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "sketch.log")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_deltas_and_restore(self):
+        cm = CountMin(width=10**5, delta=0.01, sparse=False)
+        cm.insert_many(np.arange(1000))
+        base = cm.checkpoint(self.path)
+        for i in range(5):
+            cm.insert("token%d" % i, i + 1)
+            self.assertLess(cm.checkpoint(self.path), base / 20)
+        restored = CountMin.restore(self.path)
+        self.assertTrue(np.array_equal(restored._table, cm._table))
+        self.assertEqual(restored.estimate_count("token4"), 5)
+
+        # The restored sketch continues the same log
+        restored.merge(cm)
+        restored.checkpoint(self.path)
+        self.assertTrue(np.array_equal(CountMin.restore(self.path)._table, 2 * cm._table))
+
+        with self.assertRaises(TypeError):
+            BloomFilter.restore(self.path)
+
+    def test_incomplete_record_and_compaction(self):
+        bf = BloomFilter(n=1000, delta=0.01)
+        bf.checkpoint(self.path)
+        bf.insert_many(["apple", "kiwi"])
+        bf.checkpoint(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x00\x00\x00\x00partial")
+        restored = BloomFilter.restore(self.path)
+        self.assertTrue(restored.membership("kiwi"))
+
+        restored.delete("kiwi")
+        restored.checkpoint(self.path)
+        self.assertFalse(BloomFilter.restore(self.path).membership("kiwi"))
+
+        for i in range(5):
+            restored.insert(i)
+            restored.checkpoint(self.path, compact_every=2)
+        self.assertLess(restored._checkpoint_deltas, 2)
+        self.assertTrue(np.array_equal(BloomFilter.restore(self.path).get_filter(), restored.get_filter()))
+
+    def test_copies_do_not_track(self):
+        f2 = F2Estimate(epsilon=0.1, delta=0.1, sparse=False)
+        f2.checkpoint(self.path)
+        f2.insert("apple", 3)
+        self.assertIsNone(copy.deepcopy(f2)._dirty)
+        self.assertIsNone(F2Estimate.from_existing(f2)._dirty)
+        f2.checkpoint(self.path)
+        self.assertTrue(np.array_equal(F2Estimate.restore(self.path)._table, f2._table))
+
+    def test_fold_writes_a_new_base(self):
+        cm = CountMin(width=4096, delta=0.1)
+        cm.checkpoint(self.path)
+        cm.insert_many(np.arange(100))
+        cm.fold(8)
+        self.assertGreater(cm.checkpoint(self.path), cm._table.nbytes)
+        restored = CountMin.restore(self.path)
+        self.assertEqual(restored._width, 512)
+        self.assertTrue(np.array_equal(restored._table, cm._table))
+
+
+if __name__ == "__main__":
+    unittest.main()
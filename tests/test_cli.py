@@ -0,0 +1,66 @@
+import io
+import os
+import pickle
+import tempfile
+import unittest
+from sketchlib.__main__ import main
+from sketchlib._reading import read_chunks, read_chunks_mmap, make_extractor
+
+class TestCommandLine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "access.log")
+        with open(self.path, "w") as f:
+            for i in range(3000):
+                url = "/home" if i % 3 == 0 else "/page/%d" % (i % 50)
+                f.write("user%d GET %s %d\n" % (i % 700, url, i % 100 + 1))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_main(self, argv, stdin=None):
+        out, err = io.StringIO(), io.StringIO()
+        self.assertEqual(main(argv, stdin=stdin, stdout=out, stderr=err), 0)
+        return out.getvalue(), err.getvalue()
+
+    def test_chunked_readers(self):
+        data = b"a\nbb\nccc\n" * 1000 + b"last"
+        chunks = list(read_chunks(io.BytesIO(data), chunk_size=7))
+        self.assertEqual(sum(chunks, []), data.split(b"\n"))
+
+        with open(self.path, "rb") as f:
+            expected = f.read().split(b"\n")[:-1]
+            f.seek(0)
+            self.assertEqual(sum(read_chunks_mmap(f, chunk_size=100), []), expected)
+
+    def test_distinct(self):
+        out, err = self.run_main(["distinct", self.path, "--field", "0", "--epsilon", "0.1", "--mmap"])
+        self.assertTrue(630 <= int(out) <= 770)
+        self.assertIn("3000 lines", err)
+
+    def test_heavy_hitters_with_regex(self):
+        out, _ = self.run_main(["heavy", self.path, "--regex", r"GET (\S+)", "--phi", "0.2", "--epsilon", "0.1"])
+        self.assertEqual(out.split("\t")[0], "/home")
+
+        # Lines where the group does not take part in the match are skipped
+        extract = make_extractor(regex=r"GET (\S+)|POST")
+        self.assertEqual(extract([b"GET /a", b"POST /b", b"PUT /c"]), [b"/a"])
+        out, _ = self.run_main(["heavy", self.path, "--regex", r"GET (/home)|GET", "--phi", "0.2", "--epsilon", "0.1"])
+        self.assertEqual(out.split("\t")[0], "/home")
+
+    def test_quantile_from_stdin_and_output(self):
+        output = os.path.join(self.tmpdir.name, "sketch.pkl")
+        with open(self.path, "rb") as f:
+            stdin = io.BytesIO(f.read())
+        out, _ = self.run_main(["quantile", "--field", "3", "--n", "128", "--epsilon", "0.01",
+                                "--quantiles", "0.5", "--output", output, "--quiet"], stdin=stdin)
+        self.assertTrue(45 <= int(out.split("\t")[1]) <= 55)
+
+        with open(output, "rb") as f:
+            sketch = pickle.load(f)
+        self.assertEqual(sketch._l1_norm, 3000)
+
+
+if __name__ == "__main__":
+    unittest.main()
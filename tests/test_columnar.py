@@ -0,0 +1,68 @@
+import unittest
+import random
+import numpy as np
+from sketchlib.columnar import digest_column, insert_column, pa
+from sketchlib.hashing import digest
+from sketchlib.count_min import CountMin
+from sketchlib.minhash import MinHash
+
+def random_strings(n, seed=0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice("abcdefgh") for _ in range(rng.randrange(0, 50))) for _ in range(n)]
+
+class TestColumnar(unittest.TestCase):
+
+    def test_numpy_columns(self):
+        values = random_strings(2000)
+        expected = np.array([digest(v) for v in values], dtype=np.uint64)
+        self.assertTrue(np.array_equal(digest_column(np.array(values)), expected))
+        self.assertTrue(np.array_equal(digest_column(np.array([v.encode() for v in values])), expected))
+
+        # Non-ASCII text and values with null bytes
+        unicode = np.array(["héllo", "naïve", "ab", ""])
+        self.assertEqual(list(digest_column(unicode)), [digest(v) for v in unicode.tolist()])
+        raw = np.array([b"a\x00b", b"ab\x00", b""])
+        self.assertEqual(list(digest_column(raw)), [digest(v) for v in raw.tolist()])
+        self.assertEqual(list(digest_column(np.array([5, -1]))), [5, 2**64 - 1])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_arrow_columns(self):
+        values = random_strings(2000, seed=1)
+        expected = np.array([digest(v) for v in values], dtype=np.uint64)
+        for column in [pa.array(values), pa.array(values, type=pa.large_string()),
+                       pa.array([v.encode() for v in values], type=pa.binary()),
+                       pa.chunked_array([values[:100], values[100:]]), pa.array(values).dictionary_encode()]:
+            self.assertTrue(np.array_equal(digest_column(column), expected))
+        self.assertTrue(np.array_equal(digest_column(pa.array(values).slice(10, 50)), expected[10:60]))
+        self.assertEqual(list(digest_column(pa.array(["a", None, "b"]))), [digest("a"), digest("b")])
+        self.assertEqual(list(digest_column(pa.array([3, None, 4]))), [3, 4])
+
+    def test_insert_column(self):
+        values = random_strings(500, seed=2)
+        cm1, cm2 = CountMin(width=100, delta=0.01), CountMin(width=100, delta=0.01)
+        insert_column(cm1, np.array(values), counts=np.full(500, 2))
+        for v in values:
+            cm2.insert(v, 2)
+        self.assertTrue(np.array_equal(cm1.get_table(), cm2.get_table()))
+
+        mh1, mh2 = MinHash(epsilon=0.2), MinHash(epsilon=0.2)
+        insert_column(mh1, np.array(values))
+        for v in values:
+            mh2.insert(v)
+        self.assertTrue(np.array_equal(mh1.get_signature(), mh2.get_signature()))
+
+    def test_insert_column_with_nulls_and_counts(self):
+        cm1, cm2 = CountMin(width=100, delta=0.01), CountMin(width=100, delta=0.01)
+        column = pa.chunked_array([["apple", None], ["kiwi", None, "plum"]])
+        insert_column(cm1, column, counts=[1, 10, 2, 20, 3])
+        for v, count in [("apple", 1), ("kiwi", 2), ("plum", 3)]:
+            cm2.insert(v, count)
+        self.assertTrue(np.array_equal(cm1.get_table(), cm2.get_table()))
+        with self.assertRaises(ValueError):
+            insert_column(cm1, column, counts=[1, 2, 3])
+        with self.assertRaises(ValueError):
+            insert_column(cm1, np.array(["apple", "kiwi"]), counts=[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
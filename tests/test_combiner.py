@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from sketchlib.combiner import Combiner
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.quantile_sketch import QuantileSketch
+from sketchlib.bloom_filter import BloomFilter
+
+class TestCombiner(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.stream = (rng.zipf(1.5, 5000) % 1000 + 1).tolist()
+
+    def test_linear_sketches_are_exact(self):
+        for make in [lambda: CountMin(width=200, delta=0.01),
+                     lambda: F2Estimate(epsilon=0.2, delta=0.1)]:
+            direct, combiner = make(), Combiner(make(), capacity=100)
+            for x in self.stream:
+                direct.insert(x, 2)
+                combiner.insert(x, 2)
+            self.assertTrue(np.array_equal(direct.get_table(), combiner.get_table()))
+            self.assertEqual(len(combiner), 0)
+
+        direct, combiner = QuantileSketch(epsilon=0.1, n=1000), Combiner(QuantileSketch(epsilon=0.1, n=1000))
+        for x in self.stream:
+            direct.insert(x)
+        combiner.insert_many(self.stream)
+        self.assertEqual(combiner.query(0.5), direct.query(0.5))
+
+    def test_set_sketch_and_reads_flush(self):
+        bf = BloomFilter(n=2000, delta=0.01)
+        combiner = Combiner(bf, capacity=10**6)
+        combiner.insert_many(self.stream)
+        self.assertEqual(len(combiner), len(set(self.stream)))
+        self.assertTrue(combiner.membership(self.stream[0]))
+        self.assertEqual(len(combiner), 0)
+        self.assertTrue(bf.contains_many(np.array(self.stream)).all())
+
+        # The counting Bloom filter sees every insertion, so deletions work
+        combiner.insert_many(["apple", "apple", "kiwi"])
+        combiner.delete("apple")
+        combiner.delete("kiwi")
+        self.assertTrue(combiner.membership("apple"))
+        self.assertFalse(combiner.membership("kiwi"))
+
+    def test_merge(self):
+        c1 = Combiner(CountMin(width=200, delta=0.01))
+        c2 = Combiner(CountMin.from_existing(c1.sketch))
+        c1.insert("apple", 3)
+        c2.insert_many(["apple", "kiwi"], [4, 1])
+        c1.merge(c2)
+        self.assertEqual(c1.estimate_count("apple"), 7)
+        self.assertEqual(c1.estimate_count("kiwi"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
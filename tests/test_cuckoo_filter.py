@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from sketchlib.cuckoo_filter import CuckooFilter, CuckooFilterFullError
+
+class TestCuckooFilter(unittest.TestCase):
+
+    def test_insert_delete_membership(self):
+        cf = CuckooFilter(n=1000, delta=0.01)
+        for i in range(1000):
+            cf.insert("item%d" % i)
+        self.assertEqual(len(cf), 1000)
+        self.assertTrue(all(cf.membership("item%d" % i) for i in range(1000)))
+
+        for i in range(500):
+            self.assertTrue(cf.delete("item%d" % i))
+        self.assertEqual(len(cf), 500)
+        self.assertTrue(all(cf.membership("item%d" % i) for i in range(500, 1000)))
+        false_positives = sum(cf.membership("item%d" % i) for i in range(500))
+        self.assertLess(false_positives, 20)
+
+    def test_batch_operations(self):
+        cf = CuckooFilter(n=20000, delta=0.001)
+        keys = np.arange(20000)
+        cf.insert_many(keys)
+        self.assertTrue(cf.contains_many(keys).all())
+        self.assertLess(cf.contains_many(np.arange(10**6, 2 * 10**6)).mean(), 0.002)
+
+        # Batch and scalar paths agree
+        tokens = ["a%d" % i for i in range(100)]
+        cf.insert_many(tokens[:50])
+        self.assertEqual(list(cf.contains_many(tokens)), [cf.membership(t) for t in tokens])
+
+        found = cf.delete_many(np.arange(10))
+        self.assertTrue(found.all())
+        self.assertEqual(len(cf), 20040)
+
+    def test_full_filter(self):
+        cf = CuckooFilter(n=100, delta=0.01, max_kicks=50)
+        with self.assertRaises(CuckooFilterFullError):
+            for i in range(1000):
+                cf.insert(i)
+        # A failed insertion leaves the filter unchanged
+        buckets, count = cf.get_filter().copy(), len(cf)
+        with self.assertRaises(CuckooFilterFullError):
+            for i in range(1000, 2000):
+                cf.insert(i)
+                buckets, count = cf.get_filter().copy(), len(cf)
+        self.assertTrue(np.array_equal(buckets, cf.get_filter()))
+        self.assertEqual(count, np.count_nonzero(cf.get_filter()))
+
+    def test_merge(self):
+        cf1 = CuckooFilter(n=2000, delta=0.01)
+        cf2 = CuckooFilter.from_existing(cf1)
+        cf1.insert_many(np.arange(500))
+        cf2.insert_many(np.arange(500, 1000))
+        merged = cf1 + cf2
+        self.assertEqual(len(merged), 1000)
+        self.assertTrue(merged.contains_many(np.arange(1000)).all())
+
+        for other in [CuckooFilter(n=2000, delta=0.01, seed=7), CuckooFilter(n=4000, delta=0.01),
+                      CuckooFilter(n=2000, delta=0.0001)]:
+            other.insert(1)
+            with self.assertRaises(ValueError):
+                cf1.merge(other)
+        self.assertEqual(len(cf1), 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
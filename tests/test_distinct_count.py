@@ -27,6 +27,30 @@ class TestF0Sketch(unittest.TestCase):
         upper_bound = actual_distinct * (1 + 0.01)
         self.assertTrue(lower_bound <= estimated_distinct <= upper_bound)
 
+    def test_batch_matches_scalar(self):
+        tokens = [self.random_string(3) for _ in range(5000)]
+        scalar = LogDistinctCount(epsilon=0.1, delta=0.1)
+        batch = LogDistinctCount(epsilon=0.1, delta=0.1)
+        for token in tokens:
+            scalar.insert(token)
+        batch.insert_many(tokens[:2000])
+        batch.insert_many(tokens[2000:])
+        self.assertEqual(scalar._table, batch._table)
+        self.assertEqual(scalar.estimator(), batch.estimator())
+
+    def test_overlapping_batches(self):
+        # The second batch repeats the tokens of the first one
+        tokens = ["token%d" % i for i in range(250)]
+        scalar = LogDistinctCount(epsilon=0.1, delta=0.1)
+        batch = LogDistinctCount(epsilon=0.1, delta=0.1)
+        for token in tokens[:150] + tokens:
+            scalar.insert(token)
+        batch.insert_many(tokens[:150])
+        batch.insert_many(tokens)
+        self.assertEqual(len(scalar._naive_lst), len(batch._naive_lst))
+        self.assertEqual(scalar.estimator(), batch.estimator())
+        self.assertFalse(batch._is_exact())
+
     def test_merge_functionality(self):
         f0sketch1 = LogDistinctCount(epsilon=0.01, delta=0.01)
         f0sketch2 = LogDistinctCount.from_existing(f0sketch1)
@@ -85,5 +109,28 @@ class TestF0Sketch(unittest.TestCase):
         upper_bound = actual_distinct * (1 + 0.01)
         self.assertTrue(lower_bound <= estimated_distinct <= upper_bound)
 
+    def test_set_operations(self):
+        sketch1 = LogDistinctCount(epsilon=0.05, delta=0.05)
+        sketch2 = LogDistinctCount.from_existing(sketch1)
+        sketch1.insert_many(["token%d" % i for i in range(40000)])
+        sketch2.insert_many(["token%d" % i for i in range(30000, 50000)])
+
+        # Union of 50000, intersection of 10000 and difference of 30000 tokens
+        self.assertAlmostEqual(sketch1.union_count(sketch2), 50000, delta=50000 * 0.1)
+        self.assertAlmostEqual(sketch1.intersection_count(sketch2), 10000, delta=50000 * 0.1)
+        self.assertAlmostEqual(sketch1.difference_count(sketch2), 30000, delta=50000 * 0.1)
+        self.assertAlmostEqual(sketch2.difference_count(sketch1), 10000, delta=50000 * 0.1)
+        self.assertAlmostEqual(sketch1.jaccard(sketch2), 0.2, delta=0.1)
+        self.assertEqual(sketch1.union_count(sketch2), (sketch1 + sketch2).estimator())
+
+        # Small streams are counted exactly
+        small1, small2 = LogDistinctCount.from_existing(sketch1), LogDistinctCount.from_existing(sketch1)
+        small1.insert_many(range(100))
+        small2.insert_many(range(50, 120))
+        self.assertEqual((small1.union_count(small2), small1.intersection_count(small2),
+                          small1.difference_count(small2)), (120, 50, 50))
+        with self.assertRaises(ValueError):
+            small1.jaccard(LogDistinctCount(epsilon=0.1, delta=0.05))
+
 if __name__ == "__main__":
     unittest.main()
@@ -100,5 +100,27 @@ class TestF2Estimate(unittest.TestCase):
         #print(estimated_moment, lower_bound, upper_bound)
         self.assertTrue(lower_bound <= estimated_moment <= upper_bound)
 
+    def test_join_size(self):
+        f2_1 = F2Estimate(epsilon=0.1, delta=0.01)
+        f2_2 = F2Estimate.from_existing(f2_1)
+        weights_1 = {self.random_string(): random.randint(1, 10) for _ in range(300)}
+        weights_2 = {token: random.randint(1, 10) for token in list(weights_1)[:150]}
+        weights_2.update({self.random_string(): random.randint(1, 10) for _ in range(150)})
+        f2_1.insert_many(list(weights_1), list(weights_1.values()))
+        f2_2.insert_many(list(weights_2), list(weights_2.values()))
+
+        join_size = sum(weight * weights_2.get(token, 0) for token, weight in weights_1.items())
+        # Sparse sketches hold the weights of their keys, so the join size is exact
+        self.assertEqual(f2_1.join_size(f2_2), join_size)
+        self.assertEqual(f2_1.inner_product_error(f2_2), 0)
+        f2_1._densify()
+        f2_2._densify()
+        bound = f2_1.inner_product_error(f2_2)
+        self.assertLessEqual(abs(f2_1.join_size(f2_2) - join_size), bound)
+        self.assertLess(bound, join_size)
+        self.assertEqual(f2_1.join_size(f2_2), f2_2.inner_product(f2_1))
+        with self.assertRaises(ValueError):
+            f2_1.inner_product(F2Estimate(epsilon=0.1, delta=0.01, seed=7))
+
 if __name__ == '__main__':
     unittest.main()
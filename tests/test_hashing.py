@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+from sketchlib.hashing import FAMILIES, MurmurHash, MultiplyShift, Tabulation, get_hash_family, digest, fastrange_fold
+from sketchlib.bloom_filter import BloomFilter
+from sketchlib.count_min import CountMin
+from sketchlib.minhash import MinHash
+from sketchlib.memory import nbytes
+
+class TestHashing(unittest.TestCase):
+
+    def test_scalar_and_vectorized_agree(self):
+        keys = np.array([0, 1, 2, 2**63 + 5, 12345678901234], dtype=np.uint64)
+        for family in [MurmurHash(), MultiplyShift(), Tabulation()]:
+            for seed in [0, 42, 294]:
+                hashes = family.hash_many(keys, seed)
+                self.assertEqual([int(h) for h in hashes], [family.hash(int(k), seed) for k in keys])
+                for m in [1000, 2**40]:
+                    indices = family.index_many(keys, seed, m)
+                    self.assertEqual(list(indices), [family.index(int(k), seed, m) for k in keys])
+
+            # One key with many seeds, as used by F2Estimate and MinHash
+            seeds = np.arange(6) * 42
+            hashes = family.mix_many(np.uint64(family.digest("apple")), seeds)
+            self.assertEqual([int(h) for h in hashes], [family.hash("apple", s) for s in seeds])
+
+            # Bytes keys and str keys hash through the same digest
+            self.assertEqual(family.hash(b"apple", 3), family.hash("apple", 3))
+            self.assertEqual(list(family.hash_many(["apple", b"kiwi"], 3)),
+                             [family.hash("apple", 3), family.hash("kiwi", 3)])
+
+    def test_uniformity(self):
+        for family in [MurmurHash(), MultiplyShift(), Tabulation()]:
+            counts = np.bincount(family.index_many(np.arange(100000), 7, 10), minlength=10)
+            self.assertTrue(np.all(np.abs(counts - 10000) < 500))
+            self.assertTrue(np.all(family.index_many(np.arange(1000), 7, 3) < 3))
+
+    def test_tabulation_shares_its_tables(self):
+        # F2Estimate uses one seed per cell, which must not allocate tables per seed
+        family = Tabulation()
+        hashes = family.mix_many(np.arange(100, dtype=np.uint64)[:, None], np.arange(5000) * 42)
+        self.assertEqual(hashes.shape, (100, 5000))
+        self.assertLess(nbytes(family), 1000)
+        self.assertGreater(len(np.unique(hashes[0])), 4990)
+
+    def test_get_hash_family(self):
+        self.assertIsInstance(get_hash_family(None), MurmurHash)
+        self.assertIsInstance(get_hash_family("tabulation"), Tabulation)
+        self.assertIsInstance(get_hash_family(MultiplyShift), MultiplyShift)
+        self.assertEqual(sorted(FAMILIES), ["multiply_shift", "murmur", "tabulation"])
+        with self.assertRaises(ValueError):
+            get_hash_family("sha1")
+        self.assertEqual(digest(-1), 2**64 - 1)
+
+    def test_sketches_with_integer_keys(self):
+        for name in FAMILIES:
+            cm = CountMin(width=1000, delta=0.01, hash_family=name)
+            bf = BloomFilter(n=1000, delta=0.01, hash_family=name)
+            for i in range(500):
+                cm.insert(i, 2)
+                bf.insert(i)
+            self.assertTrue(all(cm.estimate_count(i) >= 2 for i in range(500)))
+            self.assertTrue(all(bf.membership(i) for i in range(500)))
+            false_positives = sum(bf.membership(i) for i in range(500, 10500))
+            self.assertLess(false_positives, 300)
+
+            bf2 = BloomFilter.from_existing(bf)
+            self.assertEqual(bf2._hash_family, bf._hash_family)
+
+    def test_minhash_families_must_match(self):
+        mh1 = MinHash(epsilon=0.2, hash_family="multiply_shift")
+        mh2 = MinHash(epsilon=0.2)
+        with self.assertRaises(AttributeError):
+            mh1._check_mergeability(mh2)
+        mh1._check_mergeability(MinHash.from_existing(mh1))
+
+    def test_folded_count_min(self):
+        keys = np.arange(20000) % 3000
+        wide, narrow = CountMin(width=4096, delta=0.01), CountMin(width=1024, delta=0.01)
+        wide.insert_many(keys)
+        narrow.insert_many(keys)
+
+        # A folded sketch is the narrower sketch that saw the same stream
+        unfolded = CountMin.from_existing(wide)
+        unfolded.insert_many(keys)
+        wide.fold(4)
+        self.assertTrue(np.array_equal(wide.get_table(), narrow.get_table()))
+        self.assertTrue(np.array_equal(fastrange_fold(unfolded.get_table(), 4), narrow.get_table()))
+
+        # An unfolded sketch of the same lineage is folded on merge
+        unfolded.merge(wide)
+        self.assertEqual(unfolded._width, 1024)
+        self.assertTrue(np.array_equal(unfolded.get_table(), 2 * narrow.get_table()))
+        with self.assertRaises(ValueError):
+            wide.fold(3)
+
+        # A sketch with other hash functions is rejected before anything is folded
+        other = CountMin(width=1024, delta=0.01, seed=11)
+        with self.assertRaises(ValueError):
+            narrow.merge(CountMin(width=4096, delta=0.01, seed=11))
+        with self.assertRaises(ValueError):
+            unfolded.merge(CountMin(width=1000, delta=0.01))
+        other.merge(CountMin(width=4096, delta=0.01, seed=11))
+        self.assertEqual((narrow._width, other._width), (1024, 1024))
+
+
+if __name__ == "__main__":
+    unittest.main()
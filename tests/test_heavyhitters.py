@@ -2,6 +2,7 @@ import unittest
 from collections import Counter
 import random
 from sketchlib.heavy_hitters import CountMinCashRegister, MisraGries
+from sketchlib.heavy_hitters import DecayedMisraGries, DecayedCountMinCashRegister
 
 class TestHeavyHitters(unittest.TestCase):
 
@@ -93,6 +94,43 @@ class TestHeavyHitters(unittest.TestCase):
         self.assertIn('orange', heavy_hitters)
         self.assertNotIn('banana', heavy_hitters)
 
+    def test_decayed_trending(self):
+        for finder in [DecayedMisraGries(phi=0.2, epsilon=0.1, half_life=10),
+                       DecayedCountMinCashRegister(phi=0.2, epsilon=0.1, half_life=10)]:
+            for t in range(100):
+                finder.insert('old', 10, timestamp=t)
+            for t in range(100, 150):
+                finder.insert('new', 10, timestamp=t)
+                finder.insert('noise%d' % t, 1, timestamp=t)
+
+            heavy_hitters = finder.get_heavy_hitters()
+            self.assertIn('new', heavy_hitters)
+            self.assertNotIn('old', heavy_hitters)
+            # 10 * (1 + 2^-0.1 + 2^-0.2 + ...) for the 50 inserts of 'new'
+            expected = 10 * sum(0.5 ** (t / 10) for t in range(50))
+            self.assertAlmostEqual(heavy_hitters['new'], expected, delta=0.1 * expected)
+
+    def test_decayed_renormalization(self):
+        # 2000 half-lives: the scale of new counts would overflow without renormalization
+        finder = DecayedMisraGries(phi=0.3, epsilon=0.1, half_life=1)
+        for t in range(2000):
+            finder.insert('apple', 1, timestamp=t)
+        self.assertLess(finder._rate * (finder._now - finder._landmark), 64)
+        self.assertAlmostEqual(finder.get_heavy_hitters()['apple'], 2, places=6)
+        self.assertAlmostEqual(finder.get_heavy_hitters(timestamp=2000)['apple'], 1, places=6)
+
+    def test_decayed_merge(self):
+        finder1 = DecayedCountMinCashRegister(phi=0.3, epsilon=0.1, half_life=5)
+        finder2 = DecayedCountMinCashRegister.from_existing(finder1)
+        finder1.insert('apple', 100, timestamp=0)
+        finder2.insert('apple', 100, timestamp=500)
+        finder2.insert('orange', 100, timestamp=500)
+
+        merged = finder1 + finder2
+        heavy_hitters = merged.get_heavy_hitters(timestamp=500)
+        self.assertAlmostEqual(heavy_hitters['apple'], 100, places=6)
+        self.assertAlmostEqual(merged.decayed_count(timestamp=500), 200, places=6)
+
 
 if __name__ == "__main__":
     unittest.main()
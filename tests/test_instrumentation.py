@@ -0,0 +1,109 @@
+import unittest
+from sketchlib import instrumentation
+from sketchlib.count_min import CountMin
+from sketchlib.bloom_filter import BloomFilter
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib import heavy_hitters
+from sketchlib.heavy_hitters import CountMinCashRegister, MisraGries
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+
+    def test_disabled_by_default(self):
+        original_insert = CountMin.insert
+        original_heappush = heavy_hitters.heappush
+        self.assertFalse(instrumentation.is_enabled())
+
+        instrumentation.enable()
+        self.assertIsNot(CountMin.insert, original_insert)
+        instrumentation.disable()
+
+        # The original functions are restored, so there is no overhead left
+        self.assertIs(CountMin.insert, original_insert)
+        self.assertIs(heavy_hitters.heappush, original_heappush)
+
+        cm = CountMin(width=100, delta=0.05)
+        cm.insert("apple", 1)
+        self.assertEqual(instrumentation.snapshot()["counters"]["hash_calls"], {})
+
+    def test_counters(self):
+        cm = CountMin(width=100, delta=0.05)
+        misra = MisraGries(phi=0.5, epsilon=0.5)
+        register = CountMinCashRegister(phi=0.3, epsilon=0.1)
+
+        with instrumentation.instrumented():
+            for i in range(10):
+                cm.insert(str(i), 1)
+            cm.estimate_count("1")
+            for i in range(10):
+                misra.insert(str(i))
+            for _ in range(5):
+                register.insert("apple", 1)
+            register.get_heavy_hitters()
+
+        snap = instrumentation.snapshot()
+        counters = snap["counters"]
+        self.assertEqual(counters["table_writes"]["CountMin"], 10 * cm._depth + 5 * register._count_min._depth)
+        self.assertGreaterEqual(counters["hash_calls"]["CountMin"], 11 * cm._depth)
+        self.assertGreater(counters["decrement_sweeps"]["MisraGries"], 0)
+        self.assertEqual(counters["heap_pushes"]["CountMinCashRegister"], 5)
+
+        # Nested calls are only timed once, at the outermost level
+        self.assertEqual(snap["timings"]["insert"]["CountMinCashRegister"]["count"], 5)
+        self.assertEqual(snap["timings"]["insert"]["CountMin"]["count"], 10)
+        self.assertEqual(snap["timings"]["query"]["CountMin"]["count"], 1)
+        self.assertEqual(snap["timings"]["insert"]["MisraGries"]["buckets"][float("inf")], 10)
+
+    def test_batch_counters(self):
+        cm = CountMin(width=100, delta=0.05)
+        bf = BloomFilter(n=100, delta=0.01)
+        with instrumentation.instrumented():
+            cm.insert_many(["apple", "kiwi", "plum"], [1, 2, 3])
+            bf.insert_many(str(i) for i in range(10))
+            self.assertTrue(bf.contains_many(keys=[str(i) for i in range(10)]).all())
+
+        snap = instrumentation.snapshot()
+        counters = snap["counters"]
+        self.assertEqual(counters["table_writes"]["CountMin"], 3 * cm._depth)
+        self.assertEqual(counters["hash_calls"]["CountMin"], 3 * cm._depth)
+        self.assertEqual(counters["table_writes"]["BloomFilter"], 10 * bf._k)
+        self.assertEqual(counters["hash_calls"]["BloomFilter"], 20 * bf._k)
+        self.assertEqual(snap["timings"]["insert"]["BloomFilter"]["count"], 1)
+        self.assertEqual(snap["timings"]["query"]["BloomFilter"]["count"], 1)
+
+    def test_sparse_f2_insert(self):
+        f2 = F2Estimate(epsilon=0.5, delta=0.25)
+        with instrumentation.instrumented():
+            f2.insert("apple", 1)
+            f2.insert("kiwi", 2)
+            f2.insert_many(["plum", "pear"])
+        counters = instrumentation.snapshot()["counters"]
+        self.assertTrue(f2.is_sparse())
+        self.assertEqual(counters["hash_calls"]["F2Estimate"], 4)
+        self.assertEqual(counters["table_writes"]["F2Estimate"], 4)
+        f2._densify()
+        with instrumentation.instrumented():
+            f2.insert("plum", 1)
+        counters = instrumentation.snapshot()["counters"]
+        self.assertEqual(counters["table_writes"]["F2Estimate"], 4 + f2._depth * f2._width)
+
+    def test_prometheus_export(self):
+        cm = CountMin(width=10, delta=0.05)
+        with instrumentation.instrumented():
+            cm.insert("apple", 3)
+            cm.merge(CountMin.from_existing(cm))
+
+        text = instrumentation.to_prometheus()
+        self.assertIn('sketchlib_table_writes_total{sketch="CountMin"} %d' % cm._depth, text)
+        self.assertIn('sketchlib_insert_seconds_bucket{sketch="CountMin",le="+Inf"} 1', text)
+        self.assertIn('sketchlib_merge_seconds_count{sketch="CountMin"} 1', text)
+        self.assertIn("# TYPE sketchlib_query_seconds histogram", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import random
+import numpy as np
+from sketchlib.keyed import KeyedCountMin, KeyedLogDistinctCount, KeyedQuantileSketch
+from sketchlib.count_min import CountMin
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.quantile_sketch import QuantileSketch
+
+class TestKeyedSketches(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.groups = [rng.choice(["us", "eu", "asia"]) for _ in range(6000)]
+        self.tokens = [rng.randrange(2000) for _ in range(6000)]
+
+    def test_count_min_matches_single_sketches(self):
+        keyed = KeyedCountMin(width=100, delta=0.01)
+        keyed.insert_many(self.groups[:3000], self.tokens[:3000])
+        for group, token in zip(self.groups[3000:], self.tokens[3000:]):
+            keyed.insert(group, token)
+
+        sketches = {group: CountMin(width=100, delta=0.01) for group in ["us", "eu", "asia"]}
+        for group, token in zip(self.groups, self.tokens):
+            sketches[group].insert(token, 1)
+        for group, cm in sketches.items():
+            self.assertTrue(np.array_equal(keyed.get_table(group), cm.get_table()))
+        self.assertEqual(list(keyed.estimate_count_many(self.groups[:20], self.tokens[:20])),
+                         [sketches[g].estimate_count(t) for g, t in zip(self.groups[:20], self.tokens[:20])])
+        self.assertEqual(keyed.estimate_count("unknown", 5), 0)
+        self.assertEqual(sorted(keyed.groups()), ["asia", "eu", "us"])
+
+    def test_distinct_count_matches_single_sketches(self):
+        keyed = KeyedLogDistinctCount(epsilon=0.1, delta=0.1)
+        keyed.insert_many(np.array(self.groups), np.array(self.tokens), chunk_size=1000)
+        sketches = {group: LogDistinctCount(epsilon=0.1, delta=0.1) for group in ["us", "eu", "asia"]}
+        for group, token in zip(self.groups, self.tokens):
+            sketches[group].insert(token)
+        self.assertEqual(list(keyed.estimator_many()), [sketches[g].estimator() for g in keyed.groups()])
+
+        # Small groups are counted exactly, unknown groups are empty
+        keyed.insert_many(["small"] * 30, [i % 10 for i in range(30)])
+        self.assertEqual(keyed.estimator("small"), 10)
+        self.assertEqual(keyed.estimator("unknown"), 0)
+
+    def test_distinct_count_skewed_groups(self):
+        # One hot group and many small ones in the same chunk
+        rng = np.random.default_rng(3)
+        groups = np.concatenate([np.zeros(20000, dtype=int), rng.integers(1, 3000, size=20000)])
+        tokens = rng.integers(0, 10**6, size=len(groups))
+        keyed = KeyedLogDistinctCount(epsilon=0.1, delta=0.1)
+        keyed.insert_many(groups, tokens)
+        sketches = {}
+        for group, token in zip(groups.tolist(), tokens.tolist()):
+            sketches.setdefault(group, LogDistinctCount(epsilon=0.1, delta=0.1)).insert(token)
+        self.assertEqual(list(keyed.estimator_many()), [sketches[g].estimator() for g in keyed.groups()])
+
+    def test_quantiles_and_merge(self):
+        values = [token % 1000 + 1 for token in self.tokens]
+        keyed1 = KeyedQuantileSketch(epsilon=0.1, n=1000)
+        keyed2 = KeyedQuantileSketch.from_existing(keyed1)
+        keyed1.insert_many(self.groups[:3000], values[:3000])
+        keyed2.insert_many(self.groups[3000:] + ["other"], values[3000:] + [7])
+        merged = keyed1 + keyed2
+        self.assertEqual(len(merged), 4)
+
+        sketches = {group: QuantileSketch(epsilon=0.1, n=1000) for group in ["us", "eu", "asia"]}
+        for group, x in zip(self.groups, values):
+            sketches[group].insert(x)
+        for q in [0.25, 0.5, 0.9]:
+            self.assertEqual(list(merged.query_many(["us", "eu", "asia"], q)),
+                             [sketches[g].query(q) for g in ["us", "eu", "asia"]])
+        self.assertEqual(merged.query("other", 0.5), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import numpy as np
+from sketchlib.memory import nbytes
+from sketchlib.count_min import CountMin
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.heavy_hitters import MisraGries, CountMinCashRegister
+
+class TestMemory(unittest.TestCase):
+
+    def test_tables_are_counted(self):
+        small, large = CountMin(width=100, delta=0.01, sparse=False), CountMin(width=10000, delta=0.01, sparse=False)
+        self.assertGreaterEqual(small.nbytes(), small._table.nbytes)
+        self.assertAlmostEqual(large.nbytes() - small.nbytes(), large._table.nbytes - small._table.nbytes, delta=100)
+
+        # Views count the data they point to, shared objects are counted once
+        a = np.zeros(1000)
+        self.assertGreaterEqual(nbytes([a[10:]]), 990 * 8)
+        self.assertLess(nbytes([a, a]), 2 * a.nbytes)
+
+    def test_lists_sets_and_heaps_grow(self):
+        for sketch in [LogDistinctCount(epsilon=0.1, delta=0.1), MisraGries(phi=0.01, epsilon=0.1),
+                       CountMinCashRegister(phi=0.01, epsilon=0.5)]:
+            empty = sketch.nbytes()
+            for i in range(2000):
+                if isinstance(sketch, LogDistinctCount):
+                    sketch.insert("token%d" % i)
+                else:
+                    sketch.insert("token%d" % (i % 50), 1)
+            self.assertGreater(sketch.nbytes(), empty)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 import numpy as np
 import random
 import string
-from sketchlib.minhash import MinHash
+from sketchlib.minhash import MinHash, MinHashMatrix
 
 class TestMinHash(unittest.TestCase):
     
@@ -57,6 +57,65 @@ class TestMinHash(unittest.TestCase):
         actual_jaccard = len(set1.intersection(set2)) / len(set1.union(set2))
         self.assertTrue(np.isclose(estimated_jaccard, actual_jaccard, atol=0.1))
 
+    def test_integer_signatures(self):
+        for elem in ['apple', 'banana', 'cherry']:
+            self.minhash1.insert(elem)
+        self.assertEqual(self.minhash1.get_signature().dtype, np.uint64)
+
+        # 32-bit signatures are the high bits of the 64-bit ones
+        minhash32 = MinHash(epsilon=0.1, bits=32)
+        minhash32.insert_many(['apple', 'banana', 'cherry'])
+        self.assertEqual(minhash32.get_signature().dtype, np.uint32)
+        self.assertTrue(np.array_equal(minhash32.get_signature(), self.minhash1.get_signature() >> np.uint64(32)))
+        self.assertEqual(self.minhash1.get_signature(bits=8).dtype, np.uint8)
+
+    def test_fold(self):
+        self.minhash1.insert_many(range(1000))
+        self.minhash2.insert_many(range(500, 1500))
+        folded = MinHash.from_existing(self.minhash1)
+        folded.insert_many(range(1000))
+        folded.fold(4, bits=32)
+
+        # The folded minhash is the smaller minhash that saw the same set
+        small = MinHash(epsilon=0.2, bits=32)
+        small.insert_many(range(1000))
+        self.assertTrue(np.array_equal(folded.get_signature(), small.get_signature()))
+        self.assertAlmostEqual(folded.estimate_jaccard_similarity(self.minhash2), 1 / 3, delta=0.15)
+
+        self.minhash2.merge(folded)
+        self.assertEqual(len(self.minhash2.get_signature()), len(small.get_signature()))
+        self.assertAlmostEqual(self.minhash2.estimate_jaccard_similarity(self.minhash1), 2 / 3, delta=0.15)
+        with self.assertRaises(ValueError):
+            folded.fold(bits=64)
+
+        # An incompatible merge leaves the minhash unchanged
+        other = MinHash(epsilon=0.2, seed=2)
+        self.minhash1.merge(other)
+        self.assertEqual(len(self.minhash1.get_signature()), 400)
+
+    def test_matrix_jaccard(self):
+        rng = np.random.default_rng(5)
+        minhashes = []
+        for _ in range(50):
+            minhash = MinHash.from_existing(self.minhash1)
+            minhash.insert_many(rng.integers(0, 500, 100))
+            minhashes.append(minhash)
+        matrix = MinHashMatrix.from_minhashes(minhashes)
+
+        expected = np.array([[a.estimate_jaccard_similarity(b) for b in minhashes] for a in minhashes])
+        self.assertTrue(np.allclose(matrix.jaccard(chunk_size=7), expected))
+        self.assertTrue(np.allclose(matrix.jaccard(minhashes[3])[:, 0], expected[:, 3]))
+
+        # b-bit signatures give close estimates with a quarter of the memory
+        truncated = MinHashMatrix.from_minhashes(minhashes, bits=16)
+        self.assertLess(np.abs(truncated.jaccard() - expected).max(), 0.01)
+        self.assertEqual(truncated.get_signatures().dtype, np.uint16)
+
+        i, j, similarity = matrix.pairs_above(0.1, chunk_size=7)
+        self.assertEqual(len(i), np.sum(np.triu(expected >= 0.1, 1)))
+        self.assertTrue(np.all(i < j))
+        self.assertTrue(np.allclose(similarity, expected[i, j]))
+
 
 if __name__ == '__main__':
     unittest.main()
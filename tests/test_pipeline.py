@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+from sketchlib.pipeline import SketchPipeline
+from sketchlib.columnar import pa
+from sketchlib.bloom_filter import BloomFilter
+from sketchlib.count_min import CountMin
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.minhash import MinHash
+from sketchlib.heavy_hitters import MisraGries
+
+def make_sketches():
+    return {"seen": BloomFilter(n=5000, delta=0.01), "counts": CountMin(width=500, delta=0.01),
+            "distinct": LogDistinctCount(epsilon=0.1, delta=0.1), "signature": MinHash(epsilon=0.2),
+            "top": MisraGries(phi=0.1, epsilon=0.1)}
+
+class TestSketchPipeline(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.keys = ["user%d" % x for x in rng.zipf(1.5, 5000) % 2000]
+
+    def assert_same(self, expected, pipeline):
+        self.assertTrue(np.array_equal(expected["seen"].get_filter(), pipeline["seen"].get_filter()))
+        self.assertTrue(np.array_equal(expected["counts"].get_table(), pipeline["counts"].get_table()))
+        self.assertEqual(expected["distinct"]._table, pipeline["distinct"]._table)
+        self.assertTrue(np.array_equal(expected["signature"].get_signature(), pipeline["signature"].get_signature()))
+        # Heavy hitters receive the keys themselves
+        self.assertEqual(expected["top"].get_heavy_hitters(), pipeline["top"].get_heavy_hitters())
+
+    def test_batch(self):
+        expected = make_sketches()
+        for key in self.keys:
+            for sketch in expected.values():
+                if isinstance(sketch, (CountMin, MisraGries)):
+                    sketch.insert(key, 1)
+                else:
+                    sketch.insert(key)
+
+        pipeline = SketchPipeline(make_sketches())
+        pipeline.insert_many(self.keys[:1000])
+        pipeline.insert_many(np.array(self.keys[1000:]))
+        self.assert_same(expected, pipeline)
+        self.assertIn("user1", pipeline["top"].get_heavy_hitters())
+
+    def test_scalar_and_counts(self):
+        expected = make_sketches()
+        for sketch in expected.values():
+            sketch.insert_many(self.keys[:100])
+        expected["counts"].insert_many(self.keys[100:], [3] * 4900)
+        expected["top"].insert_many(self.keys[100:], [3] * 4900)
+        for name in ["seen", "distinct", "signature"]:
+            expected[name].insert_many(self.keys[100:])
+
+        pipeline = SketchPipeline(make_sketches())
+        for key in self.keys[:100]:
+            pipeline.insert(key)
+        pipeline.insert_many(self.keys[100:], counts=[3] * 4900)
+        self.assert_same(expected, pipeline)
+        self.assertEqual(pipeline.names(), ["seen", "counts", "distinct", "signature", "top"])
+
+    def test_arrow_nulls_and_counts(self):
+        pipeline = SketchPipeline({"counts": CountMin(width=100, delta=0.01), "top": MisraGries()})
+        pipeline.insert_many(pa.array(["apple", None, "kiwi", None]), counts=[1, 10, 2, 20])
+        expected = CountMin(width=100, delta=0.01)
+        expected.insert_many(["apple", "kiwi"], [1, 2])
+        self.assertTrue(np.array_equal(pipeline["counts"].get_table(), expected.get_table()))
+        self.assertEqual(pipeline["top"].get_heavy_hitters(), {"apple": 1, "kiwi": 2})
+
+if __name__ == '__main__':
+    unittest.main()
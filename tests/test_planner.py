@@ -0,0 +1,52 @@
+import unittest
+from sketchlib.planner import plan
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.quantile_sketch import QuantileSketch
+from sketchlib.bloom_filter import BloomFilter
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.minhash import MinHash
+from sketchlib.sparse import SparseTableMixin
+
+class TestPlanner(unittest.TestCase):
+
+    def test_budget(self):
+        budget = 100000
+        for cls, kwargs in [(CountMin, {}), (F2Estimate, {}), (QuantileSketch, {"n": 1000}),
+                            (BloomFilter, {"n": 2000}), (MinHash, {}), (MinHash, {"bits": 32})]:
+            result = plan(cls, memory_budget=budget, benchmark=False, **kwargs)
+            self.assertLessEqual(result["nbytes"], budget)
+            self.assertGreater(result["nbytes"], 0.8 * budget)
+            self.assertIsNone(result["throughput"])
+
+            # The prediction matches the size of the sketch once its tables are dense
+            sketch = cls(**result["params"])
+            if isinstance(sketch, BloomFilter):
+                sketch._counters()
+            for part in sketch._count_mins() if isinstance(sketch, QuantileSketch) else [sketch]:
+                if isinstance(part, SparseTableMixin):
+                    part._densify()
+            actual = sketch.nbytes()
+            self.assertLess(abs(actual - result["nbytes"]), 0.1 * budget)
+
+    def test_target_error(self):
+        result = plan(CountMin, target_error=0.001, delta=0.01, benchmark=True)
+        self.assertEqual(result["params"]["width"], 2719)
+        self.assertLessEqual(result["error"], 0.001)
+        self.assertGreater(result["throughput"], 0)
+
+        # A smaller error needs a larger sketch
+        coarse = plan(LogDistinctCount, target_error=0.1, benchmark=False)
+        fine = plan(LogDistinctCount, target_error=0.05, benchmark=False)
+        self.assertGreater(fine["nbytes"], coarse["nbytes"])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            plan(F2Estimate, memory_budget=10000, target_error=0.001)
+        with self.assertRaises(ValueError):
+            plan(CountMin)
+        with self.assertRaises(TypeError):
+            plan(dict, memory_budget=1000)
+
+if __name__ == '__main__':
+    unittest.main()
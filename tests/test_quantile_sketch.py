@@ -1,5 +1,6 @@
 import unittest
-from sketchlib.quantile_sketch import QuantileSketch
+import numpy as np
+from sketchlib.quantile_sketch import QuantileSketch, DDSketch
 
 def compute_true_counts(elms):
     elms.sort()
@@ -105,5 +106,53 @@ class TestQuantileSketch(unittest.TestCase):
             else:
                 assert true_counts[result] >= (q - epsilon) * len(naive_list) and true_counts[result-1] <= q * len(naive_list)
 
+    def test_ddsketch_relative_error(self):
+        rng = np.random.default_rng(7)
+        values = rng.lognormal(0, 2, 50000) * np.where(rng.random(50000) < 0.3, -1, 1)
+        values[:1000] = 0
+        sketch = DDSketch(alpha=0.01)
+        sketch.insert_many(values)
+
+        qs = np.linspace(0, 1, 41)
+        estimates = sketch.query_many(qs)
+        for q, estimate in zip(qs, estimates):
+            # The estimate is within alpha of a value whose rank is q * (count - 1)
+            true = np.quantile(values, q, method="lower")
+            self.assertLessEqual(abs(estimate - true), 0.01 * abs(true) + 1e-12)
+        self.assertEqual(sketch.query(0), values.min())
+        self.assertEqual(sketch.query(1), values.max())
+
+    def test_ddsketch_batch_and_merge(self):
+        rng = np.random.default_rng(8)
+        values = rng.exponential(100, 5000)
+        scalar, batch = DDSketch(alpha=0.02), DDSketch(alpha=0.02)
+        for x in values:
+            scalar.insert(x)
+        batch.insert_many(values)
+
+        first = DDSketch.from_existing(batch)
+        second = DDSketch.from_existing(batch)
+        first.insert_many(values[:2000])
+        second.insert_many(values[2000:])
+        merged = first + second
+
+        qs = [0.01, 0.25, 0.5, 0.75, 0.99]
+        self.assertTrue(np.allclose(scalar.query_many(qs), batch.query_many(qs)))
+        self.assertTrue(np.allclose(merged.query_many(qs), batch.query_many(qs)))
+        self.assertEqual(merged.count(), 5000)
+
+    def test_ddsketch_collapse(self):
+        # Values over 12 orders of magnitude need about 1400 buckets of 2%
+        values = np.logspace(-6, 6, 100001)
+        sketch = DDSketch(alpha=0.01, max_buckets=500)
+        sketch.insert_many(values)
+        self.assertLessEqual(len(sketch._positive._counts), 500)
+        self.assertEqual(sketch.count(), len(values))
+
+        # The highest quantiles keep their accuracy
+        for q in [0.9, 0.99, 0.999]:
+            true = np.quantile(values, q, method="lower")
+            self.assertLessEqual(abs(sketch.query(q) - true), 0.01 * true)
+
 if __name__ == '__main__':
     unittest.main()
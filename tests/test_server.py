@@ -0,0 +1,178 @@
+import os
+import stat
+import time
+import socket
+import tempfile
+import threading
+import unittest
+from sketchlib.server import SketchServer, SketchClient, SketchServerError, parse_args, _pack
+from sketchlib.count_min import CountMin
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.heavy_hitters import MisraGries
+
+KEY = b"test key"
+
+class TestSketchServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_unix_socket_batched_inserts(self):
+        server = SketchServer({"clicks": CountMin(width=1000, delta=0.01)})
+        path = os.path.join(self.tmpdir.name, "sketch.sock")
+        with server:
+            server.start_background(path)
+            expected = CountMin(width=1000, delta=0.01)
+            with SketchClient(path, batch_size=100) as client:
+                def produce(offset):
+                    for i in range(1000):
+                        client.insert("clicks", (i + offset) % 37, 2)
+                threads = [threading.Thread(target=produce, args=(k,)) for k in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                for k in range(4):
+                    for i in range(1000):
+                        expected.insert((i + k) % 37, 2)
+
+                self.assertEqual(client.query("clicks", "estimate_count", 5), expected.estimate_count(5))
+                self.assertTrue((client.get("clicks").get_table() == expected.get_table()).all())
+
+                with self.assertRaises(SketchServerError):
+                    client.query("missing", "estimator")
+                with self.assertRaises(SketchServerError):
+                    client.query("clicks", "_hash", 5, 1)
+                # Queries cannot change the sketch
+                with self.assertRaises(SketchServerError):
+                    client.query("clicks", "checkpoint", os.path.join(self.tmpdir.name, "x.ckpt"))
+                with self.assertRaises(SketchServerError):
+                    client.query("clicks", "merge", expected)
+
+    def test_tcp_create_and_merge(self):
+        server = SketchServer(authkey=KEY)
+        with server:
+            address = server.start_background(("127.0.0.1", 0))
+            with SketchClient(address, authkey=KEY) as client:
+                self.assertTrue(client.create("users", LogDistinctCount(epsilon=0.1, delta=0.1)))
+                self.assertFalse(client.create("users", LogDistinctCount(epsilon=0.1, delta=0.1)))
+                client.insert_many("users", ["user%d" % i for i in range(300)])
+
+                # A producer that kept its own sketch ships it to be merged
+                local = MisraGries(phi=0.1, epsilon=0.1)
+                local.insert("apple", 50)
+                client.merge("fruit", local)
+                client.merge("fruit", local)
+                client.insert("fruit", "kiwi", 3)
+
+                self.assertAlmostEqual(client.query("users", "estimator"), 300, delta=30)
+                self.assertEqual(client.query("fruit", "get_heavy_hitters")["apple"], 100)
+                self.assertEqual(client.names(), ["fruit", "users"])
+
+    def test_snapshots(self):
+        snapshots = os.path.join(self.tmpdir.name, "snapshots")
+        server = SketchServer({"clicks": CountMin(width=100, delta=0.1), "fruit": MisraGries()},
+                              snapshot_dir=snapshots, authkey=KEY)
+        with server:
+            address = server.start_background(("127.0.0.1", 0))
+            with SketchClient(address, authkey=KEY) as client:
+                client.insert_many("clicks", list(range(50)), [3] * 50)
+                client.insert("fruit", "apple", 7)
+                self.assertGreater(client.snapshot(), 0)
+                client.insert("clicks", 1, 10)
+        # The server saves a last snapshot when it stops
+        self.assertEqual(sorted(os.listdir(snapshots)), ["clicks.ckpt", "fruit.pkl"])
+
+        restored = SketchServer(snapshot_dir=snapshots)
+        self.assertGreaterEqual(restored["clicks"].estimate_count(1), 13)
+        self.assertEqual(restored["fruit"].get_heavy_hitters(), {"apple": 7})
+
+    def test_unsafe_hosts_and_names(self):
+        server = SketchServer(snapshot_dir=self.tmpdir.name, authkey=KEY)
+        with self.assertRaises(ValueError):
+            server.start_background(("0.0.0.0", 0))
+        with self.assertRaises(ValueError):
+            SketchServer().start_background(("127.0.0.1", 0))
+        with self.assertRaises(SystemExit):
+            parse_args(["--port", "7000", "--host", "0.0.0.0", "--authkey-file", "key"])
+        with self.assertRaises(SystemExit):
+            parse_args(["--port", "7000"])
+        self.assertEqual(parse_args(["--port", "7000", "--host", "localhost", "--authkey-file", "key"]).host,
+                         "localhost")
+        # Only sockets are replaced by a Unix server
+        path = os.path.join(self.tmpdir.name, "data.txt")
+        with open(path, "w") as f:
+            f.write("keep me")
+        with self.assertRaises(ValueError):
+            server.start_background(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "keep me")
+        for name in ["../escape", "/tmp/x", ".hidden", "", 5]:
+            with self.assertRaises(ValueError):
+                server.add(name, MisraGries())
+            with self.assertRaises(ValueError):
+                server.handle(("merge", name, MisraGries()))
+        self.assertEqual(server.names(), [])
+
+    def test_authentication(self):
+        server = SketchServer({"fruit": MisraGries()}, authkey=KEY)
+        path = os.path.join(self.tmpdir.name, "sketch.sock")
+        with server:
+            address = server.start_background(("127.0.0.1", 0))
+            with SketchClient(address, authkey=b"wrong key") as client:
+                with self.assertRaises(SketchServerError):
+                    client.names()
+
+            # A frame sent without the handshake is never unpickled
+            target = os.path.join(self.tmpdir.name, "pwned")
+            class Exploit:
+                def __reduce__(self):
+                    return (os.mkdir, (target,))
+            with socket.create_connection(address) as sock:
+                sock.recv(32)
+                sock.sendall(_pack(Exploit()).ljust(64, b"\0"))
+                sock.settimeout(5)
+                while sock.recv(1 << 16):
+                    pass
+            self.assertFalse(os.path.exists(target))
+
+            with SketchClient(address, authkey=KEY) as client:
+                self.assertEqual(client.names(), ["fruit"])
+
+        with SketchServer({"fruit": MisraGries()}) as server:
+            server.start_background(path)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            with SketchClient(path) as client:
+                self.assertEqual(client.names(), ["fruit"])
+
+    def test_failed_flush_keeps_the_batch(self):
+        server = SketchServer({"clicks": CountMin(width=100, delta=0.1)})
+        path = os.path.join(self.tmpdir.name, "sketch.sock")
+        client = SketchClient(path, timeout=5)
+        client.insert_many("clicks", [1, 2, 3])
+        # No server yet: the batch stays buffered
+        with self.assertRaises(OSError):
+            client.flush()
+        client.insert("clicks", 4, 5)
+        with server:
+            server.start_background(path)
+            client.flush()
+            self.assertEqual([client.query("clicks", "estimate_count", i) for i in range(1, 5)], [1, 1, 1, 5])
+            client.close()
+
+    def test_failed_snapshots_are_logged(self):
+        server = SketchServer({"fruit": MisraGries()}, snapshot_dir=self.tmpdir.name, snapshot_interval=0.01,
+                              authkey=KEY)
+        # A sketch that cannot be pickled makes every snapshot fail
+        server["fruit"].unpicklable = lambda: None
+        with self.assertLogs("sketchlib.server", level="ERROR"):
+            with server:
+                server.start_background(("127.0.0.1", 0))
+                time.sleep(0.1)
+                server["fruit"].unpicklable = None
+
+if __name__ == '__main__':
+    unittest.main()
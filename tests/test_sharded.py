@@ -0,0 +1,75 @@
+import unittest
+import threading
+import time
+from unittest import mock
+import numpy as np
+from sketchlib.sharded import ShardedSketch
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.heavy_hitters import MisraGries
+
+def run_threads(target, n=4):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+class TestShardedSketch(unittest.TestCase):
+
+    def test_per_thread_and_striped_replicas(self):
+        for stripes, replicas in [(None, 4), (2, 2)]:
+            sharded = ShardedSketch(CountMin(width=500, delta=0.01), stripes=stripes)
+            expected = CountMin.from_existing(sharded.sketch)
+
+            def work(i):
+                for j in range(500):
+                    sharded.insert("k%d" % (j % 20), 1)
+                sharded.insert_many(np.arange(100) + 100 * i)
+
+            run_threads(work)
+            for i in range(4):
+                for j in range(500):
+                    expected.insert("k%d" % (j % 20), 1)
+                expected.insert_many(np.arange(100) + 100 * i)
+            self.assertEqual(len(sharded._shards), replicas)
+            self.assertEqual(sharded.estimate_count("k3"), expected.estimate_count("k3"))
+            self.assertTrue(np.array_equal(sharded.sketch.get_table(), expected.get_table()))
+            # Replicas of threads that exited are dropped once merged
+            self.assertEqual(len(sharded._shards), 0 if stripes is None else replicas)
+
+    def test_unchanged_shards_are_not_merged(self):
+        sharded = ShardedSketch(F2Estimate(epsilon=0.5, delta=0.25))
+        sharded.insert("apple", 3)
+        estimate = sharded.estimator()
+        version = sharded.version()
+        with mock.patch.object(sharded._base, "merge", wraps=sharded._base.merge) as merge:
+            self.assertEqual(sharded.estimator(), estimate)
+            self.assertEqual(sharded.version(), version)
+            self.assertEqual(merge.call_count, 0)
+            sharded.insert("kiwi", 1)
+            sharded.estimator()
+            self.assertEqual(merge.call_count, 1)
+
+    def test_misra_gries(self):
+        sharded = ShardedSketch(MisraGries(phi=0.1, epsilon=0.1))
+
+        def work(i):
+            for j in range(3000):
+                sharded.insert("hot" if j % 3 == 0 else "cold%d" % j)
+
+        run_threads(work)
+        self.assertEqual(list(sharded.get_heavy_hitters()), ["hot"])
+
+    def test_background_merges(self):
+        base = CountMin(width=100, delta=0.1)
+        with ShardedSketch(base, merge_interval=0.01) as sharded:
+            run_threads(lambda i: sharded.insert("apple", 1), n=3)
+            deadline = time.time() + 5
+            while base.get_table().sum() < 3 * base._depth and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(base.estimate_count("apple"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+import numpy as np
+from sketchlib.count_min import CountMin
+from sketchlib.f2_estimate import F2Estimate
+
+class TestSparseTables(unittest.TestCase):
+
+    def test_count_min_becomes_dense(self):
+        sparse, dense = CountMin(width=10000, delta=0.01), CountMin(width=10000, delta=0.01, sparse=False)
+        for sketch in (sparse, dense):
+            for i in range(50):
+                sketch.insert("token%d" % i, i + 1)
+            sketch.insert_many(np.arange(100), np.arange(100) % 7)
+        self.assertTrue(sparse.is_sparse())
+        self.assertLess(sparse.nbytes(), dense.get_table().nbytes / 2)
+        self.assertTrue(np.array_equal(sparse.get_table(), dense.get_table()))
+        self.assertEqual([sparse.estimate_count(i) for i in range(100)], [dense.estimate_count(i) for i in range(100)])
+
+        # Merges work in all directions, and the table becomes dense past 1/16 of its cells
+        copy = CountMin.from_existing(sparse)
+        copy.merge(sparse)
+        dense.merge(sparse)
+        sparse.merge(dense)
+        self.assertTrue(copy.is_sparse())
+        self.assertFalse(sparse.is_sparse())
+        self.assertTrue(np.array_equal(sparse.get_table(), 3 * copy.get_table()))
+        copy.insert_many(np.arange(1000, 5000))
+        self.assertFalse(copy.is_sparse())
+
+    def test_f2_estimate_becomes_dense(self):
+        sparse = F2Estimate(epsilon=0.2, delta=0.1)
+        dense = F2Estimate.from_existing(sparse)
+        dense._densify()
+        tokens = ["token%d" % (i % 30) for i in range(500)]
+        for sketch in (sparse, dense):
+            sketch.insert_many(tokens)
+            sketch.insert("apple", 5)
+        self.assertTrue(sparse.is_sparse())
+        self.assertIsNone(sparse._seeds)
+        # The sparse sketch knows the weight of each key, so its estimates are exact
+        weights = Counter(tokens)
+        weights["apple"] += 5
+        self.assertEqual(sparse.estimator(), sum(w * w for w in weights.values()))
+        self.assertAlmostEqual(sparse.estimator(), dense.estimator(), delta=0.5 * dense.estimator())
+        self.assertEqual(sparse.inner_product(sparse), sparse.estimator())
+
+        merged = F2Estimate.from_existing(sparse)
+        merged.merge(sparse)
+        merged.merge(dense)
+        dense.merge(sparse)
+        self.assertTrue(np.array_equal(merged.get_table(), dense.get_table()))
+        sparse.insert_many(np.arange(sparse._sparse_limit))
+        self.assertFalse(sparse.is_sparse())
+
+    def test_sparse_checkpoints(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cm.log")
+            cm = CountMin(width=10**5, delta=0.01)
+            cm.insert_many(np.arange(100))
+            self.assertLess(cm.checkpoint(path), 20000)
+            cm.insert_many(np.arange(10**5))
+            self.assertFalse(cm.is_sparse())
+            cm.checkpoint(path)
+            cm.insert("apple", 3)
+            cm.checkpoint(path)
+            self.assertTrue(np.array_equal(CountMin.restore(path).get_table(), cm.get_table()))
+
+if __name__ == '__main__':
+    unittest.main()
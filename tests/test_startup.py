@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+import numpy as np
+import sketchlib
+from sketchlib.bloom_filter import BloomFilter
+from sketchlib.quantile_sketch import QuantileSketch
+from sketchlib.startup import main
+
+class TestStartup(unittest.TestCase):
+
+    def test_lazy_import(self):
+        code = "import sys, sketchlib; print('numpy' in sys.modules); sketchlib.CountMin; print('numpy' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.split(), ["False", "True"])
+
+        from sketchlib.count_min import CountMin
+        self.assertIs(sketchlib.CountMin, CountMin)
+        self.assertIn("QuantileSketch", dir(sketchlib))
+        with self.assertRaises(AttributeError):
+            sketchlib.NoSuchSketch
+
+    def test_deferred_allocation(self):
+        bf = BloomFilter(n=1000, delta=0.01)
+        self.assertIsNone(bf._B)
+        self.assertFalse(bf.membership("apple"))
+        self.assertFalse(bf.contains_many(["apple", "kiwi"]).any())
+        self.assertTrue(np.array_equal(bf.get_filter(), np.zeros(bf._m)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "bf.log")
+            bf.checkpoint(path)
+            bf.insert("apple")
+            bf.checkpoint(path)
+            self.assertTrue(BloomFilter.restore(path).membership("apple"))
+        empty = BloomFilter(n=1000, delta=0.01)
+        bf.merge(empty)
+        empty.merge(bf)
+        self.assertTrue(np.array_equal(empty.get_filter(), bf.get_filter()))
+
+        qs = QuantileSketch(n=1000)
+        self.assertIsNone(qs._cm_sketch)
+        merged = QuantileSketch.from_existing(qs)
+        merged.merge(qs)
+        self.assertIsNone(merged._cm_sketch)
+        qs.insert_many(range(1, 101))
+        merged.merge(qs)
+        self.assertEqual(merged.query(0.5), qs.query(0.5))
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        self.assertEqual(main(["BloomFilter", "QuantileSketch", "--count", "10"], stdout=out), 0)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("import sketchlib:"))
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(main(["NoSuchSketch"], stdout=out), 2)
+
+if __name__ == '__main__':
+    unittest.main()
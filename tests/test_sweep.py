@@ -0,0 +1,52 @@
+import io
+import os
+import tempfile
+import unittest
+from sketchlib.sweep import sweep, pareto_frontier, cheapest, zipf_stream, replay_stream, main
+from sketchlib.count_min import CountMin
+from sketchlib.distinct_count import LogDistinctCount
+
+class TestSweep(unittest.TestCase):
+
+    def test_sweep_records(self):
+        stream = zipf_stream(5000, seed=1)
+        records = sweep(CountMin, {"width": [50, 500, 5000], "delta": [0.1]}, stream)
+        self.assertEqual([r["params"]["width"] for r in records], [50, 500, 5000])
+        self.assertGreater(records[0]["error"], records[2]["error"])
+        self.assertLess(records[0]["nbytes"], records[2]["nbytes"])
+        self.assertTrue(all(r["throughput"] > 0 for r in records))
+
+        # Synthetic streams are reproducible
+        self.assertTrue((zipf_stream(5000, seed=1) == stream).all())
+
+    def test_frontier(self):
+        records = [
+            {"sketch": "A", "params": {"x": 1}, "error": 0.1, "nbytes": 100, "throughput": 10},
+            {"sketch": "A", "params": {"x": 2}, "error": 0.01, "nbytes": 1000, "throughput": 10},
+            {"sketch": "A", "params": {"x": 3}, "error": 0.02, "nbytes": 2000, "throughput": 5},
+            {"sketch": "A", "params": {"x": 4}, "error": 0.001, "nbytes": 5000, "throughput": 10},
+        ]
+        frontier = pareto_frontier(records)
+        self.assertEqual([r["params"]["x"] for r in frontier], [1, 2, 4])
+        self.assertEqual(cheapest(frontier, 0.05)["params"]["x"], 2)
+        self.assertIsNone(cheapest(frontier, 0.0001))
+
+    def test_replayed_stream(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "access.log")
+            with open(path, "w") as f:
+                for i in range(3000):
+                    f.write("user%d GET /page/%d\n" % (i % 700, i % 50))
+            self.assertEqual(len(set(replay_stream(path, field=0))), 700)
+
+            records = sweep(LogDistinctCount, {"epsilon": [0.1], "delta": [0.1]}, replay_stream(path, field=0))
+            self.assertLess(records[0]["error"], 0.1)
+
+            out = io.StringIO()
+            self.assertEqual(main(["LogDistinctCount", "--stream", path, "--field", "0",
+                                   "--max-error", "0.2"], stdout=out), 0)
+            self.assertIn("| LogDistinctCount | epsilon=0.3, delta=0.25 |", out.getvalue())
+            self.assertIn("Cheapest configuration", out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import statistics
+from unittest import mock
+from sketchlib.f2_estimate import F2Estimate
+from sketchlib.distinct_count import LogDistinctCount
+from sketchlib.heavy_hitters import MisraGries, CountMinCashRegister
+from sketchlib.quantile_sketch import QuantileSketch
+from sketchlib.count_min import CountMin
+from sketchlib.bloom_filter import BloomFilter, BlockedBloomFilter
+from sketchlib.cuckoo_filter import CuckooFilter
+from sketchlib.minhash import MinHash
+
+class TestVersioning(unittest.TestCase):
+
+    def test_writes_bump_the_version(self):
+        sketches = [CountMin(width=100, delta=0.1), F2Estimate(epsilon=0.5, delta=0.25),
+                    LogDistinctCount(epsilon=0.3, delta=0.25), MisraGries(), CountMinCashRegister(),
+                    QuantileSketch(n=1000), BloomFilter(n=100), BlockedBloomFilter(n=100),
+                    CuckooFilter(n=100), MinHash(epsilon=0.3)]
+        for sketch in sketches:
+            version = sketch.version()
+            try:
+                sketch.insert(7, 1)
+            except TypeError:
+                sketch.insert(7)
+            self.assertGreater(sketch.version(), version, type(sketch).__name__)
+
+            version = sketch.version()
+            sketch.merge(type(sketch).from_existing(sketch))
+            self.assertGreater(sketch.version(), version, type(sketch).__name__)
+
+    def test_queries_are_cached_per_version(self):
+        mg = MisraGries(phi=0.1, epsilon=0.2)
+        for i in range(1000):
+            mg.insert(i % 5, 1)
+        with mock.patch.object(mg, "_counters", wraps=mg._counters) as counters:
+            first = mg.get_heavy_hitters()
+            mg.get_heavy_hitters()
+            self.assertEqual(counters.items.call_count, 1)
+
+        # Results are copies, and an insert invalidates them
+        first[0] = -1
+        self.assertEqual(mg.get_heavy_hitters()[0], 200)
+        mg.insert(0, 10)
+        self.assertEqual(mg.get_heavy_hitters()[0], 210)
+
+        qs = QuantileSketch(epsilon=0.1, n=1000)
+        qs.insert_many(range(1, 1001))
+        median = qs.query(0.5)
+        self.assertEqual(qs.query(0.5), median)
+        qs.insert_many([1] * 5000)
+        self.assertLess(qs.query(0.5), median)
+
+    def test_vectorized_estimators(self):
+        f2 = F2Estimate(epsilon=0.2, delta=0.1)
+        ldc = LogDistinctCount(epsilon=0.2, delta=0.1)
+        for i in range(5000):
+            f2.insert(i % 300, 1)
+            ldc.insert(i)
+
+        avg = [statistics.mean(int(x) ** 2 for x in row) for row in f2.get_table()]
+        self.assertAlmostEqual(f2.estimator(), statistics.median(avg))
+        est = [int(ldc._width / row[-1]) for row in ldc._table]
+        self.assertEqual(ldc.estimator(), int(statistics.median(est)))
+
+if __name__ == '__main__':
+    unittest.main()